@@ -7,6 +7,7 @@ app.py - Punto de entrada para la API "Adivina la Canción"
     Última edición: 2025-12-11
     URL del repositorio: https://github.com/juanmariabravo/adivina_la_cancion
 """
+import click
 from flask import Flask, jsonify
 from flask_cors import CORS
 import os
@@ -16,6 +17,14 @@ from dotenv import load_dotenv
 from controllers.user_controller import user_bp
 from controllers.game_controller import game_bp
 from controllers.spotify_controller import spotify_bp
+from database.database import db
+from services.hydration_service import hydration_service, genre_cache
+from services.token_refresh_service import token_refresh_service, SPOTIFY_TOKEN_REFRESH_ENABLED
+from helpers.http_client import http_client
+from helpers.spotify_preview import preview_resolver
+from helpers.password_hasher import password_hasher
+from helpers.response_cache import level_response_cache
+from helpers.compression import compress_response, compression_stats
 
 # Cargar variables de entorno
 load_dotenv()
@@ -27,7 +36,7 @@ CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
         "expose_headers": ["Content-Type", "Authorization"],
         "supports_credentials": True
     }
@@ -37,16 +46,55 @@ CORS(app, resources={
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
 DEBUG_MODE = os.getenv("DEBUG", "False").lower() == "true"
 PORT = int(os.getenv("PORT", 5000))
+HYDRATE_ON_STARTUP = os.getenv("HYDRATE_ON_STARTUP", "False").lower() == "true"
 
 # Registrar Blueprints
 app.register_blueprint(user_bp)
 app.register_blueprint(game_bp)
 app.register_blueprint(spotify_bp)
 
+# Comprimir las respuestas según Accept-Encoding (COMPRESSION_ENABLED=False para desactivarlo)
+app.after_request(compress_response)
+
 # Ruta de health check
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "Adivina la Canción API"}), 200
+    return jsonify({
+        "status": "healthy",
+        "service": "Adivina la Canción API",
+        "db_pool": db.get_pool_stats(),
+        "principal_cache": db.get_principal_cache_stats(),
+        "write_behind": db.get_write_behind_stats(),
+        "hydration": hydration_service.get_stats(),
+        "token_refresh": token_refresh_service.get_stats(),
+        "genre_cache": genre_cache.get_stats(),
+        "level_responses": level_response_cache.get_stats(),
+        "compression": compression_stats.get_stats(),
+        "http": http_client.get_stats(),
+        "previews": preview_resolver.get_stats(),
+        "password_hashing": password_hasher.get_stats()
+    }), 200
+
+# Comando CLI: flask --app app hydrate-songs [--workers N]
+@app.cli.command('hydrate-songs')
+@click.option('--workers', default=4, show_default=True, help='Hilos en paralelo')
+def hydrate_songs(workers):
+    """Rellenar los datos de todas las canciones de Spotify pendientes"""
+    result = hydration_service.hydrate_all(max_workers=workers)
+    if result.get('error'):
+        click.echo(result['error'], err=True)
+    if 'hydrated' not in result:
+        # Otra hidratación en curso (p.ej. la de HYDRATE_ON_STARTUP): no hay contadores
+        raise SystemExit(1)
+    click.echo(f"Hidratadas {result['hydrated']} de {result['total']} canciones ({result['failed']} con error)")
+
+# Hidratar canciones en segundo plano al arrancar (opcional)
+if HYDRATE_ON_STARTUP:
+    hydration_service.start_background()
+
+# Renovar tokens de Spotify antes de que expiren (opcional; con varios workers, activarlo solo en uno)
+if SPOTIFY_TOKEN_REFRESH_ENABLED:
+    token_refresh_service.start_background()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PORT, debug=DEBUG_MODE)
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+asgi.py - Modo de servidor asíncrono (ASGI) para la API "Adivina la Canción"
+
+Todas las rutas siguen siendo las de Flask (app.py), ejecutadas en un pool
+de hilos acotado. Lo único asíncrono es la hidratación de niveles de
+Spotify: al pedir un nivel sin hidratar (GET /api/v1/songs/<level_id>) que
+no esté en la caché de respuestas, la consulta a SQLite se hace en un
+executor propio y la llamada a Spotify se espera de forma asíncrona
+(agrupada por canción), sin ocupar un hilo de Flask mientras Spotify
+responde lento. Después la respuesta la genera Flask como siempre.
+
+Uso (dependencias opcionales: pip install -r requirements-asgi.txt):
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError as e:
+    raise ImportError("El modo ASGI necesita asgiref: pip install -r requirements-asgi.txt") from e
+
+from app import app
+from controllers.game_controller import game_service
+from services.hydration_service import hydration_service, HYDRATION_WAIT_TIMEOUT
+
+# Hilos que ejecutan la app Flask (equivalen a los hilos del servidor WSGI)
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 16))
+# Hilos dedicados a SQLite para el trabajo previo de las rutas asíncronas
+ASGI_DB_THREADS = int(os.getenv("ASGI_DB_THREADS", 4))
+# Hilos para llamadas salientes a Spotify (una por canción gracias al single-flight)
+ASGI_IO_THREADS = int(os.getenv("ASGI_IO_THREADS", 32))
+
+SONG_ROUTE = re.compile(r'^/api/v1/songs/([^/]+)$')
+
+# Cuerpo síncrono de WsgiToAsgiInstance.run_wsgi_app (sin su sync_to_async)
+_run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    executor = None
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi de asgiref con la app WSGI en un pool de hilos acotado. El adaptador
+    por defecto usa sync_to_async con thread_sensitive=True: un único hilo compartido
+    por todas las peticiones.
+    """
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = _PooledWsgiInstance(self.wsgi_application)
+        instance.executor = self.executor
+        await instance(scope, receive, send)
+
+
+class AsyncApi:
+    """Aplicación ASGI: Flask en un pool de hilos, con la hidratación de /songs/<level_id> asíncrona"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_executor = ThreadPoolExecutor(ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+        self.db_executor = ThreadPoolExecutor(ASGI_DB_THREADS, thread_name_prefix='asgi-db')
+        self.io_executor = ThreadPoolExecutor(ASGI_IO_THREADS, thread_name_prefix='asgi-io')
+        self.wsgi = PooledWsgiToAsgi(wsgi_app, self.wsgi_executor)
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        match = SONG_ROUTE.match(scope['path'])
+        # Un nivel ya en la caché de respuestas está hidratado: Flask lo sirve sin tocar la BD
+        if match and scope['method'] == 'GET' and not game_service.is_level_cached(match.group(1)):
+            failure = await self._hydrate_level(scope, match.group(1))
+            if failure:
+                await self._send_json(scope, send, *failure)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _hydrate_level(self, scope: dict, level_id: str):
+        """Hidratar el nivel sin bloquear hilos de petición; devuelve (payload, status) si falla"""
+        loop = asyncio.get_running_loop()
+        auth_header = self._header(scope, b'authorization')
+        pending = await loop.run_in_executor(
+            self.db_executor, game_service.get_pending_hydration, level_id, auth_header
+        )
+        if not pending:
+            return None
+        song, spotify_token = pending
+        future = hydration_service.submit_hydration(song, spotify_token, self.io_executor)
+        try:
+            hydrated = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), HYDRATION_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return {"error": "Tiempo de espera agotado obteniendo la canción"}, 504
+        except Exception as e:
+            print(f"Error hidratando canción {song.id}: {e}")
+            hydrated = None
+        if not hydrated:
+            return {"error": "Nivel no disponible"}, 404
+        return None
+
+    def _header(self, scope: dict, name: bytes):
+        for key, value in scope.get('headers', []):
+            if key.lower() == name:
+                return value.decode('latin-1')
+        return None
+
+    async def _send_json(self, scope: dict, send, payload: dict, status: int) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+        ]
+        # Mismas cabeceras CORS que configura flask_cors en app.py
+        origin = self._header(scope, b'origin')
+        if origin:
+            headers += [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'access-control-expose-headers', b'Content-Type, Authorization'),
+                (b'vary', b'Origin'),
+            ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in (self.wsgi_executor, self.db_executor, self.io_executor):
+                    executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncApi(app)
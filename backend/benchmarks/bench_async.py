@@ -0,0 +1,145 @@
+"""
+Benchmark: modo síncrono (Flask con N hilos) frente a modo asíncrono (asgi.py)
+cuando Spotify responde lento.
+
+Escenario: llega a la vez una ráfaga de peticiones a niveles sin hidratar
+(cada hidratación tarda SPOTIFY_LATENCY segundos) seguida de peticiones
+rápidas al ranking. Se mide el tiempo total y cuánto tardan en completarse
+las peticiones rápidas desde que llega la ráfaga.
+
+Uso (desde backend/):
+    python3 benchmarks/bench_async.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = 8
+SPOTIFY_LATENCY = 0.5
+FAST_REQUESTS = 200
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench_async.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-with-at-least-32-chars')
+os.environ['ASGI_WSGI_THREADS'] = str(WORKERS)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app
+from asgi import application
+from database.database import db
+from models.song import Song
+from services.hydration_service import spotify_helper
+
+
+def fake_track_info(spotify_track_id: str, access_token: str) -> Song:
+    """Simula una llamada lenta a Spotify"""
+    time.sleep(SPOTIFY_LATENCY)
+    return Song(
+        id=spotify_track_id, title=f"Song {spotify_track_id}", artists='Artist', album='Album',
+        year=2000, genre='pop', audio='https://p.scdn.co/mp3-preview/x', image_url='https://i.scdn.co/x',
+        level_id=-999
+    )
+
+
+def setup() -> dict:
+    spotify_helper.get_track_info = fake_track_info
+    db.create_user('bench', 'bench@example.com', 'benchpass', 'bench-client-id', 'bench-client-secret')
+    db.save_spotify_tokens('bench', 'spotify-token', 'refresh-token', 3600)
+    token = db.create_token(db.get_user_by_username('bench'))
+    return {'Authorization': f'Bearer {token}'}
+
+
+def reset_levels() -> list[str]:
+    """Dejar todas las canciones sin hidratar y devolver sus niveles"""
+    conn = db.get_connection()
+    try:
+        conn.execute('UPDATE spotify_songs SET title = NULL, audio = NULL')
+        conn.commit()
+        rows = conn.execute('SELECT level_id FROM spotify_songs WHERE level_id > 0').fetchall()
+        return [str(row['level_id']) for row in rows]
+    finally:
+        conn.close()
+
+
+def build_requests(levels: list[str]) -> list[str]:
+    paths = [f'/api/v1/songs/{level}' for level in levels]
+    paths += ['/api/v1/ranking'] * FAST_REQUESTS
+    # Primero llegan los niveles lentos
+    return paths
+
+
+def run_sync(paths: list[str], headers: dict) -> tuple[float, list[float]]:
+    fast_latencies = []
+    start = time.perf_counter()
+
+    def request(path):
+        status = app.test_client().get(path, headers=headers).status_code
+        if 'ranking' in path:
+            fast_latencies.append(time.perf_counter() - start)
+        return status
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        statuses = list(executor.map(request, paths))
+    assert all(status == 200 for status in statuses), set(statuses)
+    return time.perf_counter() - start, fast_latencies
+
+
+async def asgi_get(path: str, headers: dict) -> int:
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'query_string': b'',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80), 'client': ('127.0.0.1', 0),
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    return sent[0]['status']
+
+
+def run_async(paths: list[str], headers: dict) -> tuple[float, list[float]]:
+    fast_latencies = []
+    start = 0.0
+
+    async def request(path):
+        status = await asgi_get(path, headers)
+        if 'ranking' in path:
+            fast_latencies.append(time.perf_counter() - start)
+        return status
+
+    async def main():
+        nonlocal start
+        start = time.perf_counter()
+        return await asyncio.gather(*(request(path) for path in paths))
+
+    statuses = asyncio.run(main())
+    assert all(status == 200 for status in statuses), set(statuses)
+    return time.perf_counter() - start, fast_latencies
+
+
+def report(name: str, total: float, latencies: list[float], count: int) -> None:
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:<8} total {total:6.2f}s  {count / total:7.1f} req/s  ranking p50 {p50:7.1f} ms  p95 {p95:7.1f} ms")
+
+
+if __name__ == '__main__':
+    headers = setup()
+    print(f"{WORKERS} hilos de petición, latencia simulada de Spotify {SPOTIFY_LATENCY}s")
+
+    paths = build_requests(reset_levels())
+    total, latencies = run_sync(paths, headers)
+    report('síncrono', total, latencies, len(paths))
+
+    paths = build_requests(reset_levels())
+    total, latencies = run_async(paths, headers)
+    report('ASGI', total, latencies, len(paths))
@@ -0,0 +1,51 @@
+"""
+Benchmark: logins por segundo (bcrypt.checkpw) con los hashes calculados en
+el hilo de la petición frente al pool de procesos de helpers.password_hasher,
+variando el número de procesos hasta el número de núcleos.
+
+Uso (desde backend/):
+    python3 benchmarks/bench_hashing.py
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from helpers.password_hasher import PasswordHasher
+
+ROUNDS = 10
+REQUEST_THREADS = 16
+LOGINS = 64
+
+
+def run(hasher: PasswordHasher, hashed: str) -> float:
+    # Calentar el pool para no medir el arranque de los procesos
+    hasher.check_password('secret', hashed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(REQUEST_THREADS) as executor:
+        results = list(executor.map(lambda _: hasher.check_password('secret', hashed), range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    hasher.shutdown()
+    return LOGINS / elapsed
+
+
+if __name__ == '__main__':
+    cores = os.cpu_count() or 1
+    hashed = PasswordHasher(rounds=ROUNDS, workers=0).hash_password('secret')
+    print(f"{cores} núcleos, coste {ROUNDS}, {REQUEST_THREADS} hilos de petición, {LOGINS} logins")
+
+    print(f"{'en el hilo':<14} {run(PasswordHasher(rounds=ROUNDS, workers=0), hashed):7.1f} logins/s")
+    workers = 1
+    while True:
+        rate = run(PasswordHasher(rounds=ROUNDS, workers=workers), hashed)
+        print(f"{f'pool x{workers}':<14} {rate:7.1f} logins/s")
+        if workers >= cores:
+            break
+        workers = min(workers * 2, cores)
+
+    calibrator = PasswordHasher(workers=0)
+    for target_ms in (50, 100, 250):
+        print(f"coste calibrado para {target_ms} ms: {calibrator.calibrate(target_ms)} rounds")
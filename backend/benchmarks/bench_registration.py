@@ -0,0 +1,61 @@
+"""
+Benchmark: registro de usuarios uno a uno (create_user, un INSERT por usuario)
+frente al registro masivo (create_users_bulk, executemany en una transacción)
+con 100k usuarios. Las contraseñas van prehasheadas en el registro masivo y
+con coste mínimo de bcrypt en el individual para medir solo la base de datos.
+
+Uso (desde backend/):
+    python3 benchmarks/bench_registration.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+BULK_USERS = 100_000
+SINGLE_USERS = 5_000
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench_registration.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-with-at-least-32-chars')
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['BCRYPT_MIN_ROUNDS'] = '4'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database.database import db
+from helpers.password_hasher import password_hasher
+
+
+def user_data(prefix: str, i: int) -> dict:
+    return {
+        'username': f'{prefix}{i}',
+        'email': f'{prefix}{i}@example.com',
+        'spotify_client_id': f'{prefix}-client-{i}',
+        'spotify_client_secret': f'{prefix}-secret-{i}',
+    }
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    for i in range(SINGLE_USERS):
+        data = user_data('single', i)
+        success, message = db.create_user(
+            data['username'], data['email'], 'password', data['spotify_client_id'], data['spotify_client_secret']
+        )
+        assert success, message
+    single = time.perf_counter() - start
+    print(f"create_user       {SINGLE_USERS:>7} usuarios  {single:6.2f}s  {SINGLE_USERS / single:9.0f} usuarios/s")
+
+    hashed = password_hasher.hash_password('password')
+    users = (dict(user_data('bulk', i), hashed_password=hashed) for i in range(BULK_USERS))
+    start = time.perf_counter()
+    created, skipped = db.create_users_bulk(users, prehashed=True)
+    bulk = time.perf_counter() - start
+    assert created == BULK_USERS and skipped == 0, (created, skipped)
+    print(f"create_users_bulk {BULK_USERS:>7} usuarios  {bulk:6.2f}s  {BULK_USERS / bulk:9.0f} usuarios/s")
+
+    # Repetir la carga: todos duplicados, se omiten sin error
+    users = (dict(user_data('bulk', i), hashed_password=hashed) for i in range(BULK_USERS))
+    created, skipped = db.create_users_bulk(users, prehashed=True)
+    print(f"repetición: {created} creados, {skipped} omitidos por duplicados")
+    print(f"ranking tras la carga: {len(db.get_ranking(-1))} usuarios")
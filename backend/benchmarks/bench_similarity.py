@@ -0,0 +1,86 @@
+"""
+Micro-benchmark de helpers.similarity.is_similar frente a
+SequenceMatcher(None, a, b).ratio() >= 0.85. La equivalencia de las
+decisiones la comprueba tests/test_similarity.py.
+
+Uso (desde backend/):
+    python3 benchmarks/bench_similarity.py
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from helpers.answer_normalizer import normalize_title
+from helpers.similarity import is_similar, SIMILARITY_THRESHOLD
+
+
+def load_titles() -> list[str]:
+    json_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        '..', 'songs_local_data&spotify_ids', 'spotify_songs.json'
+    )
+    with open(json_path, 'r', encoding='utf-8') as f:
+        levels = json.load(f).get('levels', [])
+    return [normalize_title(level['song']) for level in levels if level.get('song')]
+
+
+def perturb(title: str, rng: random.Random, edits: int) -> str:
+    chars = list(title)
+    alphabet = string.ascii_lowercase + ' '
+    for _ in range(edits):
+        op = rng.choice('ids')
+        pos = rng.randrange(len(chars) + 1)
+        if op == 'i' or not chars:
+            chars.insert(pos, rng.choice(alphabet))
+        elif op == 'd':
+            del chars[min(pos, len(chars) - 1)]
+        else:
+            chars[min(pos, len(chars) - 1)] = rng.choice(alphabet)
+    return ''.join(chars)
+
+
+def build_corpus(titles: list[str], rng: random.Random) -> list[tuple[str, str]]:
+    corpus = []
+    for title in titles:
+        for edits in range(0, 6):
+            corpus.append((perturb(title, rng, edits), title))
+        corpus.append((rng.choice(titles), title))
+        corpus.append((title[: max(1, len(title) // 2)], title))
+        corpus.append((''.join(rng.choice(string.ascii_lowercase) for _ in range(len(title))), title))
+        corpus.append((''.join(rng.choice(string.ascii_lowercase) for _ in range(400)), title))
+        corpus.append(('', title))
+    return corpus
+
+
+def reference(answer: str, title: str) -> bool:
+    return SequenceMatcher(None, answer, title).ratio() >= SIMILARITY_THRESHOLD
+
+
+def bench(func, corpus, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for answer, title in corpus:
+            func(answer, title)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    rng = random.Random(1234)
+    titles = load_titles()
+    corpus = build_corpus(titles, rng)
+
+    accepted = sum(1 for a, t in corpus if reference(a, t))
+    print(f"Pares comparados: {len(corpus)} (aceptados: {accepted})")
+
+    rounds = 20
+    t_ref = bench(reference, corpus, rounds)
+    t_new = bench(is_similar, corpus, rounds)
+    print(f"SequenceMatcher: {t_ref * 1000:.1f} ms")
+    print(f"is_similar:      {t_new * 1000:.1f} ms")
+    print(f"Aceleración:     x{t_ref / t_new:.1f}")
@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, send_file
 from services.game_service import GameService
+from helpers.http_cache import conditional_response, PUBLIC_REVALIDATE, PRIVATE_REVALIDATE
+from helpers.response_cache import EncodedResponse
+from helpers.compression import encoded_response
 
 # Crear Blueprint para rutas de juego
 game_bp = Blueprint('game', __name__, url_prefix='/api/v1')
@@ -7,13 +10,19 @@ game_bp = Blueprint('game', __name__, url_prefix='/api/v1')
 # Instanciar servicio
 game_service = GameService()
 
+# Los audios del almacén no cambian nunca: se pueden cachear un año
+AUDIO_MAX_AGE = 365 * 24 * 3600
+# Los niveles locales no cambian: el navegador puede reutilizarlos una hora sin preguntar
+LOCAL_LEVEL_CACHE_CONTROL = 'public, max-age=3600'
+
 
 @game_bp.route('/game/submit-score', methods=['POST'])
 def update_score():
     """Actualizar puntuación del jugador"""
     payload, status = game_service.update_score(
         request.headers.get('Authorization'), 
-        request.get_json()
+        request.get_json(),
+        request.headers.get('Idempotency-Key')
     )
     return jsonify(payload), status
 
@@ -22,8 +31,13 @@ def update_score():
 def get_ranking():
     """Obtener ranking de jugadores"""
     limit = request.args.get('limit', 10, type=int)
-    payload, status = game_service.get_ranking(limit)
-    return jsonify(payload), status
+
+    def build():
+        payload, status = game_service.get_ranking(limit)
+        return make_response(jsonify(payload), status)
+
+    # La versión se lee antes que el ranking: como mucho el cuerpo es más nuevo que su ETag
+    return conditional_response(game_service.get_ranking_version(limit), PUBLIC_REVALIDATE, build)
 
 
 @game_bp.route('/game/daily/complete', methods=['POST'])
@@ -40,9 +54,30 @@ def get_level_song(level_id):
         level_id, 
         request.headers.get('Authorization')
     )
+    if isinstance(payload, EncodedResponse):
+        # Cuerpo ya codificado (posiblemente desde la caché de respuestas) con su ETag
+        if level_id.endswith('_local'):
+            cache_control = LOCAL_LEVEL_CACHE_CONTROL
+        else:
+            cache_control = PRIVATE_REVALIDATE
+        return conditional_response(payload.etag, cache_control, lambda: encoded_response(payload, status))
     return jsonify(payload), status
 
 
+@game_bp.route('/audio/<audio_hash>', methods=['GET'])
+def get_audio(audio_hash):
+    """Audio de una canción local (admite peticiones Range para reproducir por partes)"""
+    audio = game_service.get_audio_file(audio_hash)
+    if not audio:
+        return jsonify({"error": "Audio no encontrado"}), 404
+    path, mime = audio
+    # Direccionado por contenido: el mismo hash siempre es el mismo archivo
+    response = send_file(path, mimetype=mime, conditional=True, etag=audio_hash, max_age=AUDIO_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @game_bp.route('/game/validate', methods=['POST'])
 def validate_answer():
     """Validar respuesta del jugador"""
@@ -56,6 +91,13 @@ def validate_answer():
         return jsonify({"correct": False}), 200
 
 
+@game_bp.route('/game/validate/batch', methods=['POST'])
+def validate_answers():
+    """Validar varias respuestas del jugador en una sola petición"""
+    payload, status = game_service.validate_answers(request.get_json(silent=True))
+    return jsonify(payload), status
+
+
 @game_bp.route('/game/mark-level-played', methods=['POST'])
 def mark_level_played():
     """Marcar nivel como jugado"""
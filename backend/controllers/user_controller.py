@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from services.user_service import UserService
+from helpers.http_cache import conditional_response, PRIVATE_REVALIDATE
 
 # Crear Blueprint para rutas de usuarios
 user_bp = Blueprint('user', __name__, url_prefix='/api/v1/auth')
@@ -25,8 +26,11 @@ def login():
 @user_bp.route('/me', methods=['GET'])
 def get_current_user():
     """Obtener información del usuario actual"""
-    payload, status = user_service.get_current_user(request.headers.get('Authorization'))
-    return jsonify(payload), status
+    payload, status, etag = user_service.get_current_user(request.headers.get('Authorization'))
+    # La respuesta depende del token: no compartirla entre usuarios
+    return conditional_response(
+        etag, PRIVATE_REVALIDATE, lambda: make_response(jsonify(payload), status), vary='Authorization'
+    )
 
 
 @user_bp.route('/update-profile', methods=['PUT'])
@@ -0,0 +1,194 @@
+import sqlite3
+import threading
+import queue
+from typing import Callable, Optional
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión sqlite3 perteneciente al pool.
+    close() no cierra la conexión real: la devuelve al pool para reutilizarla.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', raw: sqlite3.Connection):
+        self._pool = pool
+        self._raw = raw
+        self._depth = 0  # número de usos anidados en el mismo hilo
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        return self._raw
+
+    def close(self) -> None:
+        """Devolver la conexión al pool"""
+        self._pool.release(self)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw.__exit__(exc_type, exc, tb)
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones SQLite.
+    - Cada conexión se configura una única vez con el perfil de PRAGMAs al crearse.
+    - Dentro de un mismo hilo la conexión es reentrante: las llamadas anidadas
+      (p.ej. create_user -> get_user_by_username) reutilizan la misma conexión
+      en lugar de pedir otra al pool, evitando bloqueos con pools pequeños.
+    """
+
+    def __init__(
+        self,
+        database_path: str,
+        max_size: int = 8,
+        timeout: float = 30.0,
+        cache_size_kb: int = 8192,
+        mmap_size: int = 67108864,
+        busy_timeout_ms: int = 5000,
+        on_connect: Optional[Callable[[sqlite3.Connection], None]] = None
+    ):
+        self.database_path = database_path
+        # Configuración extra de cada conexión nueva (p.ej. registrar funciones SQL)
+        self.on_connect = on_connect
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.pragmas = [
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'NORMAL'),
+            ('cache_size', -abs(cache_size_kb)),  # valor negativo = KiB
+            ('mmap_size', mmap_size),
+            ('busy_timeout', busy_timeout_ms),
+            ('temp_store', 'MEMORY'),
+        ]
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {
+            'acquired': 0,
+            'reused': 0,
+            'reentrant': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _create_connection(self) -> PooledConnection:
+        """Abrir una conexión nueva y aplicar el perfil de PRAGMAs"""
+        raw = sqlite3.connect(self.database_path, check_same_thread=False)
+        raw.row_factory = sqlite3.Row  # Para acceso por nombre de columna
+        for name, value in self.pragmas:
+            try:
+                raw.execute(f'PRAGMA {name} = {value}')
+            except sqlite3.DatabaseError as e:
+                print(f"No se pudo aplicar PRAGMA {name}: {e}")
+        if self.on_connect:
+            try:
+                self.on_connect(raw)
+            except Exception:
+                raw.close()
+                raise
+        return PooledConnection(self, raw)
+
+    def acquire(self) -> PooledConnection:
+        """Obtener una conexión del pool (o la que ya usa este hilo)"""
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            current._depth += 1
+            with self._lock:
+                self._stats['reentrant'] += 1
+            return current
+
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            reused = False
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                    reused = True
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f"Pool de conexiones agotado tras {self.timeout}s"
+                    )
+
+        conn._depth = 1
+        self._local.conn = conn
+        with self._lock:
+            self._stats['acquired'] += 1
+            if reused:
+                self._stats['reused'] += 1
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        """Devolver una conexión al pool cuando termina su último uso en el hilo"""
+        conn._depth -= 1
+        if conn._depth > 0:
+            return
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+        try:
+            # No dejar transacciones abiertas para el siguiente usuario
+            if conn.raw.in_transaction:
+                conn.raw.rollback()
+        except sqlite3.Error as e:
+            print(f"Descartando conexión defectuosa del pool: {e}")
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: PooledConnection) -> None:
+        try:
+            conn.raw.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self) -> None:
+        """Cerrar todas las conexiones inactivas del pool"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def get_stats(self) -> dict:
+        """Estadísticas del pool"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['created'] = self._created
+        idle = self._idle.qsize()
+        stats['idle'] = idle
+        stats['in_use'] = stats['created'] - idle
+        stats['max_size'] = self.max_size
+        return stats
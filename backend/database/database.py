@@ -1,15 +1,22 @@
 import sqlite3
-import bcrypt
 import jwt
 import os
 import time
 import json
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Iterable, Optional
 from dotenv import load_dotenv
 
 from models.user import User
 from models.song import Song
+from models.level_progress import LevelProgress
+from database.connection_pool import ConnectionPool
+from database.principal_cache import PrincipalCache
+from database.leaderboard import Leaderboard
+from database.write_behind import WriteBehindQueue, PendingProgress
+from helpers.password_hasher import password_hasher
+from helpers.response_cache import level_response_cache, spotify_level_key
+from helpers.audio_store import audio_store, public_audio_url
 
 # Cargar variables de entorno
 load_dotenv()
@@ -17,16 +24,133 @@ load_dotenv()
 # Configuración
 SECRET_KEY = os.getenv("SECRET_KEY")
 DATABASE_PATH = os.getenv("DATABASE_PATH")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 8192))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 67108864))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+# Usuarios por executemany en create_users_bulk
+BULK_INSERT_CHUNK = int(os.getenv("BULK_INSERT_CHUNK", 5000))
+# Segundos que se recuerda una clave de idempotencia de submit_score
+SCORE_IDEMPOTENCY_TTL = int(os.getenv("SCORE_IDEMPOTENCY_TTL", 86400))
+# Escritura diferida (write-behind) del progreso: opcional
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "False").lower() == "true"
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", 50))
+WRITE_BEHIND_MAX_OPS = int(os.getenv("WRITE_BEHIND_MAX_OPS", 500))
+# Cada cuántos segundos como mucho se comprueba si otro proceso cambió el ranking
+LEADERBOARD_SYNC_INTERVAL = float(os.getenv("LEADERBOARD_SYNC_INTERVAL", 1.0))
+
+# Resultados de submit_score
+SCORE_ACCEPTED = 'accepted'
+SCORE_REPLAYED = 'replayed'
+SCORE_ALREADY_PLAYED = 'already_played'
+SCORE_KEY_CONFLICT = 'key_conflict'
+SCORE_USER_NOT_FOUND = 'user_not_found'
+
+# Datos de las canciones locales (también para recrear su audio si falta en el almacén)
+LOCAL_SONGS_JSON_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'songs_local_data&spotify_ids', 'local_songs.json'
+))
+
+# level_id de las candidatas a canción del día (possible_daily_songs.json) que no son la de hoy;
+# se guardan en spotify_songs para hidratarlas de antemano como el resto de niveles
+DAILY_POOL_LEVEL = -1
+
+# Proyecciones de la tabla users: columnas que se leen según para qué se quiera el usuario.
+# El resto de campos se cargan de forma diferida (una consulta) si se llegan a usar.
+_PROGRESS_COLUMNS = (
+    'total_score', 'levels_completed_bits', 'played_levels_bits',
+    'levels_completed', 'played_levels', 'last_daily_completed'
+)
+_SPOTIFY_COLUMNS = (
+    'spotify_access_token', 'spotify_refresh_token', 'spotify_token_expires_at',
+    'spotify_client_id', 'spotify_client_secret'
+)
+USER_PROJECTIONS = {
+    # JWT y comprobaciones de existencia
+    'identity': ('username', 'email'),
+    # Peticiones autenticadas de juego y perfil público (to_public_dict)
+    'progress': ('username', 'email', 'row_version', *_PROGRESS_COLUMNS),
+    # Login: hash de la contraseña más lo necesario para responder
+    'credentials': ('username', 'email', 'row_version', 'hashed_password', *_PROGRESS_COLUMNS),
+    # OAuth y renovación de tokens de Spotify
+    'spotify': ('username', 'email', *_SPOTIFY_COLUMNS),
+    'full': ('username', 'email', 'row_version', 'hashed_password', 'created_at', *_PROGRESS_COLUMNS, *_SPOTIFY_COLUMNS),
+}
+_USER_SELECT = {name: ', '.join(columns) for name, columns in USER_PROJECTIONS.items()}
+
+
+# Mensaje para cada columna única de users que ya usa otro usuario
+_UNIQUE_MESSAGES = {
+    'username': "El nombre de usuario ya existe",
+    'email': "El email ya está registrado",
+    'spotify_client_id': "Este Client ID de Spotify ya está registrado por otro usuario",
+    'spotify_client_secret': "Este Client Secret de Spotify ya está registrado por otro usuario",
+}
+
+
+def _progress_has(bits: Optional[bytes], level_id) -> int:
+    """Función SQL progress_has(bits, level_id): 1 si el nivel está en el bitset"""
+    return int(str(level_id) in LevelProgress.from_bytes(bits))
+
+
+def _progress_add(bits: Optional[bytes], level_id) -> bytes:
+    """Función SQL progress_add(bits, level_id): bitset con el nivel añadido"""
+    progress = LevelProgress.from_bytes(bits)
+    progress.add(str(level_id))
+    return progress.to_bytes()
+
+
+def _progress_union(bits: Optional[bytes], other: Optional[bytes]) -> bytes:
+    """Función SQL progress_union(bits, otros_bits): unión de dos bitsets de progreso"""
+    return LevelProgress.from_bytes(bits).union(LevelProgress.from_bytes(other)).to_bytes()
+
+
+def register_sql_functions(conn: sqlite3.Connection) -> None:
+    """Funciones SQL sobre las columnas de progreso (levels_completed_bits, played_levels_bits)"""
+    conn.create_function('progress_has', 2, _progress_has, deterministic=True)
+    conn.create_function('progress_add', 2, _progress_add, deterministic=True)
+    conn.create_function('progress_union', 2, _progress_union, deterministic=True)
+
 
 class Database:
     def __init__(self):
+        self.pool = ConnectionPool(
+            DATABASE_PATH,
+            max_size=DB_POOL_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            cache_size_kb=DB_CACHE_SIZE_KB,
+            mmap_size=DB_MMAP_SIZE,
+            busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+            on_connect=register_sql_functions
+        )
+        self.principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+        self.leaderboard = Leaderboard()
+        self.write_behind = None
+        if WRITE_BEHIND_ENABLED:
+            self.write_behind = WriteBehindQueue(self._flush_progress, WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_OPS)
+            self.write_behind.start()
         self.init_database()
     
     def get_connection(self):
-        """Obtener conexión a la base de datos"""
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # Para acceso por nombre de columna
-        return conn
+        """Obtener conexión del pool (close() la devuelve al pool)"""
+        return self.pool.acquire()
+
+    def get_pool_stats(self) -> dict:
+        """Obtener estadísticas del pool de conexiones"""
+        return self.pool.get_stats()
+
+    def get_principal_cache_stats(self) -> dict:
+        """Obtener estadísticas de la caché de usuarios autenticados"""
+        return self.principal_cache.get_stats()
+
+    def get_write_behind_stats(self) -> dict:
+        """Obtener estadísticas de la escritura diferida del progreso"""
+        if not self.write_behind:
+            return {'enabled': False}
+        return dict(self.write_behind.get_stats(), enabled=True)
     
     def init_database(self):
         """Inicializar tablas de la base de datos"""
@@ -47,9 +171,86 @@ class Database:
                     spotify_refresh_token TEXT,
                     spotify_token_expires_at INTEGER,
                     spotify_client_id TEXT UNIQUE NOT NULL,
-                    spotify_client_secret TEXT UNIQUE NOT NULL
+                    spotify_client_secret TEXT UNIQUE NOT NULL,
+                    levels_completed_bits BLOB,
+                    played_levels_bits BLOB
                 )
             ''')
+            # Bases de datos antiguas: añadir columnas de progreso compacto
+            self._ensure_column(conn, 'users', 'levels_completed_bits', 'BLOB')
+            self._ensure_column(conn, 'users', 'played_levels_bits', 'BLOB')
+            # Versión de la fila: la incrementa un trigger con cada UPDATE (ETag de /auth/me)
+            self._ensure_column(conn, 'users', 'row_version', 'INTEGER NOT NULL DEFAULT 0')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS users_row_version
+                AFTER UPDATE ON users
+                FOR EACH ROW WHEN NEW.row_version = OLD.row_version
+                BEGIN
+                    UPDATE users SET row_version = OLD.row_version + 1 WHERE rowid = NEW.rowid;
+                END
+            ''')
+            # Versión del ranking: la incrementan triggers con cada cambio que le afecta,
+            # haga quien haga la escritura (ver Leaderboard.reconcile)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ranking_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('INSERT OR IGNORE INTO ranking_state (id, version) VALUES (1, 0)')
+            # Cada fila guarda la versión del ranking de su último cambio (ranking_version) y los
+            # usernames que dejan de existir (borrados o renombrados) quedan en ranking_removals:
+            # los demás procesos leen solo lo cambiado desde su versión (ver _read_ranking_changes)
+            self._ensure_column(conn, 'users', 'ranking_version', 'INTEGER NOT NULL DEFAULT 0')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_ranking_version
+                ON users (ranking_version)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ranking_removals (
+                    username TEXT NOT NULL,
+                    version INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ranking_removals_version
+                ON ranking_removals (version)
+            ''')
+            # Triggers anteriores: solo incrementaban la versión
+            for name in ('users_ranking_insert', 'users_ranking_delete', 'users_ranking_update'):
+                conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+            bump = 'UPDATE ranking_state SET version = version + 1 WHERE id = 1;'
+            stamp = '''
+                UPDATE users SET ranking_version = (SELECT version FROM ranking_state WHERE id = 1)
+                WHERE rowid = NEW.rowid;
+            '''
+            for name, event, body in (
+                ('users_ranking_log_insert', 'AFTER INSERT ON users', bump + stamp),
+                ('users_ranking_log_delete', 'AFTER DELETE ON users', bump + '''
+                    INSERT INTO ranking_removals (username, version)
+                    SELECT OLD.username, version FROM ranking_state WHERE id = 1;
+                '''),
+                (
+                    'users_ranking_log_update',
+                    'AFTER UPDATE OF username, total_score, levels_completed_bits, levels_completed ON users',
+                    bump + stamp + '''
+                        INSERT INTO ranking_removals (username, version)
+                        SELECT OLD.username, version FROM ranking_state
+                        WHERE id = 1 AND OLD.username <> NEW.username;
+                    '''
+                ),
+            ):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {name} {event}
+                    BEGIN
+                        {body}
+                    END
+                ''')
+            # Índice para encontrar tokens de Spotify próximos a expirar
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_spotify_token_expires_at
+                ON users (spotify_token_expires_at)
+            ''')
             
             # Tabla de canciones locales (para invitados y usuarios sin Spotify)
             conn.execute('''
@@ -64,6 +265,9 @@ class Database:
                     image_url TEXT NOT NULL
                 )
             ''')
+            # Audio en el almacén en disco (ver migrate_local_audio); audio_codificado queda vacío
+            self._ensure_column(conn, 'local_songs', 'audio_hash', 'TEXT')
+            self._ensure_column(conn, 'local_songs', 'audio_mime', 'TEXT')
             
             # Tabla de canciones de Spotify (para usuarios con Spotify conectado)
             conn.execute('''
@@ -80,10 +284,41 @@ class Database:
                 )
             ''')
 
+            # Caché de géneros por artista (genre NULL = artista sin géneros)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS artist_genres (
+                    artist_id TEXT PRIMARY KEY,
+                    genre TEXT,
+                    fetched_at INTEGER NOT NULL
+                )
+            ''')
+
+            # Envíos de puntuación ya aplicados (idempotencia de submit_score)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS score_submissions (
+                    username TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    level_id TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    total_score INTEGER NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    PRIMARY KEY (username, idempotency_key)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_score_submissions_created_at
+                ON score_submissions (created_at)
+            ''')
+
             conn.commit()
+
+            # Convertir progreso CSV antiguo al formato compacto
+            self.migrate_level_progress()
             
             # Insertar canciones locales
             self.init_local_songs()
+            # Pasar su audio en base64 al almacén en disco
+            self.migrate_local_audio()
             # Insertar IDs de canciones de Spotify
             self.init_spotify_songs_levels()
             
@@ -93,16 +328,118 @@ class Database:
         finally:
             conn.close()
     
+    def _ensure_column(self, conn, table: str, column: str, definition: str) -> None:
+        """Añadir una columna a una tabla existente si todavía no la tiene"""
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def migrate_level_progress(self):
+        """
+        Migrar levels_completed / played_levels (CSV) a las columnas BLOB.
+        Una vez migrada la fila, las columnas CSV quedan vacías.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT username, levels_completed, played_levels, levels_completed_bits, played_levels_bits
+                FROM users
+                WHERE (levels_completed IS NOT NULL AND levels_completed != '')
+                   OR (played_levels IS NOT NULL AND played_levels != '')
+            ''')
+            updates = []
+            for row in cursor.fetchall():
+                completed = LevelProgress.load(row['levels_completed_bits'], row['levels_completed'])
+                played = LevelProgress.load(row['played_levels_bits'], row['played_levels'])
+                updates.append((completed.to_bytes(), played.to_bytes(), row['username']))
+            if updates:
+                conn.executemany('''
+                    UPDATE users
+                    SET levels_completed_bits = ?, played_levels_bits = ?, levels_completed = '', played_levels = ''
+                    WHERE username = ?
+                ''', updates)
+                conn.commit()
+                print(f"Progreso migrado a formato compacto para {len(updates)} usuarios")
+        except Exception as e:
+            print(f"Error migrando progreso de niveles: {e}")
+        finally:
+            conn.close()
+
+    def migrate_local_audio(self):
+        """
+        Mover el audio en base64 de local_songs.audio_codificado al almacén en disco.
+        Una vez migrada la fila, audio_codificado queda vacío. Los audios ya migrados
+        que falten en el almacén (directorio nuevo o borrado) se recrean desde local_songs.json.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT id, audio_codificado
+                FROM local_songs
+                WHERE audio_hash IS NULL AND audio_codificado != ''
+            ''')
+            updates = []
+            for row in cursor.fetchall():
+                try:
+                    audio_hash, mime = audio_store.put_data_uri(row['audio_codificado'])
+                except ValueError as e:
+                    print(f"No se pudo migrar el audio de la canción local {row['id']}: {e}")
+                    continue
+                updates.append((audio_hash, mime, row['id']))
+            if updates:
+                conn.executemany('''
+                    UPDATE local_songs
+                    SET audio_hash = ?, audio_mime = ?, audio_codificado = ''
+                    WHERE id = ?
+                ''', updates)
+                conn.commit()
+                print(f"Audio de {len(updates)} canciones locales migrado al almacén de audio")
+
+            cursor = conn.execute('SELECT DISTINCT audio_hash FROM local_songs WHERE audio_hash IS NOT NULL')
+            missing = [row['audio_hash'] for row in cursor.fetchall() if not audio_store.path_for(row['audio_hash'])]
+            if missing:
+                restored = self.restore_local_audio(missing)
+                print(f"Audio de {restored} de {len(missing)} canciones locales recreado en el almacén de audio")
+        except Exception as e:
+            print(f"Error migrando el audio de las canciones locales: {e}")
+        finally:
+            conn.close()
+
+    def restore_local_audio(self, audio_hashes: list[str]) -> int:
+        """
+        Recrear en el almacén los archivos de audio de canciones locales a partir de
+        local_songs.json (el audio ya no está en la BD). Devuelve cuántos se recrearon.
+        """
+        conn = self.get_connection()
+        try:
+            placeholders = ', '.join('?' * len(audio_hashes))
+            cursor = conn.execute(
+                f"SELECT id, audio_hash FROM local_songs WHERE audio_hash IN ({placeholders})", audio_hashes
+            )
+            hashes_by_id = {row['id']: row['audio_hash'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+        if not hashes_by_id:
+            return 0
+        try:
+            with open(LOCAL_SONGS_JSON_PATH, 'r', encoding='utf-8') as f:
+                local_songs = json.load(f).get('songs', [])
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"No se pudo leer {LOCAL_SONGS_JSON_PATH} para recrear audios: {e}")
+            return 0
+        restored = set()
+        for song in local_songs:
+            audio_hash = hashes_by_id.get(song.get('id'))
+            if audio_hash and audio_hash not in restored and audio_store.restore(audio_hash, song.get('audio_codificado') or ''):
+                restored.add(audio_hash)
+        return len(restored)
+
     def init_local_songs(self):
         """Inicializar canciones locales (niveles 1-10 para invitados)"""
         conn = self.get_connection()
         try:
             # Ruta al archivo JSON
-            json_path = os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                '..', 'songs_local_data&spotify_ids', 'local_songs.json'
-            )
-            json_path = os.path.normpath(json_path)
+            json_path = LOCAL_SONGS_JSON_PATH
 
             if not os.path.exists(json_path):
                 print(f"ERROR: Archivo no encontrado: {json_path}")
@@ -165,10 +502,14 @@ class Database:
                 data = json.load(f)
                 levels = data.get('levels', [])
             for level in levels:
-                # cambiar IGNORE por REPLACE si se desea cambiar la canción de un nivel
+                # Como INSERT OR IGNORE, salvo si la canción es la del día o está en el pool de
+                # canciones diarias: vuelve a su nivel (la del día se elige de nuevo al arrancar)
+                # (cambiar por INSERT OR REPLACE si se desea cambiar la canción de un nivel)
                 conn.execute('''
-                    INSERT OR IGNORE INTO spotify_songs (spotify_id, level_id)
+                    INSERT INTO spotify_songs (spotify_id, level_id)
                     VALUES (?, ?)
+                    ON CONFLICT (spotify_id) DO UPDATE SET level_id = excluded.level_id
+                    WHERE spotify_songs.level_id <= 0
                 ''', (level['spotify_id'], level['level_id']))
             conn.commit()
             print("Niveles de canciones de Spotify inicializados")
@@ -181,118 +522,226 @@ class Database:
         """
         Crear nuevo usuario.
         Retorna (éxito, mensaje) para feedback específico.
+        Un único INSERT: los duplicados que aparezcan entre la comprobación y el INSERT
+        los detectan las restricciones UNIQUE.
         """
+        # Comprobar duplicados antes del hash (es la parte lenta y se perdería)
+        taken = self._find_taken_column(username, email, spotify_client_id, spotify_client_secret)
+        if taken:
+            return False, _UNIQUE_MESSAGES[taken]
+        # Hashear antes de ocupar una conexión
+        hashed_password = password_hasher.hash_password(password)
         conn = self.get_connection()
         try:
-            # Verificar si el username ya existe
-            if self.get_user_by_username(username):
-                return False, "El nombre de usuario ya existe"
-            
-            # Verificar si el email ya existe
-            if self.get_user_by_email(email):
-                return False, "El email ya está registrado"
-            
-            # Verificar si el client_id ya existe (si se proporciona)
-            if spotify_client_id:
-                cursor = conn.execute('''
-                    SELECT username FROM users WHERE spotify_client_id = ?
-                ''', (spotify_client_id,))
-                if cursor.fetchone():
-                    return False, "Este Client ID de Spotify ya está registrado por otro usuario"
-            
-            # Verificar si el client_secret ya existe (si se proporciona)
-            if spotify_client_secret:
-                cursor = conn.execute('''
-                    SELECT username FROM users WHERE spotify_client_secret = ?
-                ''', (spotify_client_secret,))
-                if cursor.fetchone():
-                    return False, "Este Client Secret de Spotify ya está registrado por otro usuario"
-            
-            # Hashear contraseña
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            # Insertar usuario
+            before = self._begin_ranking_write(conn)
             conn.execute('''
                 INSERT INTO users (username, email, hashed_password, spotify_client_id, spotify_client_secret)
                 VALUES (?, ?, ?, ?, ?)
             ''', (username, email, hashed_password, spotify_client_id, spotify_client_secret))
-            
-            conn.commit()
+            self.leaderboard.update(username, 0, 0, (before, self._ranking_db_version(conn)))
+            self._commit_ranking_write(conn)
             return True, "Usuario creado exitosamente"
         except sqlite3.IntegrityError as e:
             print(f"Error de integridad creando usuario: {e}")
-            if "spotify_client_id" in str(e):
-                return False, "Este Client ID de Spotify ya está registrado"
-            elif "spotify_client_secret" in str(e):
-                return False, "Este Client Secret de Spotify ya está registrado"
-            elif "email" in str(e):
-                return False, "El email ya está registrado"
-            else:
-                return False, "Ya existe un usuario con estos datos"
+            return False, self._integrity_error_message(e)
         except Exception as e:
             print(f"Error creando usuario: {e}")
             return False, f"Error al crear el usuario: {str(e)}"
         finally:
             conn.close()
-    
-    def get_user_by_username(self, username: str) -> Optional[User]:
-        """Obtener usuario por username"""
+
+    def _find_taken_column(self, username: str, email: str, spotify_client_id: str = None, spotify_client_secret: str = None) -> Optional[str]:
+        """Primera columna única (ver _UNIQUE_MESSAGES) cuyo valor ya usa otro usuario, o None"""
+        values = {
+            'username': username,
+            'email': email,
+            'spotify_client_id': spotify_client_id,
+            'spotify_client_secret': spotify_client_secret,
+        }
+        values = {column: value for column, value in values.items() if value is not None}
+        if not values:
+            return None
         conn = self.get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT username, email, hashed_password, created_at, total_score, levels_completed, played_levels, last_daily_completed,
-                       spotify_access_token, spotify_refresh_token, spotify_token_expires_at, spotify_client_id, spotify_client_secret
-                FROM users WHERE username = ?
-            ''', (username,))
+            conditions = ' OR '.join(f"{column} = ?" for column in values)
+            cursor = conn.execute(
+                f"SELECT {', '.join(values)} FROM users WHERE {conditions} LIMIT 1", tuple(values.values())
+            )
             row = cursor.fetchone()
-            return User.from_dict(dict(row)) if row else None
+            if not row:
+                return None
+            return next(column for column, value in values.items() if row[column] == value)
         except Exception as e:
-            print(f"Error obteniendo usuario: {e}")
+            # Sin comprobación previa, el INSERT sigue detectando los duplicados
+            print(f"Error comprobando duplicados de usuario: {e}")
             return None
         finally:
             conn.close()
+
+    def _integrity_error_message(self, error: sqlite3.IntegrityError) -> str:
+        """Traducir una violación de restricción de la tabla users a un mensaje para el usuario"""
+        detail = str(error)
+        column = detail.rsplit('users.', 1)[-1] if 'users.' in detail else ''
+        if detail.startswith('UNIQUE'):
+            return _UNIQUE_MESSAGES.get(column, "Ya existe un usuario con estos datos")
+        if detail.startswith('NOT NULL'):
+            return f"Falta un dato obligatorio: {column}"
+        return "Ya existe un usuario con estos datos"
+
+    def create_users_bulk(self, users: Iterable[dict], prehashed: bool = False, chunk_size: int = BULK_INSERT_CHUNK) -> tuple[int, int]:
+        """
+        Registrar muchos usuarios de una vez (carga inicial o migraciones) en una sola transacción.
+        Cada usuario es un dict con username, email, spotify_client_id, spotify_client_secret y
+        password (o hashed_password si prehashed=True). Los que violan alguna restricción
+        (duplicados, campos vacíos) se omiten. Retorna (creados, omitidos).
+        Las contraseñas se hashean antes de abrir la transacción: dentro solo van los INSERT,
+        así el lock de escritura de SQLite no se retiene mientras trabaja bcrypt.
+        """
+        users = list(users)
+        if prehashed:
+            rows = [self._bulk_user_row(user, user['hashed_password']) for user in users]
+        else:
+            # Los que ya existen se omitirían igualmente: no se hashean
+            pending = self._without_taken_users(users, chunk_size)
+            hashes = password_hasher.hash_passwords([user['password'] for user in pending])
+            rows = [self._bulk_user_row(user, hashed) for user, hashed in zip(pending, hashes)]
+
+        conn = self.get_connection()
+        try:
+            # Todos los INSERT van en la misma transacción implícita hasta el commit
+            # (rowcount y no total_changes: este también cuenta lo que escriben los triggers)
+            created = 0
+            for start in range(0, len(rows), chunk_size):
+                cursor = conn.executemany('''
+                    INSERT OR IGNORE INTO users (username, email, hashed_password, spotify_client_id, spotify_client_secret)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows[start:start + chunk_size])
+                created += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        # Solo se leen las filas insertadas (ver _read_ranking_changes)
+        self._sync_leaderboard()
+        return created, len(users) - created
+
+    @staticmethod
+    def _bulk_user_row(user: dict, hashed_password: str) -> tuple:
+        return (
+            user['username'], user['email'], hashed_password,
+            user.get('spotify_client_id'), user.get('spotify_client_secret')
+        )
+
+    def _without_taken_users(self, users: list[dict], chunk_size: int) -> list[dict]:
+        """Usuarios cuyo username y email no existen ya (ni se repiten antes en la lista)"""
+        taken_usernames = set()
+        taken_emails = set()
+        # Lotes acotados por el límite de parámetros de SQLite
+        step = max(1, min(chunk_size, 400))
+        conn = self.get_connection()
+        try:
+            for start in range(0, len(users), step):
+                chunk = users[start:start + step]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT username, email FROM users WHERE username IN ({placeholders}) OR email IN ({placeholders})",
+                    [user['username'] for user in chunk] + [user['email'] for user in chunk]
+                )
+                for row in cursor.fetchall():
+                    taken_usernames.add(row['username'])
+                    taken_emails.add(row['email'])
+        finally:
+            conn.close()
+
+        pending = []
+        for user in users:
+            if user['username'] in taken_usernames or user['email'] in taken_emails:
+                continue
+            taken_usernames.add(user['username'])
+            taken_emails.add(user['email'])
+            pending.append(user)
+        return pending
     
-    def get_user_by_email(self, email: str) -> Optional[User]:
-        """Obtener usuario por email"""
+    def get_user_by_username(self, username: str, include_pending: bool = True, projection: str = 'full') -> Optional[User]:
+        """
+        Obtener usuario por username (con los cambios de progreso aún no escritos).
+        `projection` (ver USER_PROJECTIONS) limita las columnas leídas; el resto se carga al usarlas.
+        """
+        if include_pending and self.write_behind:
+            return self._with_pending(lambda: self.get_user_by_username(username, False, projection))
+        return self._get_user('username', username, projection, "Error obteniendo usuario")
+
+    def get_user_by_email(self, email: str, include_pending: bool = True, projection: str = 'full') -> Optional[User]:
+        """Obtener usuario por email (con los cambios de progreso aún no escritos)"""
+        if include_pending and self.write_behind:
+            return self._with_pending(lambda: self.get_user_by_email(email, False, projection))
+        return self._get_user('email', email, projection, "Error obteniendo usuario por email")
+
+    def get_user_by_client_id(self, client_id: str, projection: str = 'full') -> Optional[User]:
+        """Obtener usuario por client_id de Spotify"""
+        return self._get_user('spotify_client_id', client_id, projection, "Error obteniendo usuario por client_id")
+
+    def _get_user(self, column: str, value, projection: str, error_message: str) -> Optional[User]:
         conn = self.get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT username, email, hashed_password, created_at, total_score, levels_completed, played_levels, last_daily_completed,
-                       spotify_access_token, spotify_refresh_token, spotify_token_expires_at, spotify_client_id, spotify_client_secret
-                FROM users WHERE email = ?
-            ''', (email,))
+            cursor = conn.execute(
+                f"SELECT {_USER_SELECT[projection]} FROM users WHERE {column} = ? LIMIT 1", (value,)
+            )
             row = cursor.fetchone()
-            return User.from_dict(dict(row)) if row else None
+            if not row:
+                return None
+            loader = None if projection == 'full' else self._load_user_columns
+            return User.from_row(dict(row), loader)
         except Exception as e:
-            print(f"Error obteniendo usuario por email: {e}")
+            print(f"{error_message}: {e}")
             return None
         finally:
             conn.close()
 
-    def get_user_by_client_id(self, client_id: str) -> Optional[User]:
-        """Obtener usuario por client_id de Spotify"""
+    def _load_user_columns(self, username: str) -> Optional[dict]:
+        """
+        Carga diferida de un User proyectado: todas sus columnas (User solo rellena las que le faltan).
+        None si el usuario ya no existe; los errores de la BD se propagan.
+        """
         conn = self.get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT username, email, hashed_password, created_at, total_score, levels_completed, played_levels, last_daily_completed,
-                       spotify_access_token, spotify_refresh_token, spotify_token_expires_at, spotify_client_id, spotify_client_secret
-                FROM users WHERE spotify_client_id = ?
-                LIMIT 1
-            ''', (client_id,))
+            cursor = conn.execute(f"SELECT {_USER_SELECT['full']} FROM users WHERE username = ?", (username,))
             row = cursor.fetchone()
-            return User.from_dict(dict(row)) if row else None
-        except Exception as e:
-            print(f"Error obteniendo usuario por client_id: {e}")
-            return None
+            return dict(row) if row else None
         finally:
             conn.close()
 
     def validate_credentials(self, email: str, password: str) -> Optional[User]:
         """Validar credenciales de usuario"""
-        user = self.get_user_by_email(email)
-        if user and bcrypt.checkpw(password.encode('utf-8'), user.hashed_password.encode('utf-8')):
+        user = self.get_user_by_email(email, projection='credentials')
+        if user and password_hasher.check_password(password, user.hashed_password):
+            if password_hasher.needs_rehash(user.hashed_password):
+                self._rehash_password(user, password)
             return user
         return None
+
+    def _rehash_password(self, user: User, password: str) -> None:
+        """Volver a hashear con el coste actual (la contraseña en claro solo se conoce al hacer login)"""
+        conn = self.get_connection()
+        try:
+            hashed_password = password_hasher.hash_password(password)
+            # Solo si nadie ha cambiado la contraseña mientras tanto
+            cursor = conn.execute('''
+                UPDATE users
+                SET hashed_password = ?
+                WHERE username = ? AND hashed_password = ?
+            ''', (hashed_password, user.username, user.hashed_password))
+            conn.commit()
+            if cursor.rowcount:
+                user.hashed_password = hashed_password
+                password_hasher.record_rehash()
+                self.principal_cache.invalidate_user(user.username)
+        except Exception as e:
+            print(f"Error actualizando el hash de la contraseña: {e}")
+        finally:
+            conn.close()
     
     def create_token(self, user: User) -> str:
         """Crear JWT token"""
@@ -304,10 +753,24 @@ class Database:
         return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
     
     def verify_token(self, token: str) -> Optional[User]:
-        """Verificar JWT token"""
+        """Verificar JWT token (consultando primero la caché de usuarios autenticados)"""
+        if self.write_behind:
+            # La caché guarda el usuario tal como está en la BD; lo pendiente se superpone después
+            return self._with_pending(lambda: self._verify_token(token))
+        return self._verify_token(token)
+
+    def _verify_token(self, token: str) -> Optional[User]:
+        cached = self.principal_cache.get(token)
+        if cached:
+            return cached
         try:
+            version = self.principal_cache.version()
             payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            return self.get_user_by_username(payload['sub'])
+            # Las peticiones autenticadas solo usan identidad y progreso: ni hashes ni secretos en la caché
+            user = self.get_user_by_username(payload['sub'], include_pending=False, projection='progress')
+            if user:
+                self.principal_cache.put(token, user, payload.get('exp'), version)
+            return user
         except jwt.ExpiredSignatureError:
             print("Token expirado")
             return None
@@ -316,19 +779,112 @@ class Database:
             return None
 
     def get_ranking(self, limit: int = 10) -> list:
-        """Obtener ranking de usuarios"""
-        conn = self.get_connection()
+        """Obtener ranking de usuarios (desde el ranking en memoria)"""
         try:
-            cursor = conn.execute('''
-                SELECT username, total_score, levels_completed
-                FROM users
-                ORDER BY total_score DESC
-                LIMIT ?
-            ''', (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+            self._ensure_leaderboard()
+            return self.leaderboard.top(limit)
         except Exception as e:
             print(f"Error obteniendo ranking: {e}")
             return []
+
+    def get_ranking_version(self) -> str:
+        """
+        Identificador del estado actual del ranking en memoria (cambia con cada cambio).
+        Es la versión del ranking en la BD, igual en todos los procesos (el write-behind
+        no toca columnas del ranking).
+        """
+        self._ensure_leaderboard()
+        return str(self.leaderboard.db_version)
+
+    def _ranking_db_version(self, conn) -> int:
+        return conn.execute('SELECT version FROM ranking_state WHERE id = 1').fetchone()[0]
+
+    def _begin_ranking_write(self, conn) -> int:
+        """
+        Reservar la escritura y devolver la versión del ranking antes de escribir (ver Leaderboard.advance).
+        Si otro proceso escribió desde la última sincronización, el ranking en memoria se pone al día
+        antes con sus cambios, para que la escritura propia lo avance sin recargarlo.
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        before = self._ranking_db_version(conn)
+        self.leaderboard.reconcile(before, lambda since: self._read_ranking_changes(conn, since))
+        return before
+
+    def _commit_ranking_write(self, conn) -> None:
+        """commit de una escritura ya aplicada al ranking en memoria; si falla, se recarga"""
+        try:
+            conn.commit()
+        except Exception:
+            self.leaderboard.invalidate()
+            raise
+
+    def has_pending_progress(self, username: str) -> bool:
+        """True si el usuario tiene cambios de progreso aún no escritos (write-behind)"""
+        return bool(self.write_behind and self.write_behind.pending_for(username))
+
+    def _ensure_leaderboard(self) -> None:
+        """
+        Cargar el ranking en memoria si hace falta.
+        Cada LEADERBOARD_SYNC_INTERVAL segundos se comprueba si otro proceso lo cambió.
+        """
+        if self.leaderboard.check_due(LEADERBOARD_SYNC_INTERVAL):
+            self._sync_leaderboard()
+        if not self.leaderboard.is_loaded:
+            self.leaderboard.ensure_loaded(self._load_leaderboard_rows)
+
+    def _sync_leaderboard(self) -> None:
+        """Aplicar al ranking en memoria lo que hayan escrito otros procesos (solo las filas cambiadas)"""
+        conn = self.get_connection()
+        try:
+            # Una sola transacción de lectura: los cambios corresponden a la versión leída
+            conn.execute('BEGIN')
+            self.leaderboard.reconcile(
+                self._ranking_db_version(conn), lambda since: self._read_ranking_changes(conn, since)
+            )
+        finally:
+            conn.close()
+
+    def _read_ranking_changes(self, conn, since: int) -> tuple[int, list[tuple[str, int, int]], list[str]]:
+        """
+        Cambios del ranking posteriores a la versión `since` (por los índices de ranking_version):
+        (versión actual, filas (username, total_score, niveles completados), usernames eliminados).
+        """
+        db_version = self._ranking_db_version(conn)
+        cursor = conn.execute('''
+            SELECT username, total_score, levels_completed_bits, levels_completed
+            FROM users
+            WHERE ranking_version > ?
+        ''', (since,))
+        rows = [
+            (
+                row['username'],
+                row['total_score'],
+                LevelProgress.load(row['levels_completed_bits'], row['levels_completed']).count()
+            )
+            for row in cursor.fetchall()
+        ]
+        cursor = conn.execute('SELECT username FROM ranking_removals WHERE version > ?', (since,))
+        return db_version, rows, [row['username'] for row in cursor.fetchall()]
+
+    def _load_leaderboard_rows(self) -> tuple[int, list[tuple[str, int, int]]]:
+        """Leer la versión del ranking y (username, total_score, niveles completados) de todos los usuarios"""
+        conn = self.get_connection()
+        try:
+            # Una sola transacción de lectura: las filas corresponden a la versión leída
+            conn.execute('BEGIN')
+            db_version = self._ranking_db_version(conn)
+            cursor = conn.execute('''
+                SELECT username, total_score, levels_completed_bits, levels_completed
+                FROM users
+            ''')
+            return db_version, [
+                (
+                    row['username'],
+                    row['total_score'],
+                    LevelProgress.load(row['levels_completed_bits'], row['levels_completed']).count()
+                )
+                for row in cursor.fetchall()
+            ]
         finally:
             conn.close()
     
@@ -337,17 +893,31 @@ class Database:
         Actualizar username y/o contraseña del usuario.
         Retorna (éxito, mensaje) para feedback.
         """
+        if new_username and self.write_behind:
+            # Los cambios pendientes van por username: no se escribe ningún lote durante el
+            # renombrado y lo que quede en la cola (también lo encolado entretanto) pasa al nuevo
+            with self.write_behind.paused():
+                success, message = self._update_user_profile(username, new_username, new_password)
+                if success:
+                    self.write_behind.rename(username, new_username)
+                return success, message
+        return self._update_user_profile(username, new_username, new_password)
+
+    def _update_user_profile(self, username: str, new_username: str = None, new_password: str = None) -> tuple[bool, str]:
         conn = self.get_connection()
         try:
             # Verificar si el nuevo username ya existe (si se proporciona)
             if new_username:
-                existing_user = self.get_user_by_username(new_username)
+                existing_user = self.get_user_by_username(new_username, include_pending=False, projection='identity')
                 if existing_user and existing_user.username != username:
                     return False, "El nombre de usuario ya está en uso"
             
-            # Preparar actualización
+            # Preparar actualización (el hash antes de reservar la escritura)
+            if new_password:
+                hashed_password = password_hasher.hash_password(new_password)
+            if new_username:
+                before = self._begin_ranking_write(conn)
             if new_username and new_password:
-                hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
                 conn.execute('''
                     UPDATE users 
                     SET username = ?, hashed_password = ?
@@ -362,7 +932,6 @@ class Database:
                 ''', (new_username, username))
                 message = "Nombre de usuario actualizado"
             elif new_password:
-                hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
                 conn.execute('''
                     UPDATE users 
                     SET hashed_password = ?
@@ -372,7 +941,12 @@ class Database:
             else:
                 return False, "No se proporcionaron datos para actualizar"
             
-            conn.commit()
+            if new_username:
+                self.leaderboard.rename(username, new_username, (before, self._ranking_db_version(conn)))
+                self._commit_ranking_write(conn)
+            else:
+                conn.commit()
+            self.principal_cache.invalidate_user(username)
             return True, message
         except Exception as e:
             print(f"Error actualizando perfil: {e}")
@@ -385,7 +959,7 @@ class Database:
         conn = self.get_connection()
         try:
             cursor = conn.execute('''
-                SELECT id, title, artists, album, year, genre, audio_codificado as audio, image_url
+                SELECT id, title, artists, album, year, genre, audio_codificado as audio, audio_hash, image_url
                 FROM local_songs
                 WHERE id = ?
             ''', (level_id,))
@@ -394,11 +968,25 @@ class Database:
                 song_dict = dict(row)
                 song_dict['id'] = str(song_dict['id'])
                 song_dict['level_id'] = level_id
+                if song_dict['audio_hash']:
+                    song_dict['audio'] = public_audio_url(song_dict['audio_hash'])
                 return Song.from_dict(song_dict)
             return None
         finally:
             conn.close()
     
+    def get_local_audio_mime(self, audio_hash: str) -> Optional[str]:
+        """Tipo MIME de un audio del almacén (None si ninguna canción local lo usa)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT audio_mime FROM local_songs WHERE audio_hash = ? LIMIT 1
+            ''', (audio_hash,))
+            row = cursor.fetchone()
+            return row['audio_mime'] if row else None
+        finally:
+            conn.close()
+
     def get_spotify_song_by_level(self, level_id: int) -> Optional[Song]:
         """Obtener canción de Spotify por nivel"""
         conn = self.get_connection()
@@ -414,14 +1002,49 @@ class Database:
         finally:
             conn.close()
 
+    def get_daily_spotify_id(self) -> Optional[str]:
+        """spotify_id de la canción del día actual (la elige el último proceso que arrancó)"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT spotify_id FROM spotify_songs WHERE level_id = 0 LIMIT 1').fetchone()
+            return row['spotify_id'] if row else None
+        finally:
+            conn.close()
+
+    def get_unhydrated_spotify_songs(self) -> list[Song]:
+        """Obtener canciones de Spotify de las que solo se conoce el spotify_id (o les faltan datos)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT spotify_id as id, title, artists, album, year, genre, audio, image_url, level_id
+                FROM spotify_songs
+                ORDER BY level_id
+            ''')
+            songs = [Song.from_dict(dict(row)) for row in cursor.fetchall()]
+            return [song for song in songs if not song.is_hydrated()]
+        except Exception as e:
+            print(f"Error obteniendo canciones sin datos: {e}")
+            return []
+        finally:
+            conn.close()
+
     def add_spotify_song(self, song: Song) -> bool:
-        """Añadir canción de Spotify a la base de datos"""
+        """
+        Añadir canción de Spotify a la base de datos.
+        Si ya existe, se actualizan sus datos pero conserva su nivel: la canción del
+        día puede haber cambiado de nivel (pool <-> 0) mientras se hidrataba.
+        """
         conn = self.get_connection()
         try:
-            conn.execute('''
-                INSERT OR REPLACE INTO spotify_songs 
+            row = conn.execute('''
+                INSERT INTO spotify_songs
                 (spotify_id, title, artists, album, year, genre, audio, image_url, level_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (spotify_id) DO UPDATE SET
+                    title = excluded.title, artists = excluded.artists, album = excluded.album,
+                    year = excluded.year, genre = excluded.genre, audio = excluded.audio,
+                    image_url = excluded.image_url
+                RETURNING level_id
             ''', (
                 song.id,
                 song.title,
@@ -432,8 +1055,9 @@ class Database:
                 song.audio,
                 song.image_url,
                 song.level_id
-            ))
+            )).fetchone()
             conn.commit()
+            level_response_cache.invalidate(spotify_level_key(row['level_id'], song.id))
             return True
         except Exception as e:
             print(f"Error añadiendo canción de Spotify: {e}")
@@ -441,32 +1065,98 @@ class Database:
         finally:
             conn.close()
 
-    def delete_daily_songs(self) -> bool:
-        """Eliminar todas las canciones diarias almacenadas (aquellas con level_id = 0)"""
+    def get_artist_genre(self, artist_id: str) -> Optional[tuple[Optional[str], int]]:
+        """Obtener (género, fetched_at) guardado para un artista"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT genre, fetched_at FROM artist_genres WHERE artist_id = ?
+            ''', (artist_id,))
+            row = cursor.fetchone()
+            return (row['genre'], row['fetched_at']) if row else None
+        except Exception as e:
+            print(f"Error obteniendo género del artista: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def save_artist_genre(self, artist_id: str, genre: Optional[str], fetched_at: int) -> bool:
+        """Guardar el género de un artista (None si no tiene)"""
         conn = self.get_connection()
         try:
             conn.execute('''
-                DELETE FROM spotify_songs 
+                INSERT OR REPLACE INTO artist_genres (artist_id, genre, fetched_at)
+                VALUES (?, ?, ?)
+            ''', (artist_id, genre, fetched_at))
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error guardando género del artista: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def init_daily_song_pool(self, spotify_ids: list[str]) -> list[str]:
+        """
+        Registrar las candidatas a canción del día (sin datos: se hidratan como el resto).
+        Devuelve las que pueden serlo: no las que ya son la canción de un nivel.
+        """
+        conn = self.get_connection()
+        try:
+            conn.executemany('''
+                INSERT OR IGNORE INTO spotify_songs (spotify_id, level_id)
+                VALUES (?, ?)
+            ''', [(spotify_id, DAILY_POOL_LEVEL) for spotify_id in spotify_ids])
+            conn.commit()
+            cursor = conn.execute('''
+                SELECT spotify_id FROM spotify_songs WHERE level_id IN (0, ?)
+            ''', (DAILY_POOL_LEVEL,))
+            available = {row['spotify_id'] for row in cursor.fetchall()}
+            return [spotify_id for spotify_id in spotify_ids if spotify_id in available]
+        except Exception as e:
+            print(f"Error inicializando el pool de canciones diarias: {e}")
+            return []
+        finally:
+            conn.close()
+
+    def retire_daily_songs(self) -> bool:
+        """Retirar la canción diaria actual (level_id = 0): vuelve al pool con sus datos ya hidratados"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE spotify_songs
+                SET level_id = ?
                 WHERE level_id = 0
-            ''')
+                RETURNING spotify_id
+            ''', (DAILY_POOL_LEVEL,))
+            retired = [row['spotify_id'] for row in cursor.fetchall()]
             conn.commit()
+            for spotify_id in retired:
+                level_response_cache.invalidate(spotify_level_key(0, spotify_id))
             return True
         except Exception as e:
-            print(f"Error eliminando canciones diarias: {e}")
+            print(f"Error retirando canciones diarias: {e}")
             return False
         finally:
             conn.close()
     
     def init_daily_song_level(self, spotify_id: str) -> bool:
-        """Inicializar canción diaria en la base de datos con level_id = 0"""
+        """Inicializar canción diaria en la base de datos con level_id = 0 (con sus datos si ya estaba en el pool)"""
         conn = self.get_connection()
         try:
-            conn.execute('''
-                INSERT OR REPLACE INTO spotify_songs 
-                (spotify_id, level_id)
-                VALUES (?, 0)
-            ''', (spotify_id,))
+            cursor = conn.execute('''
+                UPDATE spotify_songs
+                SET level_id = 0
+                WHERE spotify_id = ? AND level_id = ?
+            ''', (spotify_id, DAILY_POOL_LEVEL))
+            if not cursor.rowcount:
+                conn.execute('''
+                    INSERT OR REPLACE INTO spotify_songs 
+                    (spotify_id, level_id)
+                    VALUES (?, 0)
+                ''', (spotify_id,))
             conn.commit()
+            level_response_cache.invalidate(spotify_level_key(0, spotify_id))
             return True
         except Exception as e:
             print(f"Error inicializando canción diaria: {e}")
@@ -492,46 +1182,274 @@ class Database:
                 WHERE username = ?
             ''', (access_token, refresh_token, expires_at, username))
             conn.commit()
+            self.principal_cache.invalidate_user(username)
             return True
         except Exception as e:
             print(f"Error guardando tokens de Spotify: {e}")
             return False
         finally:
             conn.close()
+
+    def swap_spotify_tokens(
+        self,
+        username: str,
+        expected_expires_at: Optional[int],
+        access_token: str,
+        refresh_token: str,
+        expires_in: int
+    ) -> Optional[bool]:
+        """
+        Guardar tokens renovados solo si el token no ha cambiado desde que se leyó
+        (compare-and-set sobre spotify_token_expires_at).
+        Devuelve False si otro proceso lo renovó antes y None si hay un error.
+        """
+        conn = self.get_connection()
+        try:
+            expires_at = int(time.time()) + expires_in
+            cursor = conn.execute('''
+                UPDATE users
+                SET spotify_access_token = ?,
+                    spotify_refresh_token = ?,
+                    spotify_token_expires_at = ?
+                WHERE username = ? AND spotify_token_expires_at IS ?
+            ''', (access_token, refresh_token, expires_at, username, expected_expires_at))
+            conn.commit()
+            if cursor.rowcount == 0:
+                return False
+            self.principal_cache.invalidate_user(username)
+            return True
+        except Exception as e:
+            print(f"Error guardando tokens de Spotify: {e}")
+            return None
+        finally:
+            conn.close()
     
     def save_user(self, user: User) -> bool:
-        """Actualizar datos del usuario en la base de datos"""
+        """
+        Guardar los cambios del usuario en la base de datos.
+        Solo se escriben las columnas modificadas desde la carga; si no hay ninguna, no se hace nada.
+        """
+        changes = user.get_changes()
+        if not changes:
+            return True
+        ranking_changed = user.has_changes('total_score', 'completed')
         conn = self.get_connection()
         try:
-            conn.execute('''
-                UPDATE users 
-                SET email = ?, hashed_password = ?, total_score = ?, levels_completed = ?, played_levels = ?, last_daily_completed = ?,
-                    spotify_access_token = ?, spotify_refresh_token = ?, spotify_token_expires_at = ?, spotify_client_id = ?, spotify_client_secret = ?
-                WHERE username = ?
-            ''', (
-                user.email,
-                user.hashed_password,
-                user.total_score,
-                user.levels_completed,
-                user.played_levels,
-                user.last_daily_completed,
-                user.spotify_access_token,
-                user.spotify_refresh_token,
-                user.spotify_token_expires_at,
-                user.spotify_client_id,
-                user.spotify_client_secret,
-                user.username
-            ))
-            conn.commit()
+            if ranking_changed:
+                before = self._begin_ranking_write(conn)
+            assignments = ', '.join(f"{column} = ?" for column in changes)
+            conn.execute(
+                f"UPDATE users SET {assignments} WHERE username = ?",
+                (*changes.values(), user.username)
+            )
+            if ranking_changed:
+                self.leaderboard.update(
+                    user.username, user.total_score, user.get_completed_levels_count(),
+                    (before, self._ranking_db_version(conn))
+                )
+                self._commit_ranking_write(conn)
+            else:
+                conn.commit()
+            user.mark_clean()
             return True
         except Exception as e:
             print(f"Error actualizando usuario: {e}")
             return False
         finally:
             conn.close()
+            # Invalidar siempre: el objeto pudo modificarse aunque falle el guardado
+            self.principal_cache.invalidate_user(user.username)
+
+    def submit_score(self, username: str, level_id: str, score: int, idempotency_key: Optional[str] = None) -> tuple[str, Optional[int]]:
+        """
+        Sumar la puntuación de un nivel en una sola transacción:
+        total_score = total_score + score solo si el nivel no estaba jugado, y el nivel
+        queda completado y jugado (y el diario marcado si level_id es "0").
+        Con idempotency_key, repetir el mismo envío devuelve el resultado original sin sumar.
+        Retorna (resultado, total_score) con resultado SCORE_*.
+        """
+        level_id = str(level_id)
+        if self.write_behind:
+            # El UPDATE solo ve lo escrito: un nivel marcado como jugado aún en la cola cuenta igual
+            pending = self.write_behind.pending_for(username)
+            if pending and level_id in pending.played:
+                return SCORE_ALREADY_PLAYED, None
+        conn = self.get_connection()
+        try:
+            # Reservar la escritura desde el principio: la comprobación y el UPDATE no se intercalan
+            before = self._begin_ranking_write(conn)
+            if idempotency_key:
+                row = conn.execute('''
+                    SELECT level_id, score, total_score
+                    FROM score_submissions
+                    WHERE username = ? AND idempotency_key = ? AND created_at > ?
+                ''', (username, idempotency_key, int(time.time()) - SCORE_IDEMPOTENCY_TTL)).fetchone()
+                if row:
+                    conn.rollback()
+                    if row['level_id'] == level_id and row['score'] == score:
+                        return SCORE_REPLAYED, row['total_score']
+                    return SCORE_KEY_CONFLICT, None
+
+            row = self._apply_score(conn, username, level_id, score)
+            if not row:
+                exists = conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
+                conn.rollback()
+                return (SCORE_ALREADY_PLAYED if exists else SCORE_USER_NOT_FOUND), None
+
+            total_score = row['total_score']
+            if idempotency_key:
+                now = int(time.time())
+                conn.execute('DELETE FROM score_submissions WHERE created_at <= ?', (now - SCORE_IDEMPOTENCY_TTL,))
+                conn.execute('''
+                    INSERT OR REPLACE INTO score_submissions (username, idempotency_key, level_id, score, total_score, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (username, idempotency_key, level_id, score, total_score, now))
+            # Actualizar el ranking antes del commit, aún con el lock de escritura,
+            # para que envíos concurrentes no lo dejen con un total antiguo
+            self.leaderboard.update(
+                username, total_score, LevelProgress.from_bytes(row['levels_completed_bits']).count(),
+                (before, self._ranking_db_version(conn))
+            )
+            self._commit_ranking_write(conn)
+            return SCORE_ACCEPTED, total_score
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+            self.principal_cache.invalidate_user(username)
+
+    def _apply_score(self, conn, username: str, level_id: str, score: int):
+        """UPDATE condicional de submit_score; devuelve (total_score, levels_completed_bits) o None si el nivel ya estaba jugado"""
+        daily = ", last_daily_completed = ?" if level_id == "0" else ""
+        params = [score, level_id, level_id]
+        if daily:
+            params.append(datetime.now().strftime("%d-%m-%Y"))
+        return conn.execute(f'''
+            UPDATE users
+            SET total_score = total_score + ?,
+                levels_completed_bits = progress_add(levels_completed_bits, ?),
+                played_levels_bits = progress_add(played_levels_bits, ?){daily}
+            WHERE username = ? AND NOT progress_has(played_levels_bits, ?)
+            RETURNING total_score, levels_completed_bits
+        ''', (*params, username, level_id)).fetchone()
+
+    def record_level_played(self, username: str, level_id: str) -> bool:
+        """Marcar un nivel como jugado (diferido si está activo el write-behind)"""
+        level_id = str(level_id)
+        if self.write_behind:
+            self.write_behind.enqueue(username, lambda pending: pending.played.add(level_id))
+            return True
+        return self._update_progress(
+            username, 'played_levels_bits = progress_add(played_levels_bits, ?)', (level_id,)
+        )
+
+    def record_daily_completed(self, username: str) -> bool:
+        """Marcar el desafío diario como completado hoy (diferido si está activo el write-behind)"""
+        today = datetime.now().strftime("%d-%m-%Y")
+        if self.write_behind:
+            def complete_daily(pending: PendingProgress) -> None:
+                pending.daily = today
+            self.write_behind.enqueue(username, complete_daily)
+            return True
+        return self._update_progress(username, 'last_daily_completed = ?', (today,))
+
+    def _update_progress(self, username: str, assignment: str, params: tuple) -> bool:
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(f"UPDATE users SET {assignment} WHERE username = ?", (*params, username))
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error actualizando progreso: {e}")
+            return False
+        finally:
+            conn.close()
+            self.principal_cache.invalidate_user(username)
+
+    def _flush_progress(self, batch: dict) -> None:
+        """Escribir un lote del write-behind (username -> PendingProgress) en una transacción"""
+        conn = self.get_connection()
+        try:
+            for username, pending in batch.items():
+                assignments = []
+                params = []
+                if pending.played:
+                    assignments.append('played_levels_bits = progress_union(played_levels_bits, ?)')
+                    params.append(pending.played.to_bytes())
+                if pending.daily:
+                    assignments.append('last_daily_completed = ?')
+                    params.append(pending.daily)
+                if assignments:
+                    conn.execute(
+                        f"UPDATE users SET {', '.join(assignments)} WHERE username = ?",
+                        (*params, username)
+                    )
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+        for username in batch:
+            self.principal_cache.invalidate_user(username)
+
+    def _with_pending(self, load: Callable[[], Optional[User]]) -> Optional[User]:
+        """Cargar un usuario y superponer sus cambios de progreso aún no escritos (read-your-writes)"""
+        if not self.write_behind:
+            return load()
+        while True:
+            generation = self.write_behind.generation
+            user = load()
+            if user is None:
+                return None
+            pending = self.write_behind.pending_for(user.username)
+            # Si entre la lectura y aquí se escribió un lote, la lectura puede no incluirlo
+            if self.write_behind.generation != generation:
+                continue
+            if pending:
+                user.apply_pending(pending.played, pending.daily)
+            return user
+
+    def get_users_with_expiring_spotify_tokens(self, before: int, limit: int = 100) -> list[str]:
+        """Usuarios con refresh token cuyo access token expira antes de `before` (los más urgentes primero)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT username
+                FROM users
+                WHERE spotify_token_expires_at <= ? AND spotify_refresh_token IS NOT NULL
+                ORDER BY spotify_token_expires_at
+                LIMIT ?
+            ''', (before, limit))
+            return [row['username'] for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error buscando tokens de Spotify por expirar: {e}")
+            return []
+        finally:
+            conn.close()
+
+    def has_spotify_refresh_token(self, username: str) -> bool:
+        """True si el usuario tiene un refresh token de Spotify guardado"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT 1 FROM users WHERE username = ? AND spotify_refresh_token IS NOT NULL
+            ''', (username,))
+            return cursor.fetchone() is not None
+        except Exception as e:
+            print(f"Error comprobando refresh token de Spotify: {e}")
+            return False
+        finally:
+            conn.close()
 
-    def get_spotify_access_token(self, username: str) -> tuple[bool, str, Optional[str]]:
-        """Obtener access token de Spotify para un usuario, con feedback detallado"""
+    def get_spotify_access_token(self, username: str, min_validity: int = 0) -> tuple[bool, str, Optional[str]]:
+        """
+        Obtener access token de Spotify para un usuario, con feedback detallado.
+        min_validity: segundos que debe seguir siendo válido el token (si no, se considera expirado)
+        """
         conn = self.get_connection()
         try:
             cursor = conn.execute('''
@@ -548,7 +1466,7 @@ class Database:
                 return False, "No hay access token de Spotify almacenado", None
             if not expires_at:
                 return False, "No hay información de expiración del token", None
-            if expires_at <= int(time.time()):
+            if expires_at <= int(time.time()) + min_validity:
                 return False, "El access token de Spotify ha expirado", None
             return True, "Access token válido", access_token
         except Exception as e:
@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+
+class Leaderboard:
+    """
+    Ranking en memoria mantenido de forma incremental.
+    Se carga una sola vez desde la tabla users y después se actualiza con
+    cada guardado de usuario, de modo que leer el top N es O(N) sin
+    recorrer la tabla. Los niveles completados se guardan ya contados.
+
+    Cada proceso tiene su propio ranking. Para detectar lo que escriben los
+    demás, la BD lleva una versión del ranking (tabla ranking_state, la
+    incrementan triggers) y aquí se guarda la versión a la que corresponde
+    lo cargado (db_version). Las escrituras propias la avanzan; si la de la
+    BD es otra, alguien más escribió y se aplican solo las filas cambiadas
+    desde db_version (ver reconcile), sin volver a recorrer la tabla.
+    """
+
+    def __init__(self):
+        self._keys = []     # lista ordenada de (-total_score, username)
+        self._entries = {}  # username -> (total_score, levels_completed)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.version = 0    # se incrementa con cada cambio
+        self.db_version = None  # versión del ranking en la BD que refleja lo cargado
+        self._checked_at = 0.0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self, loader: Callable[[], tuple[int, Iterable[tuple[str, int, int]]]]) -> None:
+        """
+        Cargar el ranking si aún no se ha hecho. `loader` devuelve la versión del
+        ranking en la BD y las filas (username, score, niveles) leídas con ella.
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._keys = []
+            self._entries = {}
+            db_version, rows = loader()
+            for username, total_score, levels_completed in rows:
+                self._entries[username] = (total_score or 0, levels_completed)
+                self._keys.append((-(total_score or 0), username))
+            self._keys.sort()
+            self.db_version = db_version
+            self._checked_at = time.monotonic()
+            self._loaded = True
+            self.version += 1
+
+    def check_due(self, interval: float) -> bool:
+        """True si toca comprobar la versión de la BD (cada `interval` segundos como mucho)"""
+        return self._loaded and time.monotonic() - self._checked_at >= interval
+
+    def reconcile(
+        self,
+        db_version: int,
+        fetch_changes: Callable[[int], tuple[int, Iterable[tuple[str, int, int]], Iterable[str]]]
+    ) -> None:
+        """
+        Aplicar los cambios de otros procesos si la BD está en otra versión. `fetch_changes(desde)`
+        devuelve la versión leída, las filas (username, score, niveles) cambiadas desde entonces
+        y los usernames que ya no existen, todo leído en la misma transacción que `db_version`.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if not self._loaded or db_version == self.db_version:
+                return
+            read_version, rows, removed = fetch_changes(self.db_version)
+            for username in removed:
+                self.remove(username)
+            for username, total_score, levels_completed in rows:
+                self.update(username, total_score, levels_completed)
+            self.db_version = read_version
+
+    def advance(self, before: int, after: int) -> bool:
+        """
+        Registrar una escritura propia: la versión de la BD pasó de `before` a `after`
+        (leídas con el lock de escritura). Si `before` no es la cargada, otro proceso
+        escribió entretanto: se recarga en la siguiente lectura y devuelve False.
+        """
+        with self._lock:
+            if not self._loaded:
+                return False
+            if before != self.db_version:
+                self.invalidate()
+                return False
+            self.db_version = after
+            return True
+
+    def update(self, username: str, total_score: int, levels_completed: int, db_versions: Optional[tuple[int, int]] = None) -> None:
+        """
+        Insertar o actualizar la puntuación de un usuario.
+        db_versions = (antes, después) de la escritura en la BD, ver advance().
+        """
+        with self._lock:
+            if not self._loaded:
+                return  # se leerá de la BD al cargar
+            if db_versions is not None and not self.advance(*db_versions):
+                return
+            total_score = total_score or 0
+            previous = self._entries.get(username)
+            if previous == (total_score, levels_completed):
+                return
+            if previous is not None:
+                self._remove_key(-previous[0], username)
+            self._entries[username] = (total_score, levels_completed)
+            bisect.insort(self._keys, (-total_score, username))
+            self.version += 1
+
+    def rename(self, old_username: str, new_username: str, db_versions: Optional[tuple[int, int]] = None) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            if db_versions is not None and not self.advance(*db_versions):
+                return
+            if old_username not in self._entries:
+                return
+            total_score, levels_completed = self._entries[old_username]
+            self.remove(old_username)
+            self.update(new_username, total_score, levels_completed)
+
+    def remove(self, username: str) -> None:
+        with self._lock:
+            previous = self._entries.pop(username, None)
+            if previous is not None:
+                self._remove_key(-previous[0], username)
+                self.version += 1
+
+    def _remove_key(self, neg_score: int, username: str) -> None:
+        key = (neg_score, username)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def top(self, limit: int = 10) -> list[dict]:
+        """Top N del ranking (limit negativo = todos, como LIMIT -1 en SQLite)"""
+        with self._lock:
+            keys = self._keys if limit < 0 else self._keys[:limit]
+            return [
+                {
+                    'username': username,
+                    'total_score': -neg_score,
+                    'levels_completed': self._entries[username][1]
+                }
+                for neg_score, username in keys
+            ]
+
+    def invalidate(self) -> None:
+        """Forzar recarga completa en la siguiente lectura"""
+        with self._lock:
+            self._loaded = False
+            self._keys = []
+            self._entries = {}
@@ -0,0 +1,101 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from models.user import User
+
+
+class PrincipalCache:
+    """
+    Caché LRU + TTL de usuarios autenticados indexada por token JWT.
+    Un acierto evita tanto el decode del JWT como la lectura en SQLite.
+    Se devuelven copias para que las modificaciones de un request
+    no afecten al resto hasta que se guarden (y se invalide la entrada).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: int = 60):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (user, expires_at)
+        self._tokens_by_user = {}      # username -> set(tokens)
+        self._lock = threading.Lock()
+        self._version = 0  # se incrementa con cada invalidación
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, token: str) -> Optional[User]:
+        """Obtener el usuario asociado a un token si sigue vigente en la caché"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= now:
+                self._remove(token)
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(token)
+            self._stats['hits'] += 1
+            return copy.copy(user)
+
+    def version(self) -> int:
+        """Versión actual; se captura antes de leer de la BD y se pasa a put()"""
+        return self._version
+
+    def put(self, token: str, user: User, token_exp: Optional[float] = None, version: Optional[int] = None) -> None:
+        """
+        Guardar usuario; nunca sobrevive a la expiración del propio token.
+        Si hubo una invalidación desde que se capturó `version`, el usuario
+        leído puede estar desactualizado y no se guarda.
+        """
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (copy.copy(user), expires_at)
+            self._tokens_by_user.setdefault(user.username, set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def invalidate_user(self, username: str) -> None:
+        """Eliminar todas las entradas de un usuario (tras modificar sus datos)"""
+        with self._lock:
+            self._version += 1
+            tokens = self._tokens_by_user.pop(username, None)
+            if not tokens:
+                return
+            for token in tokens:
+                self._entries.pop(token, None)
+            self._stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token: str) -> None:
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.username)
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.username]
+
+    def get_stats(self) -> dict:
+        """Estadísticas de la caché (aciertos, fallos, expulsiones...)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
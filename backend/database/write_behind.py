@@ -0,0 +1,216 @@
+import atexit
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from models.level_progress import LevelProgress
+
+# Intentos de escribir lo pendiente al detener la cola antes de darlo por perdido
+STOP_FLUSH_ATTEMPTS = 5
+
+
+class PendingProgress:
+    """Cambios de progreso de un usuario aún no escritos en la base de datos"""
+
+    __slots__ = ('played', 'daily', 'operations')
+
+    def __init__(self):
+        self.played = LevelProgress()
+        self.daily = None  # fecha "dd-mm-yyyy" del último diario completado
+        self.operations = 0
+
+    def merge(self, newer: 'PendingProgress') -> None:
+        """Añadir los cambios de `newer` (posteriores) a estos"""
+        self.played = self.played.union(newer.played)
+        self.daily = newer.daily or self.daily
+        self.operations += newer.operations
+
+
+class WriteBehindQueue:
+    """
+    Cola write-behind para las marcas de progreso que no tienen condición
+    (niveles jugados y desafío diario); las puntuaciones se escriben siempre
+    al momento, con su UPDATE condicional. Las operaciones se acumulan por
+    usuario, se agrupan (varias marcas del mismo usuario = un UPDATE) y un
+    hilo las escribe en una sola transacción cada `interval_ms` o al llegar
+    a `max_operations`. Mientras tanto, pending_for() permite que este mismo
+    proceso lea sus propias escrituras. Al salir del proceso se vacía la cola
+    (con reintentos). Si el proceso muere de forma abrupta se pierden como
+    mucho los cambios del último intervalo.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[dict], None],
+        interval_ms: float = 50,
+        max_operations: int = 500
+    ):
+        self.flush_fn = flush_fn
+        self.interval = interval_ms / 1000
+        self.max_operations = max(1, max_operations)
+        self._pending = {}   # username -> PendingProgress
+        self._flushing = {}  # lote que se está escribiendo (sigue visible para lecturas)
+        self._operations = 0
+        self.generation = 0  # se incrementa al terminar cada escritura
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'operations': 0, 'flushed_operations': 0, 'flushes': 0, 'errors': 0, 'rows': 0,
+            'max_batch_operations': 0, 'max_batch_users': 0,
+            'flush_time': 0.0, 'max_flush_ms': 0.0, 'last_flush_ms': 0.0
+        }
+
+    def enqueue(self, username: str, update: Callable[[PendingProgress], None]) -> None:
+        """Aplicar `update` a los cambios pendientes del usuario"""
+        with self._lock:
+            pending = self._pending.get(username)
+            if pending is None:
+                pending = self._pending[username] = PendingProgress()
+            update(pending)
+            pending.operations += 1
+            self._operations += 1
+            self._stats['operations'] += 1
+            if self._operations >= self.max_operations:
+                self._wakeup.notify()
+
+    def rename(self, old_username: str, new_username: str) -> None:
+        """Pasar los cambios pendientes de un usuario renombrado a su nuevo username (ver paused)"""
+        with self._lock:
+            pending = self._pending.pop(old_username, None)
+            if pending is None:
+                return
+            newer = self._pending.get(new_username)
+            if newer is not None:
+                pending.merge(newer)
+            self._pending[new_username] = pending
+
+    def pending_for(self, username: str) -> Optional[PendingProgress]:
+        """Cambios de un usuario aún no confirmados en la base de datos (lote en curso + pendientes)"""
+        with self._lock:
+            return self._pending_for(username)
+
+    def _pending_for(self, username: str) -> Optional[PendingProgress]:
+        flushing = self._flushing.get(username)
+        pending = self._pending.get(username)
+        if flushing is None and pending is None:
+            return None
+        combined = PendingProgress()
+        for part in (flushing, pending):
+            if part is not None:
+                combined.merge(part)
+        return combined
+
+    def flush(self) -> int:
+        """Escribir ahora todos los cambios pendientes; devuelve cuántas operaciones se escribieron"""
+        with self._flush_lock:
+            return self._flush()
+
+    @contextmanager
+    def paused(self):
+        """
+        Escribir lo pendiente y no escribir ningún otro lote hasta salir del bloque
+        (p.ej. mientras se renombra un usuario: lo encolado entretanto sigue en la cola)
+        """
+        with self._flush_lock:
+            self._flush()
+            yield
+
+    def _flush(self) -> int:
+        """flush() con _flush_lock ya tomado"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            operations, self._operations = self._operations, 0
+            self._flushing = batch
+        start = time.perf_counter()
+        try:
+            # flush_fn solo debe fallar antes del commit (el lote se reintenta entero)
+            self.flush_fn(batch)
+        except Exception as e:
+            print(f"Error escribiendo cambios pendientes de progreso: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+                # Devolver el lote a la cola por delante de lo llegado mientras tanto
+                for username, newer in self._pending.items():
+                    if username in batch:
+                        batch[username].merge(newer)
+                    else:
+                        batch[username] = newer
+                self._pending = batch
+                self._operations += operations
+                self._flushing = {}
+            return 0
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._flushing = {}
+            self.generation += 1
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['flushed_operations'] += operations
+            stats['rows'] += len(batch)
+            stats['max_batch_operations'] = max(stats['max_batch_operations'], operations)
+            stats['max_batch_users'] = max(stats['max_batch_users'], len(batch))
+            stats['flush_time'] += elapsed_ms / 1000
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], elapsed_ms)
+            stats['last_flush_ms'] = elapsed_ms
+        return operations
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                if self._operations < self.max_operations:
+                    self._wakeup.wait(self.interval)
+            self.flush()
+
+    def start(self) -> None:
+        """Arrancar el hilo de escritura y vaciar la cola al salir del proceso"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> bool:
+        """
+        Detener el hilo y escribir lo pendiente, reintentando si falla.
+        Devuelve False (y lo avisa por stderr) si quedaron cambios sin escribir.
+        """
+        self._stop.set()
+        with self._lock:
+            self._wakeup.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        for attempt in range(STOP_FLUSH_ATTEMPTS):
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.1 * 2 ** attempt)
+        with self._lock:
+            users, operations = sorted(self._pending), self._operations
+        print(
+            f"ERROR: no se pudieron escribir {operations} cambios de progreso pendientes "
+            f"tras {STOP_FLUSH_ATTEMPTS} intentos; se pierden los de: {', '.join(users)}",
+            file=sys.stderr
+        )
+        return False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending_users'] = len(self._pending)
+            stats['pending_operations'] = self._operations
+        flushes = stats['flushes']
+        stats['avg_batch_operations'] = round(stats['flushed_operations'] / flushes, 2) if flushes else 0.0
+        stats['avg_batch_users'] = round(stats['rows'] / flushes, 2) if flushes else 0.0
+        stats['avg_flush_ms'] = round(stats.pop('flush_time') * 1000 / flushes, 3) if flushes else 0.0
+        stats['max_flush_ms'] = round(stats['max_flush_ms'], 3)
+        stats['last_flush_ms'] = round(stats['last_flush_ms'], 3)
+        return stats
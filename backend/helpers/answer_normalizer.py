@@ -0,0 +1,39 @@
+"""
+Normalización de títulos y respuestas para comparar canciones.
+
+Los patrones se compilan una sola vez al importar el módulo. Además de los
+pasos que ya aplicaba GameService._clean_title, se eliminan tildes y
+diacríticos para que "cancion" coincida con "Canción".
+"""
+import re
+import unicodedata
+
+# Contenido entre paréntesis o corchetes (ej: (Remix), [Live])
+_BRACKETS_RE = re.compile(r'[\(\[].*?[\)\]]')
+# Un guion y todo lo que sigue
+_DASH_RE = re.compile(r'-.*')
+# "feat." y todo lo que sigue
+_FEAT_RE = re.compile(r'\b(feat|ft|featuring)\b.*')
+# Espacios repetidos
+_SPACES_RE = re.compile(r'\s+')
+
+
+def fold_accents(text: str) -> str:
+    """Eliminar tildes y diacríticos ("Canción" -> "Cancion", "niño" -> "nino")"""
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_title(title: str) -> str:
+    """Normalizar un título o una respuesta para su comparación"""
+    # Convertir a minúsculas y quitar diacríticos
+    title = fold_accents(title.lower())
+    title = _BRACKETS_RE.sub('', title)
+    title = _DASH_RE.sub('', title)
+    title = _FEAT_RE.sub('', title)
+    # Reemplazar guiones bajos por espacios
+    title = title.replace('_', ' ')
+    # Eliminar espacios extra
+    return _SPACES_RE.sub(' ', title).strip()
@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directorio de los audios locales (relativo al directorio de trabajo, como DATABASE_PATH)
+AUDIO_STORE_PATH = os.getenv("AUDIO_STORE_PATH", "audio_store")
+# Ruta pública desde la que se sirven (ver game_controller)
+AUDIO_URL_PATH = '/api/v1/audio/'
+# URL pública de la API (p.ej. "https://api.example.com"). Si no se indica, la URL del
+# audio es relativa y el frontend la resuelve con su environment.apiUrl. Nunca se usa
+# la cabecera Host de la petición: la controla el cliente.
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+_DATA_URI_RE = re.compile(r'^data:([\w.+-]+/[\w.+-]+)?((?:;[^;,]*)*?);base64,', re.IGNORECASE)
+
+
+class AudioStore:
+    """
+    Almacén en disco de audios direccionado por contenido: cada archivo se
+    guarda con el SHA-256 de sus bytes como nombre (repartido en
+    subdirectorios por los dos primeros caracteres). El mismo audio se guarda
+    una sola vez y un hash nunca cambia de contenido, así que puede cachearse
+    sin límite de tiempo.
+    """
+
+    def __init__(self, root: str = AUDIO_STORE_PATH):
+        self.root = root
+
+    def put(self, data: bytes) -> str:
+        """Guardar un audio (si no existía ya) y devolver su hash"""
+        audio_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(audio_hash)
+        if os.path.exists(path):
+            return audio_hash
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Escribir en un temporal y renombrar: nunca se sirve un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return audio_hash
+
+    def put_data_uri(self, data_uri: str) -> tuple[str, str]:
+        """Guardar un audio en formato data:audio/...;base64,...; devuelve (hash, tipo MIME)"""
+        data, mime = decode_data_uri(data_uri)
+        return self.put(data), mime
+
+    def restore(self, audio_hash: str, data_uri: str) -> bool:
+        """Volver a crear el archivo de un hash a partir de su data URI (si de verdad es ese audio)"""
+        try:
+            data, _ = decode_data_uri(data_uri)
+        except ValueError:
+            return False
+        if hashlib.sha256(data).hexdigest() != audio_hash:
+            return False
+        self.put(data)
+        return True
+
+    @staticmethod
+    def is_valid_hash(audio_hash: str) -> bool:
+        return bool(audio_hash and _HASH_RE.match(audio_hash))
+
+    def path_for(self, audio_hash: str) -> Optional[str]:
+        """Ruta del archivo de un hash, o None si el hash no es válido o no está en el almacén"""
+        if not self.is_valid_hash(audio_hash):
+            return None
+        path = self._path(audio_hash)
+        return path if os.path.isfile(path) else None
+
+    def _path(self, audio_hash: str) -> str:
+        return os.path.join(os.path.abspath(self.root), audio_hash[:2], audio_hash)
+
+
+def decode_data_uri(data_uri: str) -> tuple[bytes, str]:
+    """Bytes y tipo MIME de un audio en formato data:audio/...;base64,..."""
+    match = _DATA_URI_RE.match(data_uri)
+    if not match:
+        raise ValueError("El audio no es una data URI en base64")
+    try:
+        data = base64.b64decode(data_uri[match.end():], validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Base64 inválido: {e}")
+    if not data:
+        raise ValueError("Audio vacío")
+    return data, (match.group(1) or 'audio/mpeg').lower()
+
+
+def audio_url_path(audio_hash: str) -> str:
+    """Ruta (sin host) desde la que se sirve un audio del almacén"""
+    return AUDIO_URL_PATH + audio_hash
+
+
+def public_audio_url(audio_hash: str) -> str:
+    """URL del audio para el cliente: absoluta con PUBLIC_BASE_URL, si no relativa a la API"""
+    return PUBLIC_BASE_URL + audio_url_path(audio_hash)
+
+
+# Instancia global
+audio_store = AudioStore()
@@ -0,0 +1,168 @@
+"""
+Compresión de respuestas HTTP según Accept-Encoding (gzip y deflate de la
+librería estándar; brotli solo si el paquete está instalado). Las respuestas
+pequeñas, las parciales (206), las 304 y los archivos servidos con
+send_file no se comprimen. Los cuerpos de la caché de respuestas
+(EncodedResponse) guardan su variante comprimida, de modo que cada nivel se
+comprime una sola vez (la variante cuenta en el límite de bytes de la
+caché). Se llevan estadísticas de bytes y tiempo de CPU por endpoint.
+"""
+import gzip
+import os
+import threading
+import time
+import zlib
+from typing import Optional
+from dotenv import load_dotenv
+from flask import Response, request
+
+from helpers.response_cache import EncodedResponse
+
+try:
+    import brotli  # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+# Por debajo de este tamaño no compensa comprimir (cabeceras + CPU)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+
+COMPRESSIBLE_MIMETYPES = frozenset({'application/json', 'application/javascript', 'image/svg+xml'})
+# Por orden de preferencia cuando el cliente acepta varias con la misma calidad
+ENCODINGS = (('br',) if brotli else ()) + ('gzip', 'deflate')
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        # mtime=0: misma entrada, mismos bytes (la variante es cacheable)
+        return gzip.compress(body, COMPRESSION_LEVEL, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(body, COMPRESSION_LEVEL)
+    if encoding == 'br' and brotli:
+        return brotli.compress(body, quality=min(COMPRESSION_LEVEL, 11))
+    raise ValueError(f"Codificación no soportada: {encoding}")
+
+
+def etag_variants(etag: str) -> list[str]:
+    """ETags posibles de un recurso: la del cuerpo sin comprimir y la de cada codificación"""
+    return [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]
+
+
+def is_compressible(response: Response) -> bool:
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+class CompressionStats:
+    """Bytes enviados y tiempo de CPU de compresión por endpoint"""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        endpoint: Optional[str],
+        bytes_in: int,
+        bytes_out: int,
+        compressed: bool = False,
+        variant_hit: bool = False,
+        cpu_seconds: float = 0.0
+    ) -> None:
+        with self._lock:
+            stats = self._endpoints.get(endpoint or 'other')
+            if stats is None:
+                stats = self._endpoints[endpoint or 'other'] = {
+                    'responses': 0, 'compressed': 0, 'variant_hits': 0,
+                    'bytes_in': 0, 'bytes_out': 0, 'cpu_time': 0.0
+                }
+            stats['responses'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['cpu_time'] += cpu_seconds
+            if compressed:
+                stats['compressed'] += 1
+            if variant_hit:
+                stats['variant_hits'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            endpoints = {name: dict(stats) for name, stats in self._endpoints.items()}
+        for stats in endpoints.values():
+            stats['saved_bytes'] = stats['bytes_in'] - stats['bytes_out']
+            stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 4) if stats['bytes_in'] else 1.0
+            stats['cpu_ms'] = round(stats.pop('cpu_time') * 1000, 3)
+        return {'enabled': COMPRESSION_ENABLED, 'encodings': list(ENCODINGS), 'endpoints': endpoints}
+
+
+compression_stats = CompressionStats()
+
+
+def _negotiate(response: Response, size: int) -> Optional[str]:
+    """Codificación a usar para esta respuesta (None = enviarla tal cual)"""
+    if (
+        not COMPRESSION_ENABLED
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or not is_compressible(response)
+        or size < COMPRESSION_MIN_BYTES
+    ):
+        return None
+    # El contenido depende de Accept-Encoding aunque este cliente no comprima
+    response.vary.add('Accept-Encoding')
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def _set_body(response: Response, body: bytes, encoding: str) -> None:
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # Otra representación: otra ETag (ver etag_variants)
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+
+def encoded_response(encoded: EncodedResponse, status: int = 200, mimetype: str = 'application/json') -> Response:
+    """
+    Respuesta para un cuerpo de la caché de respuestas: la variante comprimida
+    se calcula la primera vez y se guarda junto al cuerpo.
+    """
+    response = Response(encoded.body, status=status, mimetype=mimetype)
+    response.set_etag(encoded.etag)
+    encoding = _negotiate(response, len(encoded.body))
+    if encoding is None:
+        return response
+    body = encoded.variants.get(encoding)
+    variant_hit = body is not None
+    start = time.thread_time()
+    if body is None:
+        body = encoded.add_variant(encoding, compress(encoded.body, encoding))
+    cpu_seconds = time.thread_time() - start
+    _set_body(response, body, encoding)
+    compression_stats.record(request.endpoint, len(encoded.body), len(body), True, variant_hit, cpu_seconds)
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """after_request: comprimir la respuesta si el cliente lo acepta y merece la pena"""
+    if 'Content-Encoding' in response.headers:
+        return response  # ya comprimida (y contabilizada) por encoded_response
+    if response.direct_passthrough or response.is_streamed:
+        # Archivos (send_file): se cuentan los bytes, no se comprimen
+        compression_stats.record(request.endpoint, response.content_length or 0, response.content_length or 0)
+        return response
+    size = response.content_length or 0
+    encoding = _negotiate(response, size)
+    if encoding is None:
+        compression_stats.record(request.endpoint, size, size)
+        return response
+    start = time.thread_time()
+    body = compress(response.get_data(), encoding)
+    cpu_seconds = time.thread_time() - start
+    _set_body(response, body, encoding)
+    compression_stats.record(request.endpoint, size, len(body), True, False, cpu_seconds)
+    return response
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GENRE_CACHE_SIZE = int(os.getenv("GENRE_CACHE_SIZE", 2048))
+GENRE_CACHE_TTL = int(os.getenv("GENRE_CACHE_TTL", 30 * 24 * 3600))
+# Artistas sin géneros en Spotify: se vuelve a preguntar antes
+GENRE_CACHE_NEGATIVE_TTL = int(os.getenv("GENRE_CACHE_NEGATIVE_TTL", 7 * 24 * 3600))
+
+
+class ArtistGenreCache:
+    """
+    Caché de géneros por id de artista: LRU en memoria respaldada por un
+    almacén persistente (la tabla artist_genres de SQLite), con TTL. Guarda
+    también los artistas sin géneros (genre = None) para no volver a
+    pedirlos a Spotify.
+    `load_fn(artist_id)` devuelve (género, fetched_at) o None y
+    `save_fn(artist_id, género, fetched_at)` lo guarda.
+    """
+
+    def __init__(
+        self,
+        load_fn: Callable[[str], Optional[tuple[Optional[str], int]]],
+        save_fn: Callable[[str, Optional[str], int], None],
+        max_size: int = GENRE_CACHE_SIZE,
+        ttl: int = GENRE_CACHE_TTL,
+        negative_ttl: int = GENRE_CACHE_NEGATIVE_TTL
+    ):
+        self.load_fn = load_fn
+        self.save_fn = save_fn
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # artist_id -> (genre, fetched_at)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'negative_hits': 0, 'misses': 0}
+
+    def _is_fresh(self, genre: Optional[str], fetched_at: int) -> bool:
+        ttl = self.ttl if genre else self.negative_ttl
+        return fetched_at + ttl > time.time()
+
+    def get(self, artist_id: str) -> tuple[bool, Optional[str]]:
+        """Devuelve (encontrado, género). Encontrado con género None = artista sin géneros"""
+        with self._lock:
+            entry = self._entries.get(artist_id)
+            if entry and self._is_fresh(*entry):
+                self._entries.move_to_end(artist_id)
+                self._stats['memory_hits'] += 1
+                if entry[0] is None:
+                    self._stats['negative_hits'] += 1
+                return True, entry[0]
+
+        entry = self.load_fn(artist_id)
+        if entry and self._is_fresh(*entry):
+            self._remember(artist_id, *entry)
+            with self._lock:
+                self._stats['db_hits'] += 1
+                if entry[0] is None:
+                    self._stats['negative_hits'] += 1
+            return True, entry[0]
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return False, None
+
+    def put(self, artist_id: str, genre: Optional[str]) -> None:
+        """Guardar el género de un artista (None si Spotify no devuelve ninguno)"""
+        fetched_at = int(time.time())
+        self._remember(artist_id, genre, fetched_at)
+        self.save_fn(artist_id, genre, fetched_at)
+
+    def _remember(self, artist_id: str, genre: Optional[str], fetched_at: int) -> None:
+        with self._lock:
+            self._entries[artist_id] = (genre, fetched_at)
+            self._entries.move_to_end(artist_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        return stats
@@ -0,0 +1,59 @@
+from typing import Callable, Optional
+
+from flask import Response, request
+
+from helpers.compression import etag_variants
+
+# Cache-Control por tipo de respuesta
+# - no-cache: el navegador guarda la respuesta pero la revalida siempre (If-None-Match -> 304)
+PUBLIC_REVALIDATE = 'public, no-cache'
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+
+def matching_etag(etag: str) -> Optional[str]:
+    """
+    ETag que el cliente ya tiene (en If-None-Match) de la versión `etag` del recurso:
+    la del cuerpo sin comprimir o la de alguna de sus variantes comprimidas.
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return etag
+    for candidate in etag_variants(etag):
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def add_validators(response: Response, etag: str, cache_control: str, vary: Optional[str] = None) -> Response:
+    """Añadir ETag (si la representación no trae ya la suya) y Cache-Control a una respuesta correcta"""
+    if not response.get_etag()[0]:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if vary:
+        response.vary.add(vary)
+    return response
+
+
+def conditional_response(
+    etag: Optional[str],
+    cache_control: str,
+    build: Callable[[], Response],
+    vary: Optional[str] = None
+) -> Response:
+    """
+    Responder 304 sin cuerpo si el cliente ya tiene la versión `etag`; si no,
+    construir la respuesta con `build` y, si es un 200, añadirle los validadores.
+    Con etag None se responde sin validadores.
+    """
+    if etag is None:
+        return build()
+    matched = matching_etag(etag)
+    if matched:
+        response = add_validators(Response(status=304), matched, cache_control, vary)
+        if matched != etag:
+            response.vary.add('Accept-Encoding')
+        return response
+    response = build()
+    if response.status_code == 200:
+        add_validators(response, etag, cache_control, vary)
+    return response
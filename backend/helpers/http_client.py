@@ -0,0 +1,172 @@
+"""
+Cliente HTTP compartido para todo el tráfico saliente (Spotify API, cuentas
+de Spotify y páginas embed). Usa una única requests.Session con un pool de
+conexiones keep-alive, de modo que las llamadas reutilizan conexiones TCP+TLS
+en lugar de abrir una nueva cada vez. Las peticiones idempotentes (GET, HEAD)
+se reintentan con backoff exponencial ante errores de conexión, 429 y 5xx.
+La espera que pide un Retry-After se limita (HTTP_MAX_RETRY_AFTER): las
+llamadas se hacen dentro de peticiones de Flask y no deben bloquearlas minutos.
+"""
+import os
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 20))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.3))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+# Segundos máximos de espera por un Retry-After antes de reintentar
+HTTP_MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER", 2))
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CappedRetry(Retry):
+    """Retry de urllib3 que no espera más de `max_retry_after` segundos por un Retry-After"""
+
+    def __init__(self, *args, max_retry_after: float = HTTP_MAX_RETRY_AFTER, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs) -> 'CappedRetry':
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+
+class _CountingPoolMixin:
+    """Pool de urllib3 que avisa cada vez que abre una conexión nueva"""
+
+    on_new_connection = None  # (host, port) -> None
+
+    def _new_conn(self):
+        connection = super()._new_conn()
+        self.on_new_connection(self.host, self.port)
+        return connection
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter que cuenta las conexiones que abren sus pools. El recuento
+    lo lleva quien lo crea, así que sobrevive a que el PoolManager descarte
+    un pool al superar pool_connections hosts.
+    """
+
+    def __init__(self, on_new_connection: Callable[[str, Optional[int]], None], **kwargs):
+        self.on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = staticmethod(self.on_new_connection)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(f"Counting{pool_cls.__name__}", (_CountingPoolMixin, pool_cls), {
+                'on_new_connection': on_new_connection
+            })
+            for scheme, pool_cls in (('http', HTTPConnectionPool), ('https', HTTPSConnectionPool))
+        }
+
+
+class HttpClient:
+    """Sesión HTTP con pool de conexiones, reintentos y estadísticas por host"""
+
+    def __init__(
+        self,
+        pool_connections: int = HTTP_POOL_CONNECTIONS,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        retries: int = HTTP_RETRIES,
+        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+        timeout: float = HTTP_TIMEOUT,
+        max_retry_after: float = HTTP_MAX_RETRY_AFTER
+    ):
+        self.timeout = timeout
+        retry = CappedRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+            max_retry_after=max_retry_after
+        )
+        self.adapter = CountingHTTPAdapter(
+            self._count_connection,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._lock = threading.Lock()
+        self._stats = {}  # host -> contadores
+        self._connections = {}  # host -> conexiones abiertas
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Realizar una petición con la sesión compartida (timeout por defecto incluido)"""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        error = False
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 400
+            return response
+        except requests.RequestException:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._stats.setdefault(host, {'requests': 0, 'errors': 0, 'total_time': 0.0})
+                stats['requests'] += 1
+                stats['errors'] += int(error)
+                stats['total_time'] += elapsed
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _count_connection(self, host: str, port: Optional[int]) -> None:
+        if port not in (None, 80, 443):
+            host = f"{host}:{port}"
+        with self._lock:
+            self._connections[host] = self._connections.get(host, 0) + 1
+
+    def get_stats(self) -> dict:
+        """Peticiones, errores, tiempo medio y conexiones abiertas (desde el arranque) por host"""
+        with self._lock:
+            stats = {host: dict(values) for host, values in self._stats.items()}
+            connections_by_host = dict(self._connections)
+        for host, connections in connections_by_host.items():
+            stats.setdefault(host, {'requests': 0, 'errors': 0, 'total_time': 0.0})['connections_opened'] = connections
+        for values in stats.values():
+            requests_count = values['requests']
+            values['avg_ms'] = round(values['total_time'] * 1000 / requests_count, 2) if requests_count else 0.0
+            values['total_time'] = round(values['total_time'], 4)
+            values.setdefault('connections_opened', 0)
+        return stats
+
+
+# Instancia global
+http_client = HttpClient()
@@ -0,0 +1,210 @@
+"""
+Hashing de contraseñas con bcrypt fuera del hilo de la petición.
+
+Los hashes se calculan en un pool de procesos (uno por núcleo por defecto),
+así un pico de registros o logins reparte el trabajo de CPU entre todos los
+núcleos en lugar de competir con el resto de peticiones del mismo proceso.
+El coste (rounds) se configura con BCRYPT_ROUNDS o se calibra para que un
+hash tarde como mucho BCRYPT_TARGET_MS milisegundos.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import bcrypt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_DEFAULT_ROUNDS = 12
+# Coste mínimo, también para BCRYPT_ROUNDS (la calibración en un equipo lento no baja de aquí)
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", 12))
+BCRYPT_MAX_ROUNDS = 16
+# Coste fijo; si no se indica y hay BCRYPT_TARGET_MS, se calibra al primer uso
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = os.getenv("BCRYPT_TARGET_MS")
+# Procesos del pool (0 = calcular en el propio hilo de la petición)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 30))
+
+# $2b$12$<salt+hash>
+BCRYPT_COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PasswordHashTimeout(Exception):
+    """El pool de hashing no respondió a tiempo (saturado); la petición puede reintentarse"""
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def get_cost(hashed: str) -> Optional[int]:
+    """Coste (rounds) de un hash bcrypt, o None si no tiene el formato esperado"""
+    match = BCRYPT_COST_PATTERN.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """Hashear y verificar contraseñas en un pool de procesos, con coste configurable"""
+
+    def __init__(
+        self,
+        rounds: Optional[int] = None,
+        target_ms: Optional[float] = None,
+        workers: int = PASSWORD_HASH_WORKERS,
+        timeout: float = PASSWORD_HASH_TIMEOUT
+    ):
+        self._rounds = min(max(rounds, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS) if rounds else None
+        self.target_ms = target_ms
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'inline': 0, 'pool_errors': 0, 'timeouts': 0, 'total_time': 0.0}
+
+    @property
+    def rounds(self) -> int:
+        """Coste actual; se calibra la primera vez si solo hay latencia objetivo"""
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    self._rounds = self.calibrate(self.target_ms) if self.target_ms else BCRYPT_DEFAULT_ROUNDS
+                    print(f"Coste de bcrypt: {self._rounds} rounds")
+        return self._rounds
+
+    def calibrate(self, target_ms: float) -> int:
+        """
+        Mayor coste cuyo hash tarda como mucho target_ms en este equipo
+        (cada round adicional duplica el tiempo). Nunca baja de BCRYPT_MIN_ROUNDS.
+        """
+        rounds = BCRYPT_MIN_ROUNDS
+        start = time.perf_counter()
+        _hashpw(b'calibration', rounds)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        while rounds < BCRYPT_MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+            rounds += 1
+            elapsed_ms *= 2
+        return rounds
+
+    def hash_password(self, password: str) -> str:
+        """Hash bcrypt de la contraseña con el coste configurado"""
+        hashed = self._run('hashes', _hashpw, password.encode('utf-8'), self.rounds)
+        return hashed.decode('utf-8')
+
+    def hash_passwords(self, passwords: list[str]) -> list[str]:
+        """Hashear muchas contraseñas repartiéndolas entre los procesos del pool (registros masivos)"""
+        rounds = self.rounds
+        encoded = [password.encode('utf-8') for password in passwords]
+        executor = self._get_executor()
+        start = time.perf_counter()
+        if executor is None:
+            hashes = [_hashpw(password, rounds) for password in encoded]
+        else:
+            chunksize = max(1, len(encoded) // (self.workers * 4))
+            hashes = list(executor.map(_hashpw, encoded, [rounds] * len(encoded), chunksize=chunksize))
+        with self._lock:
+            self._stats['hashes'] += len(encoded)
+            self._stats['inline'] += len(encoded) if executor is None else 0
+            self._stats['total_time'] += time.perf_counter() - start
+        return [hashed.decode('utf-8') for hashed in hashes]
+
+    def check_password(self, password: str, hashed: str) -> bool:
+        """Comprobar una contraseña contra su hash bcrypt"""
+        try:
+            return self._run('checks', _checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        except ValueError:
+            # Hash con formato inválido
+            return False
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """
+        True si el hash se generó con un coste menor que el actual. Un hash más
+        costoso se conserva: rehashearlo lo debilitaría (p. ej. si la calibración
+        da menos rounds en un equipo más lento).
+        """
+        cost = get_cost(hashed)
+        return cost is None or cost < self.rounds
+
+    def record_rehash(self) -> None:
+        with self._lock:
+            self._stats['rehashes'] += 1
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, counter: str, fn, *args):
+        """
+        Ejecutar fn en el pool de procesos; si el pool está roto, se recrea y se calcula
+        en este hilo. Si no responde en `timeout` (saturado), lanza PasswordHashTimeout
+        sin tocar el pool: el resto de peticiones en cola siguen su curso.
+        """
+        start = time.perf_counter()
+        inline = False
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                inline = True
+                return fn(*args)
+            try:
+                future = executor.submit(fn, *args)
+                return future.result(self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PasswordHashTimeout(
+                    f"El hashing de contraseñas no respondió en {self.timeout:g} s"
+                ) from None
+            except BrokenProcessPool as e:
+                # Un proceso del pool murió: recrear el pool y no bloquear el login, calcular aquí
+                print(f"Error en el pool de hashing, se calcula en el hilo actual: {e}")
+                with self._lock:
+                    self._stats['pool_errors'] += 1
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                inline = True
+                return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats[counter] += 1
+                self._stats['inline'] += int(inline)
+                self._stats['total_time'] += elapsed
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        operations = stats['hashes'] + stats['checks']
+        stats['avg_ms'] = round(stats.pop('total_time') * 1000 / operations, 2) if operations else 0.0
+        stats['rounds'] = self._rounds
+        stats['workers'] = self.workers
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instancia global
+password_hasher = PasswordHasher(
+    rounds=int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else None,
+    target_ms=float(BCRYPT_TARGET_MS) if BCRYPT_TARGET_MS else None
+)
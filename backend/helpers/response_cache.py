@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tamaño máximo total (en bytes) de las respuestas cacheadas
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Respuestas más grandes que esto no se cachean (p.ej. audios locales enormes)
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", 8 * 1024 * 1024))
+
+
+def encode_json(payload) -> bytes:
+    """Codificar una respuesta JSON (compacta y en UTF-8, como la que se cachea)"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class EncodedResponse:
+    """
+    Cuerpo de respuesta ya codificado junto con su ETag (hash del cuerpo, se calcula una vez)
+    y sus variantes comprimidas (codificación -> bytes, ver helpers/compression.py).
+    """
+
+    __slots__ = ('body', 'etag', 'variants', '_cache')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {}
+        self._cache = None  # ResponseCache que la contiene (ver ResponseCache.put)
+
+    @classmethod
+    def from_payload(cls, payload) -> 'EncodedResponse':
+        return cls(encode_json(payload))
+
+    @property
+    def size(self) -> int:
+        """Bytes que ocupa: el cuerpo más sus variantes comprimidas"""
+        return len(self.body) + sum(len(body) for body in self.variants.values())
+
+    def add_variant(self, encoding: str, body: bytes) -> bytes:
+        """
+        Guardar una variante comprimida. Si la respuesta está en una caché, se cuenta
+        en su límite de bytes. Devuelve la variante guardada (la de otro hilo si se adelantó).
+        """
+        cache = self._cache
+        if cache is None:
+            return self.variants.setdefault(encoding, body)
+        return cache.add_variant(self, encoding, body)
+
+
+class ResponseCache:
+    """
+    Caché LRU de cuerpos de respuesta ya codificados, limitada por bytes
+    (no por número de entradas): un nivel local con el audio incrustado
+    ocupa mucho más que uno de Spotify. Un acierto evita la consulta a
+    SQLite, construir el objeto y volver a serializarlo. El límite cuenta
+    el cuerpo y las variantes comprimidas que se le añaden después.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max(0, max_bytes)
+        self.max_entry_bytes = min(max_entry_bytes, self.max_bytes)
+        self._entries = OrderedDict()  # clave -> EncodedResponse
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._version = 0  # se incrementa con cada invalidación
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'too_large': 0}
+
+    def get(self, key: Hashable) -> Optional[EncodedResponse]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return response
+
+    def __contains__(self, key: Hashable) -> bool:
+        """¿Está en la caché? (sin contar acierto ni fallo ni cambiar el orden LRU)"""
+        with self._lock:
+            return key in self._entries
+
+    def version(self) -> int:
+        """Versión actual; se captura antes de leer de la BD y se pasa a put()"""
+        return self._version
+
+    def put(self, key: Hashable, response: EncodedResponse, version: Optional[int] = None) -> bool:
+        """
+        Guardar una respuesta ya codificada. Si hubo una invalidación desde que se
+        capturó `version`, lo leído puede estar desactualizado y no se guarda.
+        """
+        size = response.size
+        with self._lock:
+            if version is not None and version != self._version:
+                return False
+            if size > self.max_entry_bytes:
+                self._stats['too_large'] += 1
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._release(old)
+            self._entries[key] = response
+            response._cache = self
+            self._bytes += size
+            self._evict()
+            return True
+
+    def add_variant(self, response: EncodedResponse, encoding: str, body: bytes) -> bytes:
+        """Añadir una variante comprimida a una respuesta cacheada (ver EncodedResponse.add_variant)"""
+        with self._lock:
+            existing = response.variants.get(encoding)
+            if existing is not None:
+                return existing
+            response.variants[encoding] = body
+            if response._cache is self:
+                self._bytes += len(body)
+                self._evict()
+            return body
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._version += 1
+            response = self._entries.pop(key, None)
+            if response is not None:
+                self._release(response)
+                self._stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            for response in self._entries.values():
+                response._cache = None
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self) -> None:
+        """Expulsar las entradas menos usadas hasta volver al límite (con el lock tomado)"""
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._release(evicted)
+            self._stats['evictions'] += 1
+
+    def _release(self, response: EncodedResponse) -> None:
+        """Descontar una entrada ya sacada de _entries (con el lock tomado)"""
+        self._bytes -= response.size
+        response._cache = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def spotify_level_key(level_id: int, spotify_id: Optional[str] = None) -> tuple:
+    """
+    Clave de un nivel de Spotify en level_response_cache. La del nivel diario (0) incluye
+    la canción: otro proceso puede rotarla y esta caché es propia de cada proceso.
+    """
+    if level_id == 0:
+        return ('spotify', 0, spotify_id)
+    return ('spotify', level_id)
+
+
+# Respuestas de /songs/<level_id>, con clave (modo, nivel): ('spotify', 5) o ('local', 5)
+# (ver spotify_level_key para el nivel diario)
+level_response_cache = ResponseCache()
@@ -0,0 +1,71 @@
+"""
+Comparación acotada de similitud entre respuesta y título.
+
+Decide lo mismo que `SequenceMatcher(None, a, b).ratio() >= threshold`,
+pero descarta antes de calcular el ratio completo usando cotas superiores
+del propio ratio (las mismas que real_quick_ratio y quick_ratio de difflib):
+1. Longitudes: 2 * min(la, lb) / (la + lb).
+2. Caracteres en común, cortando en cuanto hay demasiados fallos para
+   alcanzar el umbral.
+Solo los candidatos que superan ambas cotas pagan el SequenceMatcher completo.
+"""
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+SIMILARITY_THRESHOLD = 0.85
+# Respuestas más largas que esto (sin normalizar) se rechazan directamente
+MAX_ANSWER_LENGTH = 500
+
+
+@lru_cache(maxsize=2048)
+def _char_counts(title: str) -> Counter:
+    """Recuento de caracteres del título (se calcula una vez por título)"""
+    return Counter(title)
+
+
+def _ratio(matches: int, total: int) -> float:
+    # Misma fórmula que difflib para que las comparaciones sean idénticas
+    return 2.0 * matches / total
+
+
+def _min_matches(total: int, threshold: float) -> int:
+    """Mínimo de coincidencias para que el ratio alcance el umbral"""
+    needed = int(threshold * total / 2)
+    while needed > 0 and _ratio(needed - 1, total) >= threshold:
+        needed -= 1
+    while _ratio(needed, total) < threshold:
+        needed += 1
+    return needed
+
+
+def is_similar(answer: str, title: str, threshold: float = SIMILARITY_THRESHOLD) -> bool:
+    """True si SequenceMatcher(None, answer, title).ratio() >= threshold"""
+    total = len(answer) + len(title)
+    if total == 0:
+        return 1.0 >= threshold  # difflib devuelve 1.0 para dos cadenas vacías
+
+    # Cota 1: longitudes
+    shortest = min(len(answer), len(title))
+    if _ratio(shortest, total) < threshold:
+        return False
+
+    # Cota 2: caracteres en común (con salida temprana)
+    needed = _min_matches(total, threshold)
+    if needed > shortest:
+        return False
+    allowed_misses = len(answer) - needed
+    available = _char_counts(title)
+    used = {}
+    misses = 0
+    for ch in answer:
+        count = used.get(ch, 0)
+        if count < available.get(ch, 0):
+            used[ch] = count + 1
+        else:
+            misses += 1
+            if misses > allowed_misses:
+                return False
+
+    # Comprobación completa
+    return SequenceMatcher(None, answer, title).ratio() >= threshold
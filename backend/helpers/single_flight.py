@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import Executor, Future, TimeoutError
+from typing import Any, Callable, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Agrupar llamadas concurrentes con la misma clave: solo la primera
+    ejecuta la función y el resto espera (con límite de tiempo) a su resultado.
+    """
+
+    def __init__(self):
+        self._calls = {}  # clave -> Future de la llamada en curso
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Ejecutar fn() o esperar al resultado de la llamada en curso con la misma clave.
+        Lanza TimeoutError si la espera supera `timeout` segundos.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self._stats['executed'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def submit(self, key: Hashable, fn: Callable[[], Any], executor: Executor) -> Future:
+        """
+        Versión no bloqueante de do(): devuelve el Future de la llamada en curso
+        con la misma clave o lanza fn() en `executor`. Pensado para código
+        asíncrono (asyncio.wrap_future).
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                return future
+            future = Future()
+            self._calls[key] = future
+            self._stats['executed'] += 1
+
+        def run():
+            try:
+                result = fn()
+            except BaseException as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+
+        try:
+            executor.submit(run)
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_exception(e)
+        return future
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
@@ -1,6 +1,8 @@
-import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from helpers.spotify_preview import get_spotify_preview_url
+from helpers.genre_cache import ArtistGenreCache
+from helpers.http_client import http_client
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -8,11 +10,21 @@ from models.song import Song
 
 load_dotenv()
 
+# Máximo de ids por petición en /tracks?ids= y /artists?ids=
+MAX_IDS_PER_REQUEST = 50
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 class SpotifyHelper:
     """Helper para interactuar con la API de Spotify"""
 
-    def __init__(self):
+    def __init__(self, genre_cache: ArtistGenreCache):
         self.api_url = os.getenv("SPOTIFY_API_URL")
+        self.genre_cache = genre_cache
 
     def get_track_info(
         self, spotify_track_id: str, access_token: str
@@ -22,7 +34,7 @@ class SpotifyHelper:
         """
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(
+            response = http_client.get(
                 f"{self.api_url}/tracks/{spotify_track_id}", headers=headers
             )
 
@@ -32,53 +44,138 @@ class SpotifyHelper:
 
             track = response.json()
 
-            # Extraer información relevante
-            title = track["name"]
-            artists = ", ".join([artist["name"] for artist in track["artists"]])
-            album = track["album"]["name"]
-            year = int(track["album"]["release_date"][:4])
-
             # Género (requiere llamada adicional a artista)
             genre = self.get_track_genre(track["artists"][0]["id"], access_token)
 
             # Preview URL usando spotify_preview
             audio = get_spotify_preview_url(spotify_track_id)
 
-            # Imagen del álbum
-            image_url = (
-                track["album"]["images"][0]["url"] if track["album"]["images"] else ""
-            )
-
-            # Construir objeto Song
-            song = Song(
-                id=spotify_track_id,
-                title=title,
-                artists=artists,
-                album=album,
-                year=year,
-                genre=genre or "Unknown",
-                audio=audio,
-                image_url=image_url,
-                level_id=-999,  # level_id temporal, se asignará en game_service.py > get_level_song
-            )
-            return song
+            return self._build_song(spotify_track_id, track, genre, audio)
 
         except Exception as e:
             print(f"Error obteniendo track de Spotify: {e}")
             return None
 
+    def _build_song(self, spotify_track_id: str, track: dict, genre: Optional[str], audio: Optional[str]) -> Song:
+        """Construir objeto Song a partir del JSON de un track"""
+        # Extraer información relevante
+        title = track["name"]
+        artists = ", ".join([artist["name"] for artist in track["artists"]])
+        album = track["album"]["name"]
+        year = int(track["album"]["release_date"][:4])
+
+        # Imagen del álbum
+        image_url = (
+            track["album"]["images"][0]["url"] if track["album"]["images"] else ""
+        )
+
+        return Song(
+            id=spotify_track_id,
+            title=title,
+            artists=artists,
+            album=album,
+            year=year,
+            genre=genre or "Unknown",
+            audio=audio,
+            image_url=image_url,
+            level_id=-999,  # level_id temporal, se asignará al guardar la canción
+        )
+
+    def get_tracks_info(
+        self, spotify_track_ids: list[str], access_token: str, preview_workers: int = 4
+    ) -> list[Song]:
+        """
+        Obtener información de varios tracks en lote: /tracks?ids= y /artists?ids=
+        (hasta 50 ids por petición, artistas sin repetir). Devuelve objetos Song
+        con la misma forma que get_track_info, en el orden pedido y omitiendo
+        los que no se encuentren. La URL de preview sigue siendo una por track.
+        """
+        track_ids = list(dict.fromkeys(spotify_track_ids))
+        headers = {"Authorization": f"Bearer {access_token}"}
+        tracks = {}
+        for chunk in _chunks(track_ids, MAX_IDS_PER_REQUEST):
+            try:
+                response = http_client.get(
+                    f"{self.api_url}/tracks", params={"ids": ",".join(chunk)}, headers=headers
+                )
+                if response.status_code != 200:
+                    print(f"Error obteniendo tracks: {response.status_code}")
+                    continue
+                # Spotify devuelve los tracks en el mismo orden (null si no existe)
+                for track_id, track in zip(chunk, response.json().get("tracks", [])):
+                    if track:
+                        tracks[track_id] = track
+            except Exception as e:
+                print(f"Error obteniendo tracks de Spotify: {e}")
+
+        artist_ids = [track["artists"][0]["id"] for track in tracks.values() if track.get("artists")]
+        genres = self.get_artists_genres(artist_ids, access_token)
+
+        found_ids = list(tracks)
+        with ThreadPoolExecutor(max_workers=max(1, preview_workers)) as executor:
+            previews = dict(zip(found_ids, executor.map(get_spotify_preview_url, found_ids)))
+
+        songs = []
+        for track_id in found_ids:
+            track = tracks[track_id]
+            try:
+                first_artist = track["artists"][0]["id"] if track.get("artists") else None
+                songs.append(self._build_song(track_id, track, genres.get(first_artist), previews.get(track_id)))
+            except Exception as e:
+                print(f"Error procesando track {track_id}: {e}")
+        return songs
+
+    def get_artists_genres(self, artist_ids: list[str], access_token: str) -> dict:
+        """
+        Obtener el género principal de varios artistas (artist_id -> género o None),
+        consultando la caché y pidiendo el resto en lotes de 50.
+        """
+        genres = {}
+        missing = []
+        for artist_id in dict.fromkeys(artist_ids):
+            found, genre = self.genre_cache.get(artist_id)
+            if found:
+                genres[artist_id] = genre
+            else:
+                missing.append(artist_id)
+
+        headers = {"Authorization": f"Bearer {access_token}"}
+        for chunk in _chunks(missing, MAX_IDS_PER_REQUEST):
+            try:
+                response = http_client.get(
+                    f"{self.api_url}/artists", params={"ids": ",".join(chunk)}, headers=headers
+                )
+                if response.status_code != 200:
+                    print(f"Error obteniendo artistas: {response.status_code}")
+                    continue
+                for artist_id, artist in zip(chunk, response.json().get("artists", [])):
+                    if not artist:
+                        continue
+                    artist_genres = artist.get("genres", [])
+                    genre = artist_genres[0] if artist_genres else None
+                    self.genre_cache.put(artist_id, genre)
+                    genres[artist_id] = genre
+            except Exception as e:
+                print(f"Error obteniendo artistas de Spotify: {e}")
+        return genres
+
     def get_track_genre(self, artist_id: str, access_token: str) -> Optional[str]:
-        """Obtener género del artista"""
+        """Obtener género del artista (consultando antes la caché de géneros)"""
+        found, genre = self.genre_cache.get(artist_id)
+        if found:
+            return genre
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(
+            response = http_client.get(
                 f"{self.api_url}/artists/{artist_id}", headers=headers
             )
 
             if response.status_code == 200:
                 artist_data = response.json()
                 genres = artist_data.get("genres", [])
-                return genres[0] if genres else None
+                genre = genres[0] if genres else None
+                self.genre_cache.put(artist_id, genre)
+                return genre
 
             return None
         except Exception as e:
@@ -95,7 +192,7 @@ class SpotifyHelper:
             headers = {'Authorization': f'Bearer {access_token}'}
             
             # Obtener tracks de la playlist
-            response = requests.get(
+            response = http_client.get(
                 f'{self.api_url}/playlists/{playlist_id}/tracks',
                 headers=headers,
                 params={'limit': 50}
@@ -156,7 +253,3 @@ class SpotifyHelper:
             print(f"Error obteniendo track de Spotify: {e}")
             return None
     """
-
-
-# Instancia global
-spotify_helper = SpotifyHelper()
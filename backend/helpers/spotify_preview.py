@@ -12,36 +12,165 @@ Referencia / Atribución:
     Basado en el workaround publicado en GitHub:
     Rexdotsh. (s. f.). GitHub - rexdotsh/spotify-preview-url-workaround. GitHub.
     https://github.com/rexdotsh/spotify-preview-url-workaround
+
+Optimizaciones:
+    - La página se lee en streaming y se deja de leer en cuanto aparece la URL.
+    - Las URLs encontradas se cachean hasta su expiración (si la URL del CDN la
+      indica) y los "sin preview" se cachean durante un periodo configurable.
 """
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+from helpers.http_client import http_client
+
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", 4096))
+PREVIEW_CACHE_TTL = int(os.getenv("PREVIEW_CACHE_TTL", 24 * 3600))
+PREVIEW_NEGATIVE_TTL = int(os.getenv("PREVIEW_NEGATIVE_TTL", 6 * 3600))
+# Base de las páginas embebidas (configurable para apuntar a un servidor de pruebas)
+SPOTIFY_EMBED_URL = os.getenv("SPOTIFY_EMBED_URL", "https://open.spotify.com/embed")
+
+_PREVIEW_RE = re.compile(rb'"audioPreview":\s*{\s*"url":\s*"([^"]+)"')
+_CHUNK_SIZE = 8192
+# Bytes que se conservan del bloque anterior para no perder coincidencias partidas entre bloques
+_OVERLAP = 2048
+# Parámetros con los que las URLs firmadas del CDN indican su expiración (timestamp absoluto)
+_EXPIRY_PARAMS = ('Expires', 'expires', 'exp', 'e')
+_EXPIRY_MARGIN = 60
+
+
+def _expiry_from_url(url: str, now: float) -> float:
+    """Expiración en caché de una URL de preview: la del CDN si la indica, como máximo PREVIEW_CACHE_TTL"""
+    default = now + PREVIEW_CACHE_TTL
+    params = parse_qs(urlsplit(url).query)
+    for name in _EXPIRY_PARAMS:
+        value = params.get(name, [''])[0]
+        if value.isdigit() and int(value) > 1_000_000_000:
+            return min(default, int(value) - _EXPIRY_MARGIN)
+    return default
+
+
+class PreviewResolver:
+    """Resuelve URLs de preview de Spotify leyendo en streaming y cacheando aciertos y fallos"""
+
+    def __init__(self, max_size: int = PREVIEW_CACHE_SIZE, negative_ttl: int = PREVIEW_NEGATIVE_TTL):
+        self.max_size = max(1, max_size)
+        self.negative_ttl = negative_ttl
+        self._cache = OrderedDict()  # track_id -> (url o None, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'fetches': 0,
+            'found': 0,
+            'not_found': 0,
+            'errors': 0,
+            'early_stops': 0,
+            'bytes_read': 0,
+            'fetch_time': 0.0
+        }
+
+    def resolve(self, spotify_track_id: str) -> Optional[str]:
+        """
+        Obtener la URL de preview de una pista de Spotify mediante la página embebida.
 
-import requests
+        Args:
+            spotify_track_id (str): ID de la pista en Spotify
+
+        Returns:
+            Optional[str]: La URL de preview si se encuentra, si no None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(spotify_track_id)
+            if entry and entry[1] > now:
+                self._cache.move_to_end(spotify_track_id)
+                self._stats['hits' if entry[0] else 'negative_hits'] += 1
+                return entry[0]
+
+        try:
+            url = self._fetch(spotify_track_id)
+        except Exception as e:
+            # Los errores de red no se cachean: la siguiente petición lo reintenta
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"Error obteniendo la URL de preview de Spotify: {e}")
+            return None
+
+        now = time.time()
+        expires_at = _expiry_from_url(url, now) if url else now + self.negative_ttl
+        with self._lock:
+            self._stats['found' if url else 'not_found'] += 1
+            self._cache[spotify_track_id] = (url, expires_at)
+            self._cache.move_to_end(spotify_track_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return url
+
+    def _fetch(self, spotify_track_id: str) -> Optional[str]:
+        """Leer la página embebida en streaming y parar en cuanto aparece la URL de preview"""
+        embed_url = f"{SPOTIFY_EMBED_URL}/track/{spotify_track_id}"
+        start = time.perf_counter()
+        bytes_read = 0
+        early_stop = False
+        url = None
+        response = http_client.get(embed_url, stream=True)
+        try:
+            response.raise_for_status()
+            tail = b''
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                bytes_read += len(chunk)
+                window = tail + chunk
+                match = _PREVIEW_RE.search(window)
+                if match:
+                    url = match.group(1).decode('utf-8')
+                    early_stop = True
+                    break
+                tail = window[-_OVERLAP:]
+        finally:
+            response.close()
+            with self._lock:
+                self._stats['fetches'] += 1
+                self._stats['bytes_read'] += bytes_read
+                self._stats['fetch_time'] += time.perf_counter() - start
+                self._stats['early_stops'] += int(early_stop)
+        return url
+
+    def invalidate(self, spotify_track_id: str) -> None:
+        with self._lock:
+            self._cache.pop(spotify_track_id, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._cache)
+        fetches = stats['fetches']
+        stats['avg_fetch_ms'] = round(stats['fetch_time'] * 1000 / fetches, 2) if fetches else 0.0
+        stats['avg_bytes_read'] = stats['bytes_read'] // fetches if fetches else 0
+        stats['fetch_time'] = round(stats['fetch_time'], 4)
+        return stats
+
+
+# Instancia global
+preview_resolver = PreviewResolver()
 
 
 def get_spotify_preview_url(spotify_track_id: str) -> Optional[str]:
     """
-    Get the preview URL for a Spotify track using the embed page workaround.
+    Obtener la URL de preview de una pista de Spotify (cacheada, ver PreviewResolver.resolve).
 
     Args:
-        spotify_track_id (str): The Spotify track ID
+        spotify_track_id (str): ID de la pista en Spotify
 
     Returns:
-        Optional[str]: The preview URL if found, else None
+        Optional[str]: La URL de preview si se encuentra, si no None
     """
-    try:
-        embed_url = f"https://open.spotify.com/embed/track/{spotify_track_id}"
-        response = requests.get(embed_url)
-        response.raise_for_status()
-
-        html = response.text
-        match = re.search(r'"audioPreview":\s*{\s*"url":\s*"([^"]+)"', html)
-        return match.group(1) if match else None
-
-    except Exception as e:
-        print(f"Failed to fetch Spotify preview URL: {e}")
-        return None
+    return preview_resolver.resolve(spotify_track_id)
 
 
-# example usage:
-# preview_url = get_spotify_preview_url('1301WleyT98MSxVHPZCA6M')
\ No newline at end of file
+# ejemplo de uso:
+# preview_url = get_spotify_preview_url('1301WleyT98MSxVHPZCA6M')
@@ -0,0 +1,220 @@
+from typing import Iterable, Optional, Union
+
+# Niveles numéricos por encima de este valor se guardan como "otros" para
+# que un level_id malicioso no genere un bitset gigantesco
+MAX_LEVEL_BIT = 4096
+LOCAL_SUFFIX = '_local'
+DAILY_LEVEL = '0'
+STORAGE_VERSION = 1
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _decode_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _bit_index(value: str) -> Optional[int]:
+    """Índice de bit para un id numérico canónico ("7" sí, "07" o "-1" no)"""
+    if not value.isdigit():
+        return None
+    index = int(value)
+    if str(index) != value or index > MAX_LEVEL_BIT:
+        return None
+    return index
+
+
+def _iter_bits(bits: int) -> Iterable[int]:
+    index = 0
+    while bits:
+        if bits & 1:
+            yield index
+        bits >>= 1
+        index += 1
+
+
+class LevelProgress:
+    """
+    Conjunto compacto de niveles (completados o jugados) de un usuario.
+    - Niveles de Spotify ("1", "2"...): un bit por nivel.
+    - Niveles de invitado ("3_local"): un bitset aparte.
+    - Nivel diario ("0"): un indicador propio.
+    - Cualquier otro id (p.ej. "-1"): conjunto de cadenas.
+    La pertenencia es O(1) y el recuento usa popcount.
+    """
+
+    __slots__ = ('spotify_bits', 'local_bits', 'daily', 'others')
+
+    def __init__(self, spotify_bits: int = 0, local_bits: int = 0, daily: bool = False, others: Optional[set] = None):
+        self.spotify_bits = spotify_bits
+        self.local_bits = local_bits
+        self.daily = daily
+        self.others = others or set()
+
+    def _locate(self, level_id: str) -> tuple[str, Optional[int]]:
+        if level_id == DAILY_LEVEL:
+            return 'daily', None
+        if level_id.endswith(LOCAL_SUFFIX):
+            index = _bit_index(level_id[:-len(LOCAL_SUFFIX)])
+            if index is not None:
+                return 'local', index
+        else:
+            index = _bit_index(level_id)
+            if index is not None:
+                return 'spotify', index
+        return 'other', None
+
+    def __contains__(self, level_id: str) -> bool:
+        level_id = str(level_id)
+        kind, index = self._locate(level_id)
+        if kind == 'daily':
+            return self.daily
+        if kind == 'spotify':
+            return bool(self.spotify_bits >> index & 1)
+        if kind == 'local':
+            return bool(self.local_bits >> index & 1)
+        return level_id in self.others
+
+    def add(self, level_id: str) -> bool:
+        """Añadir nivel. Devuelve True si no estaba ya en el conjunto"""
+        level_id = str(level_id)
+        if not level_id or level_id in self:
+            return False
+        kind, index = self._locate(level_id)
+        if kind == 'daily':
+            self.daily = True
+        elif kind == 'spotify':
+            self.spotify_bits |= 1 << index
+        elif kind == 'local':
+            self.local_bits |= 1 << index
+        else:
+            self.others.add(level_id)
+        return True
+
+    def count(self) -> int:
+        return (
+            self.spotify_bits.bit_count()
+            + self.local_bits.bit_count()
+            + int(self.daily)
+            + len(self.others)
+        )
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.spotify_bits or self.local_bits or self.daily or self.others)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, LevelProgress):
+            return NotImplemented
+        return (
+            self.spotify_bits == other.spotify_bits
+            and self.local_bits == other.local_bits
+            and self.daily == other.daily
+            and self.others == other.others
+        )
+
+    def copy(self) -> 'LevelProgress':
+        return LevelProgress(self.spotify_bits, self.local_bits, self.daily, set(self.others))
+
+    def union(self, other: 'LevelProgress') -> 'LevelProgress':
+        return LevelProgress(
+            self.spotify_bits | other.spotify_bits,
+            self.local_bits | other.local_bits,
+            self.daily or other.daily,
+            self.others | other.others
+        )
+
+    def to_list(self) -> list[str]:
+        """Ids de nivel en orden estable: diario, Spotify, invitado y otros"""
+        levels = [DAILY_LEVEL] if self.daily else []
+        levels.extend(str(i) for i in _iter_bits(self.spotify_bits))
+        levels.extend(f'{i}{LOCAL_SUFFIX}' for i in _iter_bits(self.local_bits))
+        levels.extend(sorted(self.others))
+        return levels
+
+    def to_csv(self) -> str:
+        """Representación CSV compatible con el formato anterior ("1,2,0")"""
+        return ','.join(self.to_list())
+
+    @staticmethod
+    def from_csv(csv: Optional[str]) -> 'LevelProgress':
+        progress = LevelProgress()
+        if csv:
+            for level_id in csv.split(','):
+                progress.add(level_id.strip())
+        return progress
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialización para la columna BLOB:
+        versión, flags (bit 0 = diario) y tres secciones con prefijo de longitud
+        (bitset de Spotify, bitset de invitado y "otros" en CSV UTF-8).
+        """
+        sections = [
+            self.spotify_bits.to_bytes((self.spotify_bits.bit_length() + 7) // 8, 'little'),
+            self.local_bits.to_bytes((self.local_bits.bit_length() + 7) // 8, 'little'),
+            ','.join(sorted(self.others)).encode('utf-8'),
+        ]
+        out = bytearray((STORAGE_VERSION, int(self.daily)))
+        for section in sections:
+            out += _encode_varint(len(section))
+            out += section
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: Optional[bytes]) -> 'LevelProgress':
+        if not data:
+            return LevelProgress()
+        if data[0] != STORAGE_VERSION:
+            raise ValueError(f"Versión de progreso no soportada: {data[0]}")
+        flags = data[1]
+        pos = 2
+        sections = []
+        for _ in range(3):
+            length, pos = _decode_varint(data, pos)
+            sections.append(data[pos:pos + length])
+            pos += length
+        others = sections[2].decode('utf-8')
+        return LevelProgress(
+            spotify_bits=int.from_bytes(sections[0], 'little'),
+            local_bits=int.from_bytes(sections[1], 'little'),
+            daily=bool(flags & 1),
+            others=set(others.split(',')) if others else set()
+        )
+
+    @staticmethod
+    def load(value: Union['LevelProgress', bytes, str, None], legacy_csv: Optional[str] = None) -> 'LevelProgress':
+        """
+        Construir progreso desde lo que venga de la BD: BLOB si existe,
+        y si no, el CSV heredado (migración transparente de filas antiguas).
+        """
+        if isinstance(value, LevelProgress):
+            return value.copy()
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return LevelProgress.from_bytes(bytes(value))
+        if isinstance(value, str):
+            return LevelProgress.from_csv(value)
+        return LevelProgress.from_csv(legacy_csv)
+
+    def __repr__(self) -> str:
+        return f"LevelProgress({self.to_csv()!r})"
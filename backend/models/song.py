@@ -1,5 +1,7 @@
 class Song:
     """Modelo de canción para el juego"""
+
+    __slots__ = ('id', 'title', 'artists', 'album', 'year', 'genre', 'audio', 'image_url', 'level_id')
     
     def __init__(
         self,
@@ -23,6 +25,13 @@ class Song:
         self.image_url = image_url
         self.level_id = level_id
     
+    def is_hydrated(self) -> bool:
+        """Indica si ya tiene todos los datos (si no, solo tiene el spotify_id)"""
+        return bool(
+            self.title and self.artists and self.album and self.year
+            and self.genre and self.audio and self.image_url
+        )
+
     def to_dict(self) -> dict:
         """Convertir objeto Song a diccionario"""
         return {
@@ -1,8 +1,40 @@
 from datetime import datetime
-from typing import Optional
+from operator import attrgetter
+from typing import Callable, Optional, Union
+
+from models.level_progress import LevelProgress
+
+# Marca de "campo no cargado" (distinto de None, que es un valor válido)
+_MISSING = object()
+
 
 class User:
-    """Modelo de usuario"""
+    """
+    Modelo de usuario.
+    Puede construirse con solo una parte de las columnas (ver las proyecciones
+    de Database); los campos no cargados se leen de la base de datos, todos
+    de una vez, la primera vez que se accede a alguno de ellos.
+    """
+
+    # Atributo -> columna de la tabla users (campos que save_user puede escribir)
+    COLUMNS = {
+        'email': 'email',
+        'hashed_password': 'hashed_password',
+        'total_score': 'total_score',
+        'completed': 'levels_completed_bits',
+        'played': 'played_levels_bits',
+        'last_daily_completed': 'last_daily_completed',
+        'spotify_access_token': 'spotify_access_token',
+        'spotify_refresh_token': 'spotify_refresh_token',
+        'spotify_token_expires_at': 'spotify_token_expires_at',
+        'spotify_client_id': 'spotify_client_id',
+        'spotify_client_secret': 'spotify_client_secret',
+    }
+    # row_version la mantiene un trigger de la BD: se lee, nunca se escribe
+    FIELDS = ('username', 'created_at', 'row_version', *COLUMNS)
+
+    __slots__ = (*FIELDS, '_dirty', '_loader', '_loaded')
+
     def __init__(
         self,
         username: str,
@@ -10,8 +42,8 @@ class User:
         hashed_password: str,
         created_at: Optional[datetime] = None,
         total_score: int = 0,
-        levels_completed: str = '',
-        played_levels: str = '',
+        levels_completed: Union[LevelProgress, bytes, str, None] = '',
+        played_levels: Union[LevelProgress, bytes, str, None] = '',
         last_daily_completed: Optional[str] = None,
         spotify_access_token: Optional[str] = None,
         spotify_refresh_token: Optional[str] = None,
@@ -24,14 +56,114 @@ class User:
         self.hashed_password = hashed_password
         self.created_at = created_at or datetime.utcnow()
         self.total_score = total_score
-        self.levels_completed = levels_completed
-        self.played_levels = played_levels
+        self.completed = LevelProgress.load(levels_completed)
+        self.played = LevelProgress.load(played_levels)
         self.last_daily_completed = last_daily_completed  # formato: "dd-mm-yyyy"
         self.spotify_access_token = spotify_access_token
         self.spotify_refresh_token = spotify_refresh_token
         self.spotify_token_expires_at = spotify_token_expires_at
         self.spotify_client_id = spotify_client_id
         self.spotify_client_secret = spotify_client_secret
+        self.row_version = 0
+        self._loader = None
+        self._loaded = _loaded_fields(self.FIELDS)
+        # Campos modificados desde que se cargó el usuario (ver save_user)
+        self._dirty = set()
+
+    def __setattr__(self, name, value) -> None:
+        if name in self.FIELDS:
+            dirty = _get_slot(self, '_dirty', None)
+            if dirty is not None:
+                current = _get_slot(self, name, _MISSING)
+                if current is _MISSING:
+                    object.__setattr__(self, '_loaded', _loaded_fields((*self._loaded.names, name)))
+                if name in self.COLUMNS and current != value:
+                    dirty.add(name)
+        object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # Solo se llega aquí si el atributo no está cargado
+        if name not in self.FIELDS or name == 'username':
+            raise AttributeError(f"'User' object has no attribute '{name}'")
+        loader = _get_slot(self, '_loader', None)
+        if loader is None:
+            raise AttributeError(f"Campo de usuario no cargado: {name}")
+        # RuntimeError y no AttributeError: hasattr/getattr con valor por defecto no deben ocultar el fallo
+        try:
+            data = loader(self.username)
+        except Exception as e:
+            raise RuntimeError(f"No se pudo cargar el campo {name} del usuario {self.username}: {e}") from e
+        if data is None:
+            raise RuntimeError(f"No se pudo cargar el campo {name}: el usuario ya no existe")
+        self._load(data)
+        # Solo tras cargar: si falla, el siguiente acceso vuelve a intentarlo
+        object.__setattr__(self, '_loader', None)
+        object.__setattr__(self, '_loaded', _loaded_fields(
+            tuple(field for field in self.FIELDS if _get_slot(self, field, _MISSING) is not _MISSING)
+        ))
+        return object.__getattribute__(self, name)
+
+    def _load(self, data: dict, only_missing: bool = True) -> None:
+        """Rellenar los campos presentes en `data` (por defecto solo los no cargados) sin marcarlos como modificados"""
+        for column, value in data.items():
+            field = _COLUMN_FIELDS.get(column)
+            if field is None:
+                continue  # columnas CSV antiguas: solo se usan junto con los bits
+            if only_missing and _get_slot(self, field, _MISSING) is not _MISSING:
+                continue
+            if column == 'created_at':
+                value = value or datetime.utcnow()
+            elif column == 'levels_completed_bits':
+                value = LevelProgress.load(value, data.get('levels_completed'))
+            elif column == 'played_levels_bits':
+                value = LevelProgress.load(value, data.get('played_levels'))
+            object.__setattr__(self, field, value)
+
+    def get_changes(self) -> dict:
+        """Columnas modificadas desde la carga (o el último guardado) con su nuevo valor"""
+        changes = {}
+        for field in self.COLUMNS:
+            if field in self._dirty:
+                value = getattr(self, field)
+                if isinstance(value, LevelProgress):
+                    value = value.to_bytes()
+                changes[self.COLUMNS[field]] = value
+        return changes
+
+    def has_changes(self, *fields: str) -> bool:
+        """True si ha cambiado alguno de los campos indicados (o cualquiera si no se indican)"""
+        return bool(self._dirty.intersection(fields)) if fields else bool(self._dirty)
+
+    def mark_clean(self) -> None:
+        """Olvidar los cambios pendientes (tras guardarlos)"""
+        self._dirty.clear()
+
+    def apply_pending(self, played: LevelProgress, daily: Optional[str]) -> None:
+        """
+        Superponer progreso aún no escrito en la base de datos (write-behind).
+        No se marca como modificado: save_user no debe volver a escribirlo.
+        """
+        object.__setattr__(self, 'played', self.played.union(played))
+        if daily:
+            object.__setattr__(self, 'last_daily_completed', daily)
+
+    @property
+    def levels_completed(self) -> str:
+        """Niveles completados en formato CSV (compatibilidad con la API)"""
+        return self.completed.to_csv()
+
+    @levels_completed.setter
+    def levels_completed(self, value: Union[LevelProgress, bytes, str, None]) -> None:
+        self.completed = LevelProgress.load(value)
+
+    @property
+    def played_levels(self) -> str:
+        """Niveles jugados en formato CSV (compatibilidad con la API)"""
+        return self.played.to_csv()
+
+    @played_levels.setter
+    def played_levels(self, value: Union[LevelProgress, bytes, str, None]) -> None:
+        self.played = LevelProgress.load(value)
     
     def to_public_dict(self) -> dict:
         """Convertir a diccionario público (sin datos sensibles)"""
@@ -57,45 +189,29 @@ class User:
     
     def is_level_completed(self, level_id: str) -> bool:
         """Verificar si un nivel ya está completado"""
-        if not self.levels_completed:
-            return False
-        completed_levels = self.levels_completed.split(',')
-        return level_id in completed_levels
+        return level_id in self.completed
 
     def is_level_played(self, level_id: str) -> bool:
         """Verificar si un nivel ya ha sido jugado (intentado)"""
-        if not self.played_levels:
-            return False
-        played = self.played_levels.split(',')
-        return level_id in played
+        return level_id in self.played
     
     def complete_level(self, level_id: str) -> None:
         """Marcar un nivel como completado"""
-        if not self.is_level_completed(level_id):
-            if self.levels_completed:
-                self.levels_completed += f',{level_id}'
-            else:
-                self.levels_completed = level_id
+        if self.completed.add(level_id):
+            self._dirty.add('completed')
 
     def mark_level_played(self, level_id: str) -> None:
         """Marcar un nivel como jugado"""
-        if not self.is_level_played(level_id):
-            if self.played_levels:
-                self.played_levels += f',{level_id}'
-            else:
-                self.played_levels = level_id
+        if self.played.add(level_id):
+            self._dirty.add('played')
     
     def get_completed_levels_count(self) -> int:
         """Obtener número de niveles completados"""
-        if not self.levels_completed:
-            return 0
-        return len(self.levels_completed.split(','))
+        return self.completed.count()
 
     def get_played_levels_count(self) -> int:
         """Obtener número de niveles jugados"""
-        if not self.played_levels:
-            return 0
-        return len(self.played_levels.split(','))
+        return self.played.count()
     
     def reset_daily_status(self) -> None:
         """Resetear el estado del desafío diario"""
@@ -109,6 +225,38 @@ class User:
         """Obtener el client secret de Spotify"""
         return self.spotify_client_secret
     
+    def __copy__(self) -> 'User':
+        """Copia independiente del progreso (los bitsets son mutables); no fuerza la carga de campos"""
+        clone = self.__class__.__new__(self.__class__)
+        loaded = self._loaded
+        for field, value in zip(loaded.names, loaded.get(self)):
+            object.__setattr__(clone, field, value)
+        for field in loaded.progress:
+            object.__setattr__(clone, field, object.__getattribute__(self, field).copy())
+        object.__setattr__(clone, '_loaded', loaded)
+        object.__setattr__(clone, '_loader', self._loader)
+        object.__setattr__(clone, '_dirty', set(self._dirty))
+        return clone
+
+    @staticmethod
+    def from_row(data: dict, loader: Optional[Callable[[str], Optional[dict]]] = None) -> 'User':
+        """
+        Crear un User solo con las columnas presentes en `data` (una proyección).
+        `loader(username)` devuelve el resto de columnas cuando se accede a un campo no cargado.
+        """
+        user = User.__new__(User)
+        object.__setattr__(user, '_loader', loader)
+        object.__setattr__(user, '_dirty', set())
+        user._load(data, only_missing=False)
+        columns = tuple(data)
+        loaded = _PROJECTION_FIELDS.get(columns)
+        if loaded is None:
+            loaded = _PROJECTION_FIELDS[columns] = _loaded_fields(
+                tuple(_COLUMN_FIELDS[column] for column in columns if column in _COLUMN_FIELDS)
+            )
+        object.__setattr__(user, '_loaded', loaded)
+        return user
+
     @staticmethod
     def from_dict(data: dict) -> 'User':
         """Crear instancia de User desde un diccionario"""
@@ -118,8 +266,8 @@ class User:
             hashed_password=data.get('hashed_password'),
             created_at=data.get('created_at'),
             total_score=data.get('total_score', 0),
-            levels_completed=data.get('levels_completed', ''),
-            played_levels=data.get('played_levels', ''),
+            levels_completed=LevelProgress.load(data.get('levels_completed_bits'), data.get('levels_completed')),
+            played_levels=LevelProgress.load(data.get('played_levels_bits'), data.get('played_levels')),
             last_daily_completed=data.get('last_daily_completed'),
             spotify_access_token=data.get('spotify_access_token'),
             spotify_refresh_token=data.get('spotify_refresh_token'),
@@ -133,3 +281,44 @@ class User:
     
     def __str__(self) -> str:
         return f"{self.username} ({self.email}) - Score: {self.total_score}"
+
+
+# Columna de la tabla users -> campo del modelo
+_COLUMN_FIELDS = {'username': 'username', 'created_at': 'created_at', 'row_version': 'row_version'}
+_COLUMN_FIELDS.update((column, field) for field, column in User.COLUMNS.items())
+
+
+class _LoadedFields:
+    """Campos cargados de un User (compartido entre todos los usuarios de la misma proyección)"""
+
+    __slots__ = ('names', 'get', 'progress')
+
+    def __init__(self, names: tuple):
+        self.names = names
+        # Lee todos los campos de una vez (attrgetter con un solo nombre no devuelve tupla)
+        if len(names) > 1:
+            self.get = attrgetter(*names)
+        else:
+            self.get = lambda user: tuple(getattr(user, name) for name in names)
+        # Bitsets mutables: __copy__ los duplica
+        self.progress = tuple(name for name in names if name in ('completed', 'played'))
+
+
+_LOADED_FIELDS = {}     # nombres de campos -> _LoadedFields
+_PROJECTION_FIELDS = {}  # columnas de una proyección -> _LoadedFields
+
+
+def _loaded_fields(names: tuple) -> _LoadedFields:
+    names = tuple(field for field in User.FIELDS if field in names)
+    loaded = _LOADED_FIELDS.get(names)
+    if loaded is None:
+        loaded = _LOADED_FIELDS[names] = _LoadedFields(names)
+    return loaded
+
+
+def _get_slot(user: User, name: str, default):
+    """Valor de un slot sin disparar la carga diferida"""
+    try:
+        return object.__getattribute__(user, name)
+    except AttributeError:
+        return default
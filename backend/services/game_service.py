@@ -1,20 +1,51 @@
-from difflib import SequenceMatcher
-from database.database import db
+from database.database import db, SCORE_ACCEPTED, SCORE_REPLAYED, SCORE_ALREADY_PLAYED, SCORE_KEY_CONFLICT
 from dotenv import load_dotenv
 import os
+import re
 import json
 import random
-import re
+from typing import Optional, Union
 
-from helpers.spotify_helper import SpotifyHelper
+from services.hydration_service import hydration_service
+from services.token_refresh_service import token_refresh_service
+from helpers.answer_normalizer import normalize_title
+from helpers.similarity import is_similar, MAX_ANSWER_LENGTH
+from helpers.response_cache import level_response_cache, spotify_level_key, EncodedResponse
+from helpers.audio_store import audio_store
+from models.song import Song
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
+MAX_BATCH_ANSWERS = int(os.getenv("MAX_BATCH_ANSWERS", 100))
+MAX_IDEMPOTENCY_KEY_LENGTH = 200
+# Puntuación máxima de un nivel (el frontend da 1000 al primer intento y 0 al rendirse)
+MAX_LEVEL_SCORE = int(os.getenv("MAX_LEVEL_SCORE", 1000))
+# level_id válido en submit-score: "7" (Spotify, "0" es el diario) o "3_local"; sin ceros a la izquierda
+LEVEL_ID_PATTERN = re.compile(r'^(0|[1-9][0-9]*)(_local)?$')
 
 class GameService:
     def __init__(self):
+        # Títulos normalizados por nivel ("5", "3_local"...): se calculan una vez
+        self._title_cache = {}
+        # Tipo MIME por hash de audio local (un hash nunca cambia de contenido)
+        self._audio_mimes = {}
+        self.title_aliases = self._load_title_aliases()
         self.set_daily_song()
 
+    def _load_title_aliases(self) -> dict:
+        """Cargar títulos alternativos opcionales ("aliases") de spotify_songs.json"""
+        json_path = os.path.join(os.path.dirname(__file__), '..', 'songs_local_data&spotify_ids', 'spotify_songs.json')
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                levels = json.load(f).get('levels', [])
+            return {
+                str(level['level_id']): level['aliases']
+                for level in levels if level.get('aliases')
+            }
+        except Exception as e:
+            print(f"Error cargando títulos alternativos: {e}")
+            return {}
+
     def set_daily_song(self):
         # Cargar lista de canciones para el desafío diario desde JSON está en backend/songs_local_data&spotify_ids/possible_daily_songs.json
         json_path = os.path.join(os.path.dirname(__file__), '..', 'songs_local_data&spotify_ids', 'possible_daily_songs.json')
@@ -26,55 +57,103 @@ class GameService:
             # Fallback a una lista mínima si falla la carga
             self.daily_songs = ["4blQLWBwNYjL3Z0x8ctMBq"]
             
+        # Todas las candidatas quedan en la BD para hidratarlas de antemano; las que ya son
+        # la canción de un nivel se descartan (le quitarían la canción y darían su respuesta)
+        self.daily_songs = db.init_daily_song_pool(self.daily_songs) or self.daily_songs
         self.daily_song_id = random.choice(self.daily_songs)
         print(f"Canción del día seleccionada: {self.daily_song_id}")
-        db.delete_daily_songs()
+        db.retire_daily_songs()
         db.init_daily_song_level(self.daily_song_id)
 
     def validate_answer(self, level_id: str, user_answer: str) -> bool:
         """Validar respuesta del usuario"""
-        if level_id.endswith('_local'):
-            level_str = level_id[:-6]  # quitar sufijo '_local'
-            try:
-                level_num = int(level_str)
-            except ValueError:
-                return False
-            song = db.get_local_song_by_level(level_num)
-            song_name = song.title if song else None
-            if not song_name:
-                return False
+        if user_answer is None:
+            return False
+        return self._check_answer(user_answer, self._get_canonical_titles(level_id))
+
+    def validate_answers(self, data) -> tuple[dict, int]:
+        """
+        Validar varias respuestas en una sola petición.
+        Acepta {"answers": [{"level_id": ..., "answer": ...}, ...]} (o pares [level_id, answer]).
+        Cada canción se busca y normaliza una sola vez aunque se repita el nivel.
+        """
+        try:
+            answers = data.get('answers') if isinstance(data, dict) else None
+            if not isinstance(answers, list) or not answers:
+                return {"error": "Lista de respuestas requerida"}, 400
+            if len(answers) > MAX_BATCH_ANSWERS:
+                return {"error": f"Máximo {MAX_BATCH_ANSWERS} respuestas por petición"}, 400
+
+            titles_by_level = {}
+            results = []
+            for item in answers:
+                if isinstance(item, dict):
+                    level_id, user_answer = item.get('level_id'), item.get('answer')
+                elif isinstance(item, (list, tuple)) and len(item) == 2:
+                    level_id, user_answer = item
+                else:
+                    level_id, user_answer = None, None
+
+                key = self._title_cache_key(level_id) if level_id is not None else None
+                if key not in titles_by_level:
+                    titles_by_level[key] = self._get_canonical_titles(key) if key else None
+                correct = user_answer is not None and self._check_answer(user_answer, titles_by_level[key])
+                results.append({"level_id": level_id, "correct": correct})
+            return {"results": results}, 200
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    def _check_answer(self, user_answer: str, titles: Optional[tuple]) -> bool:
+        if not titles or not isinstance(user_answer, str) or len(user_answer) > MAX_ANSWER_LENGTH:
+            return False
+        # Solo hay que normalizar la respuesta: los títulos ya están en caché
+        return self._matches_any(normalize_title(user_answer), titles)
+
+    def _matches_any(self, normalized_answer: str, titles: tuple) -> bool:
+        for normalized_title in titles:
+            # Comparación exacta
+            if normalized_answer == normalized_title:
+                return True
+            # Comparación con 85% de similitud: si la respuesta es muy parecida al título se considera correcta
+            if is_similar(normalized_answer, normalized_title):
+                return True
+        return False
+
+    def _title_cache_key(self, level_id) -> Optional[str]:
+        """Clave canónica de nivel: "5" para Spotify, "5_local" para invitados"""
+        level_id = str(level_id)
+        try:
+            if level_id.endswith('_local'):
+                return f"{int(level_id[:-6])}_local"  # quitar sufijo '_local'
+            level_num = int(level_id)
+        except ValueError:
+            return None
+        # Negativos: candidatas a canción del día, no son un nivel (ver DAILY_POOL_LEVEL)
+        return str(level_num) if level_num >= 0 else None
+
+    def _get_canonical_titles(self, level_id) -> Optional[tuple]:
+        """Títulos normalizados (título + alias) de un nivel, cargando la canción si no están en caché"""
+        key = self._title_cache_key(level_id)
+        if key is None:
+            return None
+        # El diario no se cachea: otro proceso puede rotar la canción (se lee de la BD)
+        titles = self._title_cache.get(key) if key != '0' else None
+        if titles is not None:
+            return titles
+        if key.endswith('_local'):
+            song = db.get_local_song_by_level(int(key[:-6]))
         else:
-            song_name = db.get_spotify_song_by_level(int(level_id))
-            song_name = song_name.title if song_name else None
-            if not song_name:
-                return False
-            
-        # Normalizar ambas cadenas para comparación
-        normalized_answer = self._clean_title(user_answer)
-        normalized_title = self._clean_title(song_name)
-        
-        # Comparación exacta
-        if normalized_answer == normalized_title:
-            return True
-        
-        # Comparación con 85% de similitud usando SequenceMatcher: si la respuesta es muy parecida al título se considera correcta
-        similarity = SequenceMatcher(None, normalized_answer, normalized_title).ratio()
-        return similarity >= 0.85
-
-    def _clean_title(self, title: str) -> str:
-        # Convertir a minúsculas
-        title = title.lower()
-        # Eliminar contenido entre paréntesis o corchetes (ej: (Remix), [Live])
-        title = re.sub(r'[\(\[].*?[\)\]]', '', title)
-        # Cuando haya un guion, quitar el guion y todo lo que sigue
-        title = re.sub(r'-.*', '', title)
-        # Eliminar "feat." y todo lo que sigue
-        title = re.sub(r'\b(feat|ft|featuring)\b.*', '', title)
-        # Reemplazar guiones bajos por espacios
-        title = re.sub(r'_', ' ', title)
-        # Eliminar espacios extra
-        title = re.sub(r'\s+', ' ', title).strip()
-        return title
+            song = db.get_spotify_song_by_level(int(key))
+        return self._remember_titles(key, song)
+
+    def _remember_titles(self, key: str, song: Optional[Song]) -> Optional[tuple]:
+        """Normalizar y guardar en caché el título de una canción cargada o hidratada"""
+        if not song or not song.title:
+            return None
+        candidates = [song.title] + list(self.title_aliases.get(key, []))
+        titles = tuple(dict.fromkeys(normalize_title(title) for title in candidates))
+        self._title_cache[key] = titles
+        return titles
 
     def mark_level_played(self, auth_header, level_id):
         try:
@@ -89,13 +168,16 @@ class GameService:
             if not level_id:
                 return {"error": "Nivel requerido"}, 400
 
-            user.mark_level_played(level_id)
-            db.save_user(user)
+            db.record_level_played(user.username, level_id)
             return {"message": "Nivel marcado como jugado"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
 
-    def update_score(self, auth_header, data):
+    def update_score(self, auth_header, data, idempotency_key: Optional[str] = None):
+        """
+        Sumar la puntuación de un nivel de forma atómica (ver Database.submit_score).
+        idempotency_key (cabecera Idempotency-Key o campo del body) permite reintentar sin duplicar.
+        """
         try:
             if not auth_header or not auth_header.lower().startswith('bearer '):
                 return {"error": "Token requerido"}, 401
@@ -109,29 +191,46 @@ class GameService:
                 return {"error": "Puntuación requerida"}, 400
 
             score = data['score']
-            level_id = data.get('level_id', '')
+            if isinstance(score, bool) or not isinstance(score, (int, float, str)):
+                return {"error": "Puntuación inválida"}, 400
+            try:
+                score = int(score)
+            except (TypeError, ValueError, OverflowError):
+                return {"error": "Puntuación inválida"}, 400
+            if not 0 <= score <= MAX_LEVEL_SCORE:
+                return {"error": "Puntuación fuera de rango"}, 400
 
-            if user.is_level_played(level_id):
-                return {"error": "Nivel ya jugado"}, 400
-            user.complete_level(level_id)
-            user.add_score(score) # Update score in memory
+            level_id = data.get('level_id')
+            if level_id is None or level_id == '':
+                return {"error": "ID de nivel requerido"}, 400
+            if isinstance(level_id, bool) or not isinstance(level_id, (int, str)):
+                return {"error": "ID de nivel inválido"}, 400
+            level_id = str(level_id)
+            if not LEVEL_ID_PATTERN.match(level_id):
+                return {"error": "ID de nivel inválido"}, 400
 
-            if level_id == "0":
-                user.complete_daily()
-            
-            if db.save_user(user):
-                return {"message": "Puntuación actualizada", "total_score": user.total_score}, 200
-            else:
-                return {"error": "Error guardando usuario"}, 500
+            idempotency_key = idempotency_key or data.get('idempotency_key')
+            if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH):
+                return {"error": "Clave de idempotencia inválida"}, 400
+
+            result, total_score = db.submit_score(user.username, level_id, score, idempotency_key)
+            if result in (SCORE_ACCEPTED, SCORE_REPLAYED):
+                return {"message": "Puntuación actualizada", "total_score": total_score}, 200
+            if result == SCORE_ALREADY_PLAYED:
+                return {"error": "Nivel ya jugado"}, 400
+            if result == SCORE_KEY_CONFLICT:
+                return {"error": "Clave de idempotencia ya usada con otros datos"}, 409
+            return {"error": "Token inválido"}, 401
         except Exception as e:
             return {"error": str(e)}, 500
 
+    def get_ranking_version(self, limit: int = 10) -> str:
+        """Versión del ranking pedido (cambia con cualquier cambio del ranking); sirve de ETag"""
+        return f"{db.get_ranking_version()}-{limit}"
+
     def get_ranking(self, limit: int = 10):
         try:
             ranking = db.get_ranking(limit)
-            for user in ranking:
-                str_levels_completed = user.get('levels_completed', '')
-                user['levels_completed'] = len(str_levels_completed.split(',')) if str_levels_completed else 0
             return {"ranking": ranking}, 200
         except Exception as e:
             return {"error": str(e)}, 500
@@ -146,17 +245,50 @@ class GameService:
             if not user:
                 return {"error": "Token inválido"}, 401
 
-            user.complete_daily()
-            db.save_user(user)
+            db.record_daily_completed(user.username)
             return {"message": "Desafío diario completado"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
 
-    def get_level_song(self, level_id: str, auth_header: str = None) -> tuple[dict, int]:
+    def is_level_cached(self, level_id: str) -> bool:
+        """
+        True si la respuesta de un nivel de Spotify ya está en la caché de respuestas,
+        sin consultar la BD (el nivel diario necesita la canción del día: nunca).
+        """
+        try:
+            level_num = int(level_id)
+        except ValueError:
+            return False
+        return level_num > 0 and spotify_level_key(level_num) in level_response_cache
+
+    def get_pending_hydration(self, level_id: str, auth_header: str = None) -> Optional[tuple[Song, str]]:
+        """
+        Para el modo asíncrono (asgi.py): si el nivel de Spotify solicitado aún no
+        está hidratado y el usuario puede hidratarlo, devolver (canción, token de
+        Spotify) para hacerlo sin ocupar un hilo de petición. En cualquier otro
+        caso devuelve None y get_level_song se encarga de la respuesta.
+        """
+        if '_local' in level_id or not auth_header or not auth_header.lower().startswith('bearer '):
+            return None
+        try:
+            user = db.verify_token(auth_header.split(' ')[1])
+            if not user:
+                return None
+            song = db.get_spotify_song_by_level(int(level_id))
+            if not song or song.is_hydrated():
+                return None
+            success, _, spotify_token = token_refresh_service.get_access_token(user.username)
+            return (song, spotify_token) if success else None
+        except Exception:
+            return None
+
+    def get_level_song(self, level_id: str, auth_header: str = None) -> tuple[Union[EncodedResponse, dict], int]:
         """
         Obtener canción de un nivel.
         Si es invitado o no autenticado (tabla local_songs)
         Sino: canciones de Spotify (tabla spotify_songs)
+        Si hay canción, se devuelve ya codificada con su ETag (EncodedResponse), de la caché de respuestas si está.
+        El audio de las canciones locales es relativo a la API salvo con PUBLIC_BASE_URL (ver audio_store).
         """
         try:
             # Determinar si es invitado
@@ -168,11 +300,18 @@ class GameService:
                 except ValueError:
                     return {"error": "ID de nivel inválido"}, 400
 
+                cache_key = ('local', level_num)
+                cached = level_response_cache.get(cache_key)
+                if cached is not None:
+                    return cached, 200
+                version = level_response_cache.version()
+
                 song = db.get_local_song_by_level(level_num)
                 if not song:
                     return {"error": "Nivel no disponible para invitados"}, 404
+                self._remember_titles(f"{level_num}_local", song)
 
-                return song.to_dict(), 200
+                return self._encode_level(cache_key, song, version), 200
 
             else:
                 # Usuario autenticado: verificar token de autenticación
@@ -185,34 +324,76 @@ class GameService:
                 if not user:
                     return {"error": "Token inválido"}, 401
 
+                try:
+                    level_num = int(level_id)
+                except ValueError:
+                    return {"error": "ID de nivel inválido"}, 400
+                if level_num < 0:
+                    # Las candidatas a canción del día (DAILY_POOL_LEVEL) no son un nivel
+                    return {"error": "Nivel no disponible"}, 404
+
+                # Otro proceso puede haber rotado la canción del día: se busca por la actual
+                daily_id = db.get_daily_spotify_id() if level_num == 0 else None
+                cached = level_response_cache.get(spotify_level_key(level_num, daily_id))
+                if cached is not None:
+                    return cached, 200
+                version = level_response_cache.version()
+
                 # Buscar canción en tabla spotify_songs
-                song = db.get_spotify_song_by_level(int(level_id))
+                song = db.get_spotify_song_by_level(level_num)
                 
                 if not song:
                     return {"error": "Nivel no disponible"}, 404
                 
                 # si ya tiene los datos guardados en la BD, devolverlos directamente
-                if song and song.title and song.artists and song.album and song.year and song.genre and song.audio and song.image_url:
-                    return song.to_dict(), 200
-                else: # si solo tiene spotify_id, obtener datos desde Spotify API
+                if song.is_hydrated():
+                    self._remember_titles(str(song.level_id), song)
+                    # Clave de la canción leída (pudo rotar tras consultar daily_id)
+                    cache_key = spotify_level_key(level_num, song.id)
+                    return self._encode_level(cache_key, song, version), 200
+                else: # si solo tiene spotify_id, obtener datos desde Spotify API (respaldo si aún no se hidrató)
                     # Obtener token de Spotify del usuario
                     username = user.username
-                    success, message, spotify_token = db.get_spotify_access_token(username)
+                    success, message, spotify_token = token_refresh_service.get_access_token(username)
                     print(f"Spotify token status: {message}")
                     if not success:
                         return {"error": f"No hay conexión de Spotify disponible: {message}"}, 403
                     
-                    spotiHelper = SpotifyHelper()
-                    spoti_song = spotiHelper.get_track_info(song.id, spotify_token)
+                    try:
+                        spoti_song = hydration_service.hydrate_song(song, spotify_token)
+                    except TimeoutError:
+                        return {"error": "Tiempo de espera agotado obteniendo la canción"}, 504
                     
                     if not spoti_song:
                         return {"error": "Nivel no disponible"}, 404
 
-                    # Guardar datos obtenidos en la base de datos para futuras consultas
-                    spoti_song.level_id = int(level_id)
-                    db.add_spotify_song(spoti_song)
-
-                    return spoti_song.to_dict(), 200
+                    self._remember_titles(str(spoti_song.level_id), spoti_song)
+                    # No se cachea aquí: al guardarla se invalidó la entrada y la próxima lectura la cachea
+                    return EncodedResponse.from_payload(spoti_song.to_dict()), 200
 
         except Exception as e:
             return {"error": str(e)}, 500
+
+    def get_audio_file(self, audio_hash: str) -> Optional[tuple[str, str]]:
+        """Ruta y tipo MIME del audio de una canción local, o None si no existe"""
+        path = audio_store.path_for(audio_hash)
+        if not path:
+            # Falta en el almacén (p.ej. directorio borrado): recrearlo desde local_songs.json
+            if not audio_store.is_valid_hash(audio_hash) or not db.restore_local_audio([audio_hash]):
+                return None
+            path = audio_store.path_for(audio_hash)
+            if not path:
+                return None
+        mime = self._audio_mimes.get(audio_hash)
+        if mime is None:
+            mime = db.get_local_audio_mime(audio_hash)
+            if mime is None:
+                return None
+            self._audio_mimes[audio_hash] = mime
+        return path, mime
+
+    def _encode_level(self, cache_key: tuple, song: Song, version: int) -> EncodedResponse:
+        """Codificar la respuesta de un nivel y guardarla en la caché de respuestas"""
+        response = EncodedResponse.from_payload(song.to_dict())
+        level_response_cache.put(cache_key, response, version)
+        return response
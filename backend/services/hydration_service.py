@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+from database.database import db
+from helpers.genre_cache import ArtistGenreCache
+from helpers.spotify_helper import SpotifyHelper, MAX_IDS_PER_REQUEST
+from helpers.single_flight import SingleFlight
+from models.song import Song
+from services.spoti_service import SpotiService
+
+load_dotenv()
+
+HYDRATION_WORKERS = int(os.getenv("HYDRATION_WORKERS", 4))
+# Segundos que espera un request a que termine la hidratación lanzada por otro
+HYDRATION_WAIT_TIMEOUT = float(os.getenv("HYDRATION_WAIT_TIMEOUT", 15))
+# Cada cuántas canciones se informa del progreso de la hidratación masiva (y al terminar)
+HYDRATION_REPORT_EVERY = max(1, int(os.getenv("HYDRATION_REPORT_EVERY", 100)))
+
+# Géneros por artista, persistidos en la tabla artist_genres
+genre_cache = ArtistGenreCache(db.get_artist_genre, db.save_artist_genre)
+spotify_helper = SpotifyHelper(genre_cache)
+
+
+class HydrationService:
+    """
+    Rellenar los datos (título, artistas, audio...) de las canciones de
+    spotify_songs que solo tienen spotify_id. Puede ejecutarse en segundo
+    plano al arrancar o bajo demanda (comando `flask hydrate-songs`);
+    la hidratación dentro de get_level_song queda solo como respaldo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Una sola hidratación por spotify_id a la vez; el resto espera su resultado
+        self._single_flight = SingleFlight()
+        self._thread = None
+        self.progress = {
+            'running': False,
+            'total': 0,
+            'done': 0,
+            'hydrated': 0,
+            'failed': 0,
+            'started_at': None,
+            'finished_at': None
+        }
+
+    def hydrate_song(self, song: Song, access_token: str, timeout: float = HYDRATION_WAIT_TIMEOUT) -> Optional[Song]:
+        """
+        Obtener los datos de una canción desde Spotify y guardarlos en la BD.
+        Si ya hay otra hidratación en curso de la misma canción, espera a su
+        resultado (lanza TimeoutError si tarda más de `timeout` segundos).
+        """
+        return self._single_flight.do(
+            song.id,
+            lambda: self._fetch_and_save(song, access_token),
+            timeout
+        )
+
+    def submit_hydration(self, song: Song, access_token: str, executor: Executor) -> Future:
+        """Como hydrate_song pero sin bloquear: devuelve un Future (modo asíncrono)"""
+        return self._single_flight.submit(
+            song.id,
+            lambda: self._fetch_and_save(song, access_token),
+            executor
+        )
+
+    def _fetch_and_save(self, song: Song, access_token: str) -> Optional[Song]:
+        spoti_song = spotify_helper.get_track_info(song.id, access_token)
+        if not spoti_song:
+            return None
+        # Guardar datos obtenidos en la base de datos para futuras consultas
+        spoti_song.level_id = song.level_id
+        db.add_spotify_song(spoti_song)
+        return spoti_song
+
+    def get_access_token(self) -> Optional[str]:
+        """
+        Token para hidratar sin usuario: solo el de la aplicación (client credentials).
+        Nunca el de un jugador: cada uno registra su propia app de Spotify y no debe
+        gastar su cuota en trabajo que no ha pedido.
+        """
+        return SpotiService().get_client_credentials_token()
+
+    def hydrate_all(
+        self,
+        access_token: Optional[str] = None,
+        max_workers: int = HYDRATION_WORKERS,
+        report: Callable[[dict], None] = None,
+        report_every: int = HYDRATION_REPORT_EVERY
+    ) -> dict:
+        """
+        Hidratar todas las canciones pendientes en lotes (API por lotes de Spotify)
+        con un pool de hilos acotado para las previews. `report` recibe el progreso cada
+        `report_every` canciones y al terminar (por defecto se imprime).
+        Si ya hay una hidratación en curso devuelve solo {"error": ...}, sin contadores.
+        """
+        if not self._lock.acquire(blocking=False):
+            return {"error": "Ya hay una hidratación en curso"}
+        try:
+            pending = db.get_unhydrated_spotify_songs()
+            self.progress.update({
+                'running': True,
+                'total': len(pending),
+                'done': 0,
+                'hydrated': 0,
+                'failed': 0,
+                'started_at': time.time(),
+                'finished_at': None
+            })
+            if not pending:
+                return self._finish()
+
+            access_token = access_token or self.get_access_token()
+            if not access_token:
+                print("Aviso: hidratación omitida, no hay token de aplicación de Spotify (revisa SPOTIFY_CLIENT_ID y SPOTIFY_CLIENT_SECRET)")
+                result = self._finish()
+                result['error'] = "No hay token de aplicación de Spotify (client credentials) para hidratar canciones"
+                return result
+
+            report = report or self._print_progress
+            # Lotes de 50: ~2 peticiones a la API por lote (tracks + artistas);
+            # max_workers limita las descargas de preview en paralelo
+            for start in range(0, len(pending), MAX_IDS_PER_REQUEST):
+                chunk = pending[start:start + MAX_IDS_PER_REQUEST]
+                try:
+                    fetched = spotify_helper.get_tracks_info([song.id for song in chunk], access_token, max_workers)
+                except Exception as e:
+                    print(f"Error hidratando lote de canciones: {e}")
+                    fetched = []
+                fetched_by_id = {spoti_song.id: spoti_song for spoti_song in fetched}
+                for song in chunk:
+                    spoti_song = fetched_by_id.get(song.id)
+                    if spoti_song:
+                        spoti_song.level_id = song.level_id
+                        saved = db.add_spotify_song(spoti_song)
+                    else:
+                        saved = False
+                    self.progress['done'] += 1
+                    self.progress['hydrated' if saved else 'failed'] += 1
+                    done = self.progress['done']
+                    if done % report_every == 0 or done == len(pending):
+                        report(dict(self.progress))
+            return self._finish()
+        finally:
+            self._lock.release()
+
+    def get_stats(self) -> dict:
+        """Progreso de la hidratación masiva y llamadas agrupadas (single-flight)"""
+        return {
+            'progress': dict(self.progress),
+            'single_flight': self._single_flight.get_stats()
+        }
+
+    def _finish(self) -> dict:
+        self.progress['running'] = False
+        self.progress['finished_at'] = time.time()
+        return dict(self.progress)
+
+    def _print_progress(self, progress: dict) -> None:
+        print(
+            f"Hidratando canciones: {progress['done']}/{progress['total']} "
+            f"({progress['hydrated']} ok, {progress['failed']} con error)"
+        )
+
+    def start_background(self, max_workers: int = HYDRATION_WORKERS) -> bool:
+        """Lanzar hydrate_all en un hilo en segundo plano"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(
+            target=self.hydrate_all,
+            kwargs={'max_workers': max_workers},
+            name='song-hydration',
+            daemon=True
+        )
+        self._thread.start()
+        return True
+
+
+# Instancia global
+hydration_service = HydrationService()
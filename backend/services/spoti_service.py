@@ -1,13 +1,17 @@
 import base64
 import os
-import requests
+from typing import Optional
 from requests.exceptions import RequestException
 
 from services.user_service import UserService
 from database.database import db
+from helpers.http_client import http_client
 
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL")
+# Credenciales propias de la aplicación (opcionales, para tareas en segundo plano)
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
 class SpotiService:
     def __init__(self):
@@ -16,7 +20,7 @@ class SpotiService:
     def get_authorization_token(self, code: str, client_id: str) -> tuple[dict, int]:
         """Get authorization token from Spotify API."""
         try:
-            user = db.get_user_by_client_id(client_id)
+            user = db.get_user_by_client_id(client_id, projection='spotify')
             if not user:
                 return {"error": "Usuario no encontrado"}, 404
                 
@@ -33,7 +37,7 @@ class SpotiService:
             auth_header = self._basic_auth(client_id, client_secret)
 
             # Make request to Spotify API
-            response = requests.post(
+            response = http_client.post(
                 SPOTIFY_TOKEN_URL,
                 data=form_data,
                 headers={
@@ -58,6 +62,76 @@ class SpotiService:
         except Exception as e:
             return {"error": str(e)}, 500
 
+    def refresh_access_token(self, username: str) -> tuple[bool, str]:
+        """
+        Renovar el access token de Spotify de un usuario con su refresh token
+        (flujo refresh_token con las credenciales de su aplicación).
+        Si Spotify no devuelve un refresh token nuevo se conserva el anterior.
+        """
+        user = db.get_user_by_username(username, include_pending=False, projection='spotify')
+        if not user:
+            return False, "Usuario no encontrado"
+        if not user.spotify_refresh_token:
+            return False, "No hay refresh token de Spotify almacenado"
+        if not user.spotify_client_id or not user.get_client_secret():
+            return False, "No hay credenciales de Spotify del usuario"
+        try:
+            response = http_client.post(
+                SPOTIFY_TOKEN_URL,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": user.spotify_refresh_token
+                },
+                headers={
+                    "Authorization": self._basic_auth(user.spotify_client_id, user.get_client_secret()),
+                    "Content-Type": "application/x-www-form-urlencoded"
+                }
+            )
+            if response.status_code != 200:
+                return False, f"Spotify rechazó la renovación del token ({response.status_code})"
+
+            token_data = response.json()
+            access_token = token_data.get("access_token")
+            if not access_token:
+                return False, "Spotify no devolvió un access token"
+            # Solo si ningún otro proceso lo renovó mientras tanto (el suyo ya está guardado)
+            saved = db.swap_spotify_tokens(
+                username,
+                user.spotify_token_expires_at,
+                access_token,
+                token_data.get("refresh_token") or user.spotify_refresh_token,
+                int(token_data.get("expires_in") or 3600)
+            )
+            if saved is None:
+                return False, "Error guardando el token renovado"
+            if not saved:
+                return True, "Access token renovado por otro proceso"
+            return True, "Access token renovado"
+        except (RequestException, ValueError) as e:
+            return False, f"Error renovando access token de Spotify: {str(e)}"
+
+    def get_client_credentials_token(self) -> Optional[str]:
+        """
+        Obtener un access token de aplicación (flujo client credentials).
+        Solo sirve para datos públicos del catálogo (tracks, artistas).
+        """
+        if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
+            return None
+        try:
+            response = http_client.post(
+                SPOTIFY_TOKEN_URL,
+                data={"grant_type": "client_credentials"},
+                headers={
+                    "Authorization": self._basic_auth(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET),
+                    "Content-Type": "application/x-www-form-urlencoded"
+                }
+            )
+            response.raise_for_status()
+            return response.json().get("access_token")
+        except RequestException as e:
+            print(f"Error obteniendo token de aplicación de Spotify: {e}")
+            return None
+
     def _basic_auth(self, client_id: str, client_secret: str) -> str:
         """Create Basic Authentication header."""
         credentials = f"{client_id}:{client_secret}"
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from typing import Optional
+from dotenv import load_dotenv
+
+from database.database import db
+from services.spoti_service import SpotiService
+
+load_dotenv()
+
+# El planificador es opcional: cada proceso que lo active recorre todos los usuarios, así que
+# con varios workers basta con activarlo en uno (la renovación al usar el token sigue en todos)
+SPOTIFY_TOKEN_REFRESH_ENABLED = os.getenv("SPOTIFY_TOKEN_REFRESH_ENABLED", "False").lower() == "true"
+# Renovar los tokens que expiran en menos de estos segundos
+SPOTIFY_TOKEN_REFRESH_MARGIN = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", 300))
+# Cada cuántos segundos se buscan tokens próximos a expirar
+SPOTIFY_TOKEN_REFRESH_INTERVAL = int(os.getenv("SPOTIFY_TOKEN_REFRESH_INTERVAL", 60))
+SPOTIFY_TOKEN_REFRESH_BATCH = int(os.getenv("SPOTIFY_TOKEN_REFRESH_BATCH", 100))
+# Tras un fallo, no se reintenta renovar el token de ese usuario hasta pasado este tiempo
+SPOTIFY_TOKEN_REFRESH_BACKOFF = int(os.getenv("SPOTIFY_TOKEN_REFRESH_BACKOFF", 900))
+# Número fijo de locks entre los que se reparten los usuarios
+SPOTIFY_TOKEN_REFRESH_LOCKS = 64
+
+
+class TokenRefreshService:
+    """
+    Renovar los access tokens de Spotify antes de que expiren, con el
+    refresh token guardado. Un hilo en segundo plano recorre el índice
+    de spotify_token_expires_at y, si una petición encuentra un token
+    expirado, se renueva en el momento. Un lock por usuario (de un
+    conjunto fijo) evita renovar el mismo token varias veces a la vez
+    en el proceso; entre procesos, el token renovado solo se guarda si
+    nadie lo cambió antes (ver Database.swap_spotify_tokens).
+    """
+
+    def __init__(
+        self,
+        margin: int = SPOTIFY_TOKEN_REFRESH_MARGIN,
+        interval: int = SPOTIFY_TOKEN_REFRESH_INTERVAL,
+        batch_size: int = SPOTIFY_TOKEN_REFRESH_BATCH,
+        backoff: int = SPOTIFY_TOKEN_REFRESH_BACKOFF
+    ):
+        self.margin = margin
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.spoti_service = SpotiService()
+        self._locks = [threading.Lock() for _ in range(SPOTIFY_TOKEN_REFRESH_LOCKS)]
+        self._failed_at = {}  # username -> timestamp del último fallo (protegido por _failed_lock)
+        self._failed_lock = threading.Lock()
+        self._stats = {'on_demand': 0, 'scheduled': 0, 'refreshed': 0, 'failed': 0, 'skipped': 0, 'scans': 0}
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get_access_token(self, username: str) -> tuple[bool, str, Optional[str]]:
+        """
+        Igual que db.get_spotify_access_token, pero si el token ha expirado
+        (o está a punto) se renueva antes de devolverlo.
+        """
+        result = db.get_spotify_access_token(username, self.margin)
+        if result[0]:
+            return result
+        if not db.has_spotify_refresh_token(username):
+            # Nunca conectó Spotify (o se desconectó): no hay nada que renovar
+            return db.get_spotify_access_token(username)
+        self._count('on_demand')
+        self.refresh(username)
+        # Si la renovación falla, el token actual puede seguir siendo válido unos segundos
+        return db.get_spotify_access_token(username)
+
+    def refresh(self, username: str) -> tuple[bool, str]:
+        """
+        Renovar el token de un usuario (si otro hilo ya lo hizo, no se repite).
+        Tras un fallo (p.ej. refresh token revocado) no se vuelve a pedir a Spotify
+        hasta pasado el backoff, tampoco desde las peticiones.
+        """
+        with self._user_lock(username):
+            # Comprobar de nuevo: otro hilo pudo renovarlo (o fallar) mientras esperábamos
+            if db.get_spotify_access_token(username, self.margin)[0]:
+                return True, "Access token válido"
+            if self._in_backoff(username, time.time()):
+                self._count('skipped')
+                return False, "Renovación del token en espera tras un fallo reciente"
+            success, message = self.spoti_service.refresh_access_token(username)
+            with self._failed_lock:
+                if success:
+                    self._failed_at.pop(username, None)
+                else:
+                    self._failed_at[username] = time.time()
+        if success:
+            self._count('refreshed')
+        else:
+            self._count('failed')
+            print(f"No se pudo renovar el token de Spotify de {username}: {message}")
+        return success, message
+
+    def refresh_expiring(self) -> int:
+        """Renovar los tokens que expiran antes del próximo recorrido; devuelve cuántos se renovaron"""
+        self._count('scans')
+        now = time.time()
+        self._prune_failures(now)
+        usernames = db.get_users_with_expiring_spotify_tokens(
+            int(now) + self.margin + self.interval, self.batch_size
+        )
+        refreshed = 0
+        for username in usernames:
+            if self._stop.is_set():
+                break
+            if self._in_backoff(username, now):
+                continue
+            self._count('scheduled')
+            if self.refresh(username)[0]:
+                refreshed += 1
+        return refreshed
+
+    def _in_backoff(self, username: str, now: float) -> bool:
+        with self._failed_lock:
+            return now - self._failed_at.get(username, 0) < self.backoff
+
+    def _prune_failures(self, now: float) -> None:
+        """Olvidar los fallos cuyo backoff ya pasó"""
+        with self._failed_lock:
+            expired = [username for username, failed_at in self._failed_at.items() if now - failed_at >= self.backoff]
+            for username in expired:
+                del self._failed_at[username]
+
+    def _user_lock(self, username: str) -> threading.Lock:
+        # Usuarios distintos pueden compartir lock: solo se serializan sus renovaciones
+        return self._locks[hash(username) % len(self._locks)]
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_expiring()
+            except Exception as e:
+                print(f"Error renovando tokens de Spotify: {e}")
+            self._stop.wait(self.interval)
+
+    def start_background(self) -> bool:
+        """Lanzar el planificador de renovaciones en un hilo en segundo plano"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='spotify-token-refresh', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['running'] = bool(self._thread and self._thread.is_alive())
+        with self._failed_lock:
+            stats['backoff_users'] = len(self._failed_at)
+        return stats
+
+
+# Instancia global
+token_refresh_service = TokenRefreshService()
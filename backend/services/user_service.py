@@ -1,6 +1,9 @@
+import hashlib
 import os
+from datetime import datetime
 from dotenv import load_dotenv
 from database.database import db
+from helpers.password_hasher import PasswordHashTimeout
 
 load_dotenv()
 
@@ -40,7 +43,7 @@ class UserService:
 			success, message = db.create_user(username, email, pwd1, spotify_client_id, spotify_client_secret)
 
 			if success:
-				user = db.get_user_by_username(username)
+				user = db.get_user_by_username(username, projection='progress')
 				token = db.create_token(user)
 				return {
 					"message": message,
@@ -50,6 +53,8 @@ class UserService:
 				}, 201
 			else:
 				return {"error": message}, 400
+		except PasswordHashTimeout:
+			return {"error": "Servidor ocupado, inténtalo de nuevo en unos segundos"}, 503
 		except Exception as e:
 			return {"error": str(e)}, 500
 
@@ -72,23 +77,38 @@ class UserService:
 				}, 200
 			else:
 				return {"error": "Credenciales inválidas"}, 401
+		except PasswordHashTimeout:
+			return {"error": "Servidor ocupado, inténtalo de nuevo en unos segundos"}, 503
 		except Exception as e:
 			return {"error": str(e)}, 500
 
 	def get_current_user(self, auth_header):
+		"""Devuelve (payload, status, etag); etag es None si la respuesta no se puede revalidar"""
 		try:
 			if not auth_header or not auth_header.lower().startswith('bearer '):
-				return {"error": "Token requerido"}, 401
+				return {"error": "Token requerido"}, 401, None
 
 			token = auth_header.split(' ')[1]
 			user = db.verify_token(token)
 
 			if user:
-				return user.to_public_dict(), 200
+				return user.to_public_dict(), 200, self._profile_etag(user)
 			else:
-				return {"error": "Token inválido"}, 401
+				return {"error": "Token inválido"}, 401, None
 		except Exception as e:
-			return {"error": str(e)}, 500
+			return {"error": str(e)}, 500, None
+
+	def _profile_etag(self, user):
+		"""
+		ETag del perfil: versión de la fila (la incrementa un trigger con cada UPDATE),
+		usuario y fecha (daily_completed cambia a medianoche sin tocar la fila).
+		Con cambios aún sin escribir (write-behind) la fila no refleja lo que se responde.
+		"""
+		if db.has_pending_progress(user.username):
+			return None
+		today = datetime.now().strftime("%d-%m-%Y")
+		identity = hashlib.blake2b(user.username.encode('utf-8'), digest_size=8).hexdigest()
+		return f"{identity}-{user.row_version}-{today}"
 
 	def update_profile(self, auth_header, data):
 		try:
@@ -114,7 +134,7 @@ class UserService:
 			success, message = db.update_user_profile(user.username, new_username, new_password)
 
 			if success:
-				updated_user = db.get_user_by_username(new_username if new_username else user.username)
+				updated_user = db.get_user_by_username(new_username if new_username else user.username, projection='progress')
 				new_token = None
 				if new_username:
 					new_token = db.create_token(updated_user)
@@ -140,7 +160,7 @@ class UserService:
 				return {"error": "Email requerido"}, 400
 
 			# Buscar credenciales del usuario
-			user = db.get_user_by_email(email.lower())
+			user = db.get_user_by_email(email.lower(), projection='spotify')
 			if user and user.spotify_client_id:
 				return {"clientId": user.spotify_client_id}, 200
 			
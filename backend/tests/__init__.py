@@ -0,0 +1,21 @@
+"""
+Tests del backend. Se ejecutan desde backend/:
+    python -m pytest tests
+    python -m unittest discover -s tests -t .
+
+Los módulos de la aplicación leen su configuración al importarse (y database
+crea la BD global), así que aquí se fija un entorno aislado antes que nada.
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix='adivina_tests_')
+
+os.environ.setdefault('DATABASE_PATH', os.path.join(_TMP_DIR, 'tests.db'))
+os.environ.setdefault('AUDIO_STORE_PATH', os.path.join(_TMP_DIR, 'audio_store'))
+os.environ.setdefault('SECRET_KEY', 'tests-secret-key-with-at-least-32-chars')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+os.environ.setdefault('BCRYPT_MIN_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('SPOTIFY_TOKEN_REFRESH_ENABLED', 'False')
+os.environ.setdefault('HYDRATE_ON_STARTUP', 'False')
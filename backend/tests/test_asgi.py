@@ -0,0 +1,88 @@
+"""Modo ASGI: Flask en un pool de hilos y la comprobación de hidratación solo tras un fallo de caché"""
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+try:
+    import asgi
+except ImportError:  # asgiref es opcional (requirements-asgi.txt)
+    asgi = None
+
+from database.database import db
+from models.song import Song
+
+
+def http_scope(path: str, headers: dict = None) -> dict:
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+        'http_version': '1.1', 'root_path': '', 'scheme': 'http',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+
+
+async def request(application, scope: dict) -> tuple[int, bytes]:
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, body
+
+
+@unittest.skipIf(asgi is None, "asgiref no está instalado")
+class AsgiTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.create_user('asgi_player', 'asgi_player@example.com', 'secret1', 'asgi-id', 'asgi-secret')
+        cls.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username('asgi_player'))}"}
+
+    def test_wsgi_requests_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def slow_app(environ, start_response):
+            # Solo pasa si las tres peticiones están a la vez en hilos distintos
+            barrier.wait()
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [threading.current_thread().name.encode()]
+
+        executor = ThreadPoolExecutor(3, thread_name_prefix='test-wsgi')
+        self.addCleanup(executor.shutdown)
+        application = asgi.PooledWsgiToAsgi(slow_app, executor)
+
+        async def run():
+            return await asyncio.gather(*(request(application, http_scope('/')) for _ in range(3)))
+
+        responses = asyncio.run(run())
+        self.assertEqual([status for status, _ in responses], [200, 200, 200])
+        self.assertEqual(len({body for _, body in responses}), 3)
+
+    def test_cached_level_skips_hydration_check(self):
+        db.add_spotify_song(Song(
+            'asgi-level', 'Asgi', 'Artist', 'Album', 2002, 'pop',
+            'https://p.example/asgi.mp3', 'https://img.example/asgi.jpg', 961
+        ))
+        application = asgi.AsyncApi(asgi.app)
+        for executor in (application.wsgi_executor, application.db_executor, application.io_executor):
+            self.addCleanup(executor.shutdown)
+        pending = mock.patch.object(asgi.game_service, 'get_pending_hydration', return_value=None).start()
+        self.addCleanup(mock.patch.stopall)
+
+        first = asyncio.run(request(application, http_scope('/api/v1/songs/961', self.headers)))
+        self.assertEqual(first[0], 200)
+        self.assertEqual(pending.call_count, 1)
+
+        second = asyncio.run(request(application, http_scope('/api/v1/songs/961', self.headers)))
+        self.assertEqual(second, first)
+        self.assertEqual(pending.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""El nivel diario no se sirve desde la caché si otro proceso rota la canción del día"""
+import sqlite3
+import unittest
+
+from app import app
+from database.database import db, DAILY_POOL_LEVEL
+from helpers.response_cache import level_response_cache
+from models.song import Song
+
+
+def hydrated_song(spotify_id: str, title: str, level_id: int) -> Song:
+    return Song(
+        spotify_id, title, f"Artist {title}", f"Album {title}", 2001, 'pop',
+        f"https://p.example/{spotify_id}.mp3", f"https://img.example/{spotify_id}.jpg", level_id
+    )
+
+
+class DailyLevelCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.create_user('daily_player', 'daily_player@example.com', 'secret1', 'daily-id', 'daily-secret')
+        cls.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username('daily_player'))}"}
+
+    def setUp(self):
+        self.client = app.test_client()
+        db.retire_daily_songs()
+        db.add_spotify_song(hydrated_song('daily-first', 'First Song', DAILY_POOL_LEVEL))
+        db.add_spotify_song(hydrated_song('daily-second', 'Second Song', DAILY_POOL_LEVEL))
+        db.init_daily_song_level('daily-first')
+
+    def rotate_in_other_process(self, spotify_id: str) -> None:
+        """Rotar la canción del día con otra conexión, sin pasar por la caché de este proceso"""
+        conn = sqlite3.connect(db.pool.database_path)
+        try:
+            conn.execute('UPDATE spotify_songs SET level_id = ? WHERE level_id = 0', (DAILY_POOL_LEVEL,))
+            conn.execute('UPDATE spotify_songs SET level_id = 0 WHERE spotify_id = ?', (spotify_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def daily_id(self) -> str:
+        response = self.client.get('/api/v1/songs/0', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['id']
+
+    def validate(self, answer: str) -> bool:
+        response = self.client.post('/api/v1/game/validate', json={'level_id': '0', 'answer': answer})
+        return response.get_json()['correct']
+
+    def test_serves_the_current_daily_song(self):
+        self.assertEqual(self.daily_id(), 'daily-first')
+        self.assertEqual(self.daily_id(), 'daily-first')  # desde la caché
+        self.assertTrue(self.validate('First Song'))
+
+        self.rotate_in_other_process('daily-second')
+        self.assertEqual(self.daily_id(), 'daily-second')
+        self.assertTrue(self.validate('Second Song'))
+        self.assertFalse(self.validate('First Song'))
+
+    def test_regular_levels_are_still_cached(self):
+        db.add_spotify_song(hydrated_song('cached-level', 'Cached', 901))
+        self.client.get('/api/v1/songs/901', headers=self.headers)
+        hits = level_response_cache.get_stats()['hits']
+        response = self.client.get('/api/v1/songs/901', headers=self.headers)
+        self.assertEqual(response.get_json()['id'], 'cached-level')
+        self.assertEqual(level_response_cache.get_stats()['hits'], hits + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""ETag, 304 y Cache-Control de /songs, /ranking y /auth/me (incluidas las ETags de las variantes comprimidas)"""
+import gzip
+import unittest
+import zlib
+
+from app import app
+from database.database import db
+from helpers.http_cache import PRIVATE_REVALIDATE, PUBLIC_REVALIDATE
+from models.song import Song
+
+
+def song(title: str, level_id: int) -> Song:
+    # Título largo: el cuerpo supera COMPRESSION_MIN_BYTES y se comprime
+    return Song(
+        f"etag-level-{level_id}", title * 200, 'Artist', 'Album', 2003, 'pop',
+        f"https://p.example/{level_id}.mp3", f"https://img.example/{level_id}.jpg", level_id
+    )
+
+
+class HttpCacheTest(unittest.TestCase):
+    counter = 0
+
+    def setUp(self):
+        HttpCacheTest.counter += 1
+        self.username = f"etag{self.counter}"
+        success, message = db.create_user(
+            self.username, f"{self.username}@example.com", 'secret1', f"{self.username}-id", f"{self.username}-secret"
+        )
+        self.assertTrue(success, message)
+        self.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username(self.username))}"}
+        self.client = app.test_client()
+
+    def get(self, path: str, etag: str = None, **headers):
+        headers = {**self.headers, **headers}
+        if etag:
+            headers['If-None-Match'] = f'"{etag}"'
+        return self.client.get(path, headers=headers)
+
+    def etag(self, response) -> str:
+        etag, weak = response.get_etag()
+        self.assertTrue(etag)
+        self.assertFalse(weak)
+        return etag
+
+    def assertNotModified(self, response, etag: str):
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.get_etag()[0], etag)
+
+    def submit_score(self, level_id: str, score: int = 100):
+        response = self.client.post(
+            '/api/v1/game/submit-score', json={'score': score, 'level_id': level_id}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+    def test_song_round_trip(self):
+        db.add_spotify_song(song('Round Trip ', 971))
+        first = self.get('/api/v1/songs/971')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Cache-Control'], PRIVATE_REVALIDATE)
+        etag = self.etag(first)
+
+        self.assertNotModified(self.get('/api/v1/songs/971', etag), etag)
+        # Otra ETag (p.ej. de otra versión): respuesta completa
+        self.assertEqual(self.get('/api/v1/songs/971', 'stale').status_code, 200)
+
+    def test_song_etag_changes_after_add_spotify_song(self):
+        db.add_spotify_song(song('Before ', 972))
+        etag = self.etag(self.get('/api/v1/songs/972'))
+
+        db.add_spotify_song(song('After ', 972))
+        response = self.get('/api/v1/songs/972', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'After', response.data)
+        new_etag = self.etag(response)
+        self.assertNotEqual(new_etag, etag)
+        self.assertNotModified(self.get('/api/v1/songs/972', new_etag), new_etag)
+
+    def test_compressed_variants_have_their_own_etag(self):
+        db.add_spotify_song(song('Variant ', 973))
+        plain = self.etag(self.get('/api/v1/songs/973', **{'Accept-Encoding': 'identity'}))
+
+        for encoding, decompress in (('gzip', gzip.decompress), ('deflate', zlib.decompress)):
+            response = self.get('/api/v1/songs/973', **{'Accept-Encoding': encoding})
+            self.assertEqual(response.headers['Content-Encoding'], encoding)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertIn(b'Variant', decompress(response.data))
+            variant = self.etag(response)
+            self.assertEqual(variant, f"{plain}-{encoding}")
+
+            # La ETag de la variante revalida la misma versión
+            not_modified = self.get('/api/v1/songs/973', variant, **{'Accept-Encoding': encoding})
+            self.assertNotModified(not_modified, variant)
+            self.assertIn('Accept-Encoding', not_modified.headers['Vary'])
+
+        # Con la ETag sin comprimir también vale aunque el cliente acepte gzip
+        self.assertNotModified(self.get('/api/v1/songs/973', plain, **{'Accept-Encoding': 'gzip'}), plain)
+
+    def test_stale_variant_etag_gets_new_body(self):
+        db.add_spotify_song(song('Old variant ', 974))
+        variant = self.etag(self.get('/api/v1/songs/974', **{'Accept-Encoding': 'gzip'}))
+        db.add_spotify_song(song('New variant ', 974))
+
+        response = self.get('/api/v1/songs/974', variant, **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'New variant', gzip.decompress(response.data))
+        self.assertNotEqual(self.etag(response), variant)
+
+    def test_ranking_round_trip_and_version_bump(self):
+        first = self.get('/api/v1/ranking')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Cache-Control'], PUBLIC_REVALIDATE)
+        etag = self.etag(first)
+        self.assertNotModified(self.get('/api/v1/ranking', etag), etag)
+        # Cada límite es un recurso distinto
+        self.assertNotEqual(self.etag(self.get('/api/v1/ranking?limit=5')), etag)
+
+        self.submit_score('41')
+        response = self.get('/api/v1/ranking', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(self.etag(response), etag)
+
+    def test_profile_round_trip_and_version_bump(self):
+        first = self.get('/api/v1/auth/me')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Cache-Control'], PRIVATE_REVALIDATE)
+        self.assertIn('Authorization', first.headers['Vary'])
+        etag = self.etag(first)
+        self.assertNotModified(self.get('/api/v1/auth/me', etag), etag)
+
+        self.submit_score('42', 70)
+        response = self.get('/api/v1/auth/me', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total_score'], 70)
+        self.assertNotEqual(self.etag(response), etag)
+
+    def test_errors_have_no_validators(self):
+        response = self.client.get('/api/v1/auth/me', headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(response.get_etag()[0])
+        self.assertNotIn('Cache-Control', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
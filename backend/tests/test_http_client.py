@@ -0,0 +1,134 @@
+"""HttpClient contra un servidor HTTP local de pruebas (keep-alive, reintentos y estadísticas)"""
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers.http_client import HttpClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Rutas:
+      /ok           200 siempre
+      /flaky/<n>    503 las n primeras veces, después 200
+      /slow-down    429 con Retry-After: 3600 la primera vez, después 200
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        with server.lock:
+            hits = server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.client_ports.add(self.client_address[1])
+        if self.path.startswith('/flaky/'):
+            failures = int(self.path.rsplit('/', 1)[1])
+            self._reply(503 if hits <= failures else 200)
+        elif self.path == '/slow-down':
+            self._reply(429 if hits == 1 else 200, {'Retry-After': '3600'} if hits == 1 else None)
+        else:
+            self._reply(200)
+
+    def _reply(self, status: int, headers: dict = None):
+        body = b'{"ok": true}' if status == 200 else b'{"error": "stub"}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = {}
+        self.server.client_ports = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.host = f"127.0.0.1:{self.server.server_address[1]}"
+        self.base_url = f"http://{self.host}"
+        self.client = HttpClient(retries=3, backoff_factor=0.01, timeout=5, max_retry_after=0.2)
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_keep_alive_connection(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.base_url + '/ok').status_code, 200)
+        self.assertEqual(self.server.hits['/ok'], 5)
+        # Una sola conexión TCP para las 5 peticiones
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertEqual(self.client.get_stats()[self.host]['connections_opened'], 1)
+
+    def test_retries_idempotent_get_with_backoff(self):
+        response = self.client.get(self.base_url + '/flaky/2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits['/flaky/2'], 3)
+
+    def test_gives_up_after_configured_retries(self):
+        response = self.client.get(self.base_url + '/flaky/10')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.hits['/flaky/10'], 4)  # 1 + 3 reintentos
+
+    def test_does_not_retry_post(self):
+        response = self.client.post(self.base_url + '/flaky/1', data={'grant_type': 'client_credentials'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.hits['/flaky/1'], 1)
+
+    def test_caps_retry_after_wait(self):
+        start = time.monotonic()
+        response = self.client.get(self.base_url + '/slow-down')
+        elapsed = time.monotonic() - start
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits['/slow-down'], 2)
+        self.assertLess(elapsed, 2)  # no las 3600 s que pide el servidor
+
+    def test_stats_per_host(self):
+        self.client.get(self.base_url + '/ok')
+        self.client.get(self.base_url + '/ok')
+        self.client.post(self.base_url + '/flaky/1')
+        other_host = f"localhost:{self.server.server_address[1]}"
+        self.client.get(f"http://{other_host}/ok")
+
+        stats = self.client.get_stats()
+        self.assertEqual(stats[self.host]['requests'], 3)
+        self.assertEqual(stats[self.host]['errors'], 1)
+        self.assertGreater(stats[self.host]['avg_ms'], 0)
+        self.assertEqual(stats[other_host]['requests'], 1)
+        self.assertEqual(stats[other_host]['errors'], 0)
+        self.assertEqual(stats[other_host]['connections_opened'], 1)
+
+    def test_connection_counts_survive_pool_eviction(self):
+        client = HttpClient(pool_connections=1, retries=0, timeout=5)
+        self.addCleanup(client.session.close)
+        other_host = f"localhost:{self.server.server_address[1]}"
+        client.get(self.base_url + '/ok')
+        # Un solo pool: el del segundo host expulsa al del primero (y cierra su conexión)
+        client.get(f"http://{other_host}/ok")
+        stats = client.get_stats()
+        self.assertEqual(stats[self.host]['connections_opened'], 1)
+        self.assertEqual(stats[other_host]['connections_opened'], 1)
+
+        client.get(self.base_url + '/ok')
+        self.assertEqual(client.get_stats()[self.host]['connections_opened'], 2)
+        self.assertEqual(len(self.server.client_ports), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
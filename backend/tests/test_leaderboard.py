@@ -0,0 +1,103 @@
+"""Ranking en memoria: carga inicial y cambios de otros procesos aplicados sin recorrer la tabla"""
+import sqlite3
+import unittest
+from unittest import mock
+
+from database.database import db
+
+
+class LeaderboardTest(unittest.TestCase):
+    counter = 0
+
+    def setUp(self):
+        LeaderboardTest.counter += 1
+        self.prefix = f"lb{self.counter}_"
+        for name in ('a', 'b'):
+            self.create_user(self.prefix + name)
+        db.get_ranking()  # cargado
+        load = db._load_leaderboard_rows
+        self.full_loads = mock.patch.object(db, '_load_leaderboard_rows', side_effect=load).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def create_user(self, username: str) -> None:
+        success, message = db.create_user(
+            username, f"{username}@example.com", 'secret1', f"{username}-id", f"{username}-secret"
+        )
+        self.assertTrue(success, message)
+
+    def ranking(self) -> dict:
+        """username -> (total_score, levels_completed) de los usuarios de este test"""
+        return {
+            row['username']: (row['total_score'], row['levels_completed'])
+            for row in db.get_ranking(-1) if row['username'].startswith(self.prefix)
+        }
+
+    def stored_ranking(self) -> dict:
+        conn = sqlite3.connect(db.pool.database_path)
+        try:
+            rows = conn.execute(
+                'SELECT username, total_score FROM users WHERE username LIKE ?', (self.prefix + '%',)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {username: total_score for username, total_score in rows}
+
+    def write_in_other_process(self, *statements: tuple) -> None:
+        """Escribir con otra conexión: para este proceso, como si lo hiciera otro worker"""
+        conn = sqlite3.connect(db.pool.database_path)
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_bootstrap_matches_database(self):
+        db.leaderboard.invalidate()
+        self.assertEqual({name: score for name, (score, _) in self.ranking().items()}, self.stored_ranking())
+        self.assertEqual(self.full_loads.call_count, 1)
+
+    def test_applies_other_process_changes_incrementally(self):
+        a, b, c = self.prefix + 'a', self.prefix + 'b', self.prefix + 'c'
+        self.write_in_other_process(
+            ('UPDATE users SET total_score = 70 WHERE username = ?', (a,)),
+            ('UPDATE users SET username = ? WHERE username = ?', (b + '2', b)),
+            ('''
+                INSERT INTO users (username, email, hashed_password, spotify_client_id, spotify_client_secret, total_score)
+                VALUES (?, ?, 'x', ?, ?, 40)
+            ''', (c, f"{c}@example.com", f"{c}-id", f"{c}-secret")),
+        )
+        db._sync_leaderboard()
+
+        self.assertEqual(self.ranking(), {a: (70, 0), b + '2': (0, 0), c: (40, 0)})
+        self.assertEqual(self.full_loads.call_count, 0)
+
+        self.write_in_other_process(('DELETE FROM users WHERE username = ?', (c,)))
+        db._sync_leaderboard()
+        self.assertNotIn(c, self.ranking())
+        self.assertEqual(self.full_loads.call_count, 0)
+
+    def test_own_write_after_other_process_write(self):
+        a, b = self.prefix + 'a', self.prefix + 'b'
+        self.write_in_other_process(('UPDATE users SET total_score = 30 WHERE username = ?', (b,)))
+        # Sin esperar a LEADERBOARD_SYNC_INTERVAL: la escritura propia pone antes al día el ranking
+        result, total_score = db.submit_score(a, '5', 50)
+        self.assertEqual(total_score, 50)
+        self.assertEqual(self.ranking(), {a: (50, 1), b: (30, 0)})
+        self.assertEqual(self.full_loads.call_count, 0)
+
+    def test_changes_are_read_through_the_index(self):
+        conn = sqlite3.connect(db.pool.database_path)
+        try:
+            plan = ' '.join(
+                row[-1] for row in conn.execute(
+                    'EXPLAIN QUERY PLAN SELECT username FROM users WHERE ranking_version > ?', (0,)
+                )
+            )
+        finally:
+            conn.close()
+        self.assertIn('idx_users_ranking_version', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Audio de las canciones locales: URL sin cabecera Host y archivos recreados si faltan en el almacén"""
+import base64
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import app
+from database import database
+from database.database import db
+from helpers.audio_store import audio_store
+from helpers.response_cache import level_response_cache
+
+AUDIO = os.urandom(4096)
+
+
+class LocalAudioTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.json_path = os.path.join(tempfile.mkdtemp(), 'local_songs.json')
+        with open(cls.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'songs': [{
+                'id': 501, 'title': 'Local', 'artists': 'Band', 'album': 'Demo', 'year': 1999, 'genre': 'rock',
+                'audio_codificado': 'data:audio/mpeg;base64,' + base64.b64encode(AUDIO).decode(),
+                'image_url': 'https://img.example/local.jpg'
+            }]}, f)
+        cls.json_patch = mock.patch.object(database, 'LOCAL_SONGS_JSON_PATH', cls.json_path)
+        cls.json_patch.start()
+        db.init_local_songs()
+        db.migrate_local_audio()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.json_patch.stop()
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def audio_url(self, **kwargs) -> str:
+        response = self.client.get('/api/v1/songs/501_local', **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['audio']
+
+    def delete_stored_audio(self, audio_hash: str) -> None:
+        os.remove(audio_store.path_for(audio_hash))
+        self.assertIsNone(audio_store.path_for(audio_hash))
+
+    def test_audio_url_ignores_host_header(self):
+        url = self.audio_url()
+        self.assertRegex(url, r'^/api/v1/audio/[0-9a-f]{64}$')
+
+        entries = level_response_cache.get_stats()['size']
+        for host in ('evil.example', 'other.example:8080'):
+            self.assertEqual(self.audio_url(headers={'Host': host}), url)
+        # Un Host distinto no añade entradas a la caché
+        self.assertEqual(level_response_cache.get_stats()['size'], entries)
+
+    def test_recreates_missing_audio_on_request(self):
+        path = self.audio_url()
+        self.delete_stored_audio(path.rsplit('/', 1)[1])
+
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, AUDIO)
+        response.close()
+
+    def test_recreates_missing_audio_at_startup(self):
+        audio_hash = self.audio_url().rsplit('/', 1)[1]
+        self.delete_stored_audio(audio_hash)
+
+        db.migrate_local_audio()
+        self.assertIsNotNone(audio_store.path_for(audio_hash))
+
+    def test_unknown_audio_is_404(self):
+        self.assertEqual(self.client.get('/api/v1/audio/' + 'a' * 64).status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/audio/not-a-hash').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
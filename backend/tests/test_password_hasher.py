@@ -0,0 +1,67 @@
+"""Coste de bcrypt y rehash de contraseñas"""
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import bcrypt
+
+from helpers import password_hasher as module
+from helpers.password_hasher import PasswordHasher, PasswordHashTimeout
+
+
+def bcrypt_hash(rounds: int) -> str:
+    return bcrypt.hashpw(b'secret1', bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+class PasswordHasherTest(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=5, workers=0)
+
+    def test_rehashes_only_weaker_hashes(self):
+        self.assertTrue(self.hasher.needs_rehash(bcrypt_hash(4)))
+        self.assertFalse(self.hasher.needs_rehash(bcrypt_hash(5)))
+        # Un hash más costoso no se debilita
+        self.assertFalse(self.hasher.needs_rehash(bcrypt_hash(6)))
+        self.assertTrue(self.hasher.needs_rehash('not-a-bcrypt-hash'))
+
+    def test_fixed_rounds_respect_minimum(self):
+        self.assertEqual(PasswordHasher(rounds=module.BCRYPT_MIN_ROUNDS - 1, workers=0).rounds, module.BCRYPT_MIN_ROUNDS)
+        self.assertEqual(PasswordHasher(rounds=99, workers=0).rounds, module.BCRYPT_MAX_ROUNDS)
+
+
+class PasswordHasherPoolTest(unittest.TestCase):
+    def hasher_with_pool(self, executor) -> PasswordHasher:
+        hasher = PasswordHasher(rounds=5, workers=1, timeout=0.05)
+        hasher._executor = executor
+        return hasher
+
+    def test_timeout_keeps_the_pool(self):
+        pending = Future()
+        executor = mock.Mock(submit=mock.Mock(return_value=pending))
+        hasher = self.hasher_with_pool(executor)
+
+        with self.assertRaises(PasswordHashTimeout):
+            hasher.hash_password('secret1')
+        # Pool saturado: no se cancela el resto de la cola ni se calcula en el hilo de la petición
+        executor.shutdown.assert_not_called()
+        self.assertIs(hasher._executor, executor)
+        self.assertTrue(pending.cancelled())
+        stats = hasher.get_stats()
+        self.assertEqual((stats['timeouts'], stats['pool_errors'], stats['inline']), (1, 0, 0))
+
+    def test_broken_pool_is_recreated(self):
+        executor = mock.Mock(submit=mock.Mock(side_effect=BrokenProcessPool('worker died')))
+        hasher = self.hasher_with_pool(executor)
+
+        with mock.patch('builtins.print'):
+            hashed = hasher.hash_password('secret1')
+        self.assertTrue(bcrypt.checkpw(b'secret1', hashed.encode('utf-8')))
+        executor.shutdown.assert_called_once()
+        self.assertIsNone(hasher._executor)
+        stats = hasher.get_stats()
+        self.assertEqual((stats['pool_errors'], stats['inline']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""El límite de bytes de ResponseCache cuenta también las variantes comprimidas"""
+import gzip
+import os
+import unittest
+
+from app import app
+from database.database import db
+from helpers.response_cache import EncodedResponse, ResponseCache, level_response_cache
+from models.song import Song
+
+
+def body(size: int) -> EncodedResponse:
+    return EncodedResponse(os.urandom(size))
+
+
+class ResponseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.create_user('cache_player', 'cache_player@example.com', 'secret1', 'cache-id', 'cache-secret')
+        cls.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username('cache_player'))}"}
+
+    def test_variants_count_towards_bytes(self):
+        cache = ResponseCache(max_bytes=1000, max_entry_bytes=1000)
+        response = body(400)
+        cache.put('a', response)
+        self.assertEqual(response.add_variant('gzip', b'x' * 100), b'x' * 100)
+        self.assertEqual(cache.get_stats()['bytes'], 500)
+
+        # Otra variante para la misma codificación no se cuenta dos veces
+        self.assertEqual(response.add_variant('gzip', b'y' * 100), b'x' * 100)
+        self.assertEqual(cache.get_stats()['bytes'], 500)
+
+        cache.invalidate('a')
+        self.assertEqual(cache.get_stats()['bytes'], 0)
+
+    def test_variant_evicts_least_recently_used(self):
+        cache = ResponseCache(max_bytes=1000, max_entry_bytes=1000)
+        first, second = body(400), body(400)
+        cache.put('first', first)
+        cache.put('second', second)
+        second.add_variant('gzip', b'x' * 300)
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['size'], stats['bytes'], stats['evictions']), (1, 700, 1))
+        self.assertIsNone(cache.get('first'))
+        self.assertIs(cache.get('second'), second)
+
+        # Una respuesta expulsada ya no suma al añadirle variantes
+        first.add_variant('gzip', b'x' * 300)
+        self.assertEqual(cache.get_stats()['bytes'], 700)
+
+    def test_replaced_and_cleared_entries_release_variants(self):
+        cache = ResponseCache(max_bytes=1000, max_entry_bytes=1000)
+        old = body(200)
+        cache.put('a', old)
+        old.add_variant('deflate', b'x' * 50)
+        cache.put('a', body(300))
+        self.assertEqual(cache.get_stats()['bytes'], 300)
+
+        old.add_variant('gzip', b'x' * 50)
+        self.assertEqual(cache.get_stats()['bytes'], 300)
+
+        cache.clear()
+        self.assertEqual(cache.get_stats()['bytes'], 0)
+
+    def test_compressed_level_is_counted(self):
+        db.add_spotify_song(Song(
+            'compressed-level', 'Compressed ' * 200, 'Artist', 'Album', 2001, 'pop',
+            'https://p.example/compressed.mp3', 'https://img.example/compressed.jpg', 951
+        ))
+        client = app.test_client()
+        client.get('/api/v1/songs/951', headers=self.headers)
+        before = level_response_cache.get_stats()['bytes']
+
+        response = client.get('/api/v1/songs/951', headers={**self.headers, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(level_response_cache.get_stats()['bytes'], before + len(response.data))
+        self.assertIn(b'compressed-level', gzip.decompress(response.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
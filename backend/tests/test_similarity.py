@@ -0,0 +1,121 @@
+"""is_similar decide lo mismo que SequenceMatcher(None, a, b).ratio() >= umbral"""
+import json
+import os
+import random
+import string
+import unittest
+from difflib import SequenceMatcher
+
+from controllers.game_controller import game_service
+from helpers.answer_normalizer import normalize_title
+from helpers.similarity import is_similar, MAX_ANSWER_LENGTH, SIMILARITY_THRESHOLD
+
+SONGS_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'songs_local_data&spotify_ids', 'spotify_songs.json'
+)
+ALPHABET = string.ascii_lowercase + ' '
+
+
+def load_titles() -> list[str]:
+    with open(SONGS_JSON, 'r', encoding='utf-8') as f:
+        levels = json.load(f).get('levels', [])
+    return [normalize_title(level['song']) for level in levels if level.get('song')]
+
+
+def perturb(text: str, rng: random.Random, edits: int) -> str:
+    """`edits` inserciones, borrados o sustituciones al azar"""
+    chars = list(text)
+    for _ in range(edits):
+        op = rng.choice('ids')
+        pos = rng.randrange(len(chars) + 1)
+        if op == 'i' or not chars:
+            chars.insert(pos, rng.choice(ALPHABET))
+        elif op == 'd':
+            del chars[min(pos, len(chars) - 1)]
+        else:
+            chars[min(pos, len(chars) - 1)] = rng.choice(ALPHABET)
+    return ''.join(chars)
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def build_corpus(titles: list[str], rng: random.Random) -> list[tuple[str, str]]:
+    """Pares (respuesta, título): variantes con pocas erratas, otros títulos, prefijos, ruido y vacíos"""
+    corpus = []
+    for title in titles:
+        for edits in range(0, 6):
+            corpus.append((perturb(title, rng, edits), title))
+        corpus.append((rng.choice(titles), title))
+        corpus.append((title[: max(1, len(title) // 2)], title))
+        corpus.append((random_text(rng, len(title)), title))
+        corpus.append((random_text(rng, 400), title))
+        corpus.append(('', title))
+    return corpus
+
+
+def build_long_corpus(rng: random.Random) -> list[tuple[str, str]]:
+    """Pares de más de 500 caracteres (a partir de 200, difflib aplica su heurística autojunk)"""
+    corpus = []
+    for length in (501, 650, 1200):
+        title = random_text(rng, length)
+        repeated = (random_text(rng, 7) + ' ') * (length // 8)
+        for base in (title, repeated):
+            for edits in (0, length // 40, length // 15, length // 5):
+                corpus.append((perturb(base, rng, edits), base))
+                corpus.append((base, perturb(base, rng, edits)))
+            corpus.append((random_text(rng, length), base))
+            corpus.append((base[: length // 2], base))
+            corpus.append(('', base))
+            corpus.append((base, ''))
+    return corpus
+
+
+def reference(answer: str, title: str, threshold: float = SIMILARITY_THRESHOLD) -> bool:
+    return SequenceMatcher(None, answer, title).ratio() >= threshold
+
+
+class SimilarityTest(unittest.TestCase):
+    def assertSameDecisions(self, corpus: list, threshold: float = SIMILARITY_THRESHOLD):
+        mismatches = [
+            (answer, title) for answer, title in corpus
+            if is_similar(answer, title, threshold) != reference(answer, title, threshold)
+        ]
+        self.assertEqual(mismatches, [])
+
+    def test_matches_sequence_matcher_on_level_titles(self):
+        corpus = build_corpus(load_titles(), random.Random(1234))
+        self.assertSameDecisions(corpus)
+        # El corpus ejercita los dos lados de la decisión
+        accepted = sum(1 for answer, title in corpus if reference(answer, title))
+        self.assertGreater(accepted, 0)
+        self.assertLess(accepted, len(corpus))
+
+    def test_matches_sequence_matcher_on_long_texts(self):
+        self.assertSameDecisions(build_long_corpus(random.Random(99)))
+
+    def test_matches_sequence_matcher_on_empty_texts(self):
+        corpus = [('', ''), ('', 'a'), ('a', ''), ('', 'bohemian rhapsody'), ('bohemian rhapsody', '')]
+        self.assertSameDecisions(corpus)
+        self.assertTrue(is_similar('', ''))
+
+    def test_matches_sequence_matcher_on_other_thresholds(self):
+        corpus = build_corpus(load_titles()[:50], random.Random(7))
+        for threshold in (0.5, 0.7, 0.9, 1.0):
+            self.assertSameDecisions(corpus, threshold)
+
+    def test_answers_over_max_length_are_rejected(self):
+        title = normalize_title('a' * MAX_ANSWER_LENGTH)
+        self.assertTrue(game_service._check_answer('a' * MAX_ANSWER_LENGTH, (title,)))
+        # Se rechaza aunque SequenceMatcher la aceptaría
+        answer = 'a' * (MAX_ANSWER_LENGTH + 1)
+        self.assertTrue(reference(normalize_title(answer), title))
+        self.assertFalse(game_service._check_answer(answer, (title,)))
+
+    def test_empty_answer_is_rejected(self):
+        self.assertFalse(game_service._check_answer('', (normalize_title('Yesterday'),)))
+
+
+if __name__ == '__main__':
+    unittest.main()
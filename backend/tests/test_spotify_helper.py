@@ -0,0 +1,224 @@
+"""SpotifyHelper por lotes e hidratación contra una API de Spotify falsa en local"""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from app import app
+from database.database import db, DAILY_POOL_LEVEL
+from helpers import spotify_preview
+from helpers.genre_cache import ArtistGenreCache
+from helpers.spotify_helper import SpotifyHelper, MAX_IDS_PER_REQUEST
+from services.game_service import GameService
+from services.hydration_service import hydration_service, genre_cache, spotify_helper
+
+
+def fake_track(track_id: str) -> dict:
+    # "<prefijo>-<n>": los tracks con el mismo prefijo y la misma última cifra comparten primer artista
+    prefix, _, number = track_id.rpartition('-')
+    artist_id = f"{prefix or 'track'}-artist-{number[-1]}"
+    return {
+        'id': track_id,
+        'name': f"Song {track_id}",
+        'artists': [{'id': artist_id, 'name': f"Artist {artist_id}"}, {'id': 'featured', 'name': 'Featured'}],
+        'album': {
+            'name': f"Album {track_id}",
+            'release_date': '2001-05-01',
+            'images': [{'url': f"https://img.example/{track_id}.jpg"}]
+        }
+    }
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """/v1/tracks, /v1/tracks/<id>, /v1/artists, /v1/artists/<id> y /embed/track/<id>"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        ids = parse_qs(url.query).get('ids', [''])[0].split(',')
+        with self.server.lock:
+            self.server.calls.append((url.path, ids if url.query else []))
+        if url.path == '/v1/tracks':
+            self._json({'tracks': [None if track_id.startswith('missing') else fake_track(track_id) for track_id in ids]})
+        elif url.path.startswith('/v1/tracks/'):
+            self._json(fake_track(url.path.rsplit('/', 1)[1]))
+        elif url.path == '/v1/artists':
+            self._json({'artists': [self._artist(artist_id) for artist_id in ids]})
+        elif url.path.startswith('/v1/artists/'):
+            self._json(self._artist(url.path.rsplit('/', 1)[1]))
+        elif url.path.startswith('/embed/track/'):
+            track_id = url.path.rsplit('/', 1)[1]
+            self._send(200, 'text/html', (
+                '<html><script>{"audioPreview": {"url": "https://p.example/%s.mp3"}}</script></html>' % track_id
+            ).encode())
+        else:
+            self._send(404, 'application/json', b'{}')
+
+    def _artist(self, artist_id: str) -> dict:
+        return {'id': artist_id, 'genres': [] if artist_id.endswith('-artist-0') else [f"genre of {artist_id}"]}
+
+    def _json(self, payload: dict):
+        self._send(200, 'application/json', json.dumps(payload).encode())
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSpotifyTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSpotifyHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.calls = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.api_url = base_url + '/v1'
+        cls.embed_patch = mock.patch.object(spotify_preview, 'SPOTIFY_EMBED_URL', base_url + '/embed')
+        cls.embed_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.embed_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.calls.clear()
+        self.helper = SpotifyHelper(genre_cache)
+        self.helper.api_url = self.api_url
+
+    def calls_to(self, path: str) -> list[list[str]]:
+        return [ids for call_path, ids in self.server.calls if call_path == path]
+
+
+class BatchFetchTest(FakeSpotifyTestCase):
+    def test_chunks_tracks_at_50_ids(self):
+        ids = [f"chunk-{i}" for i in range(120)]
+        songs = self.helper.get_tracks_info(ids + ids[:10], 'token')
+
+        self.assertEqual([len(chunk) for chunk in self.calls_to('/v1/tracks')], [50, 50, 20])
+        self.assertTrue(all(len(chunk) <= MAX_IDS_PER_REQUEST for chunk in self.calls_to('/v1/artists')))
+        # En el orden pedido y sin repetir
+        self.assertEqual([song.id for song in songs], ids)
+
+    def test_deduplicates_artist_ids_and_uses_genre_cache(self):
+        songs = self.helper.get_tracks_info([f"dedup-{i}" for i in range(40)], 'token')
+
+        artist_calls = self.calls_to('/v1/artists')
+        self.assertEqual(len(artist_calls), 1)
+        self.assertEqual(sorted(artist_calls[0]), sorted({f"dedup-artist-{i}" for i in range(10)}))
+        self.assertEqual(songs[3].genre, 'genre of dedup-artist-3')
+        self.assertEqual(songs[0].genre, 'Unknown')  # artista sin géneros
+
+        self.server.calls.clear()
+        self.helper.get_tracks_info([f"dedup-{i}" for i in range(40, 80)], 'token')
+        self.assertEqual(self.calls_to('/v1/artists'), [])
+
+    def test_chunks_artists_at_50_ids(self):
+        genres = self.helper.get_artists_genres([f"many-{i}" for i in range(60)] + ['many-1'], 'token')
+        self.assertEqual([len(chunk) for chunk in self.calls_to('/v1/artists')], [50, 10])
+        self.assertEqual(len(genres), 60)
+
+    def test_genre_cache_reads_and_writes_through_its_storage(self):
+        saved = {}
+        cache = ArtistGenreCache(saved.get, lambda artist_id, genre, fetched_at: saved.update({artist_id: (genre, fetched_at)}))
+        self.helper.genre_cache = cache
+        genres = self.helper.get_artists_genres(['store-artist-1'], 'token')
+        self.assertEqual(genres, {'store-artist-1': 'genre of store-artist-1'})
+        self.assertEqual(saved['store-artist-1'][0], 'genre of store-artist-1')
+
+        # Otra caché (p.ej. otro proceso) con el mismo almacén no vuelve a preguntar a Spotify
+        self.server.calls.clear()
+        self.helper.genre_cache = cold = ArtistGenreCache(saved.get, mock.Mock())
+        self.assertEqual(self.helper.get_artists_genres(['store-artist-1'], 'token'), genres)
+        self.assertEqual(self.calls_to('/v1/artists'), [])
+        self.assertEqual(cold.get_stats()['db_hits'], 1)
+
+    def test_skips_missing_tracks(self):
+        songs = self.helper.get_tracks_info(['present-1', 'missing-1', 'present-2'], 'token')
+        self.assertEqual([song.id for song in songs], ['present-1', 'present-2'])
+
+    def test_same_song_shape_as_get_track_info(self):
+        batch = self.helper.get_tracks_info(['shape-7'], 'token')[0]
+        single = self.helper.get_track_info('shape-7', 'token')
+        self.assertEqual(batch.to_dict(), single.to_dict())
+        self.assertEqual(batch.to_dict(), {
+            'id': 'shape-7',
+            'title': 'Song shape-7',
+            'artists': 'Artist shape-artist-7, Featured',
+            'album': 'Album shape-7',
+            'year': 2001,
+            'genre': 'genre of shape-artist-7',
+            'audio': 'https://p.example/shape-7.mp3',
+            'image_url': 'https://img.example/shape-7.jpg',
+            'level_id': -999
+        })
+
+
+class HydrationTest(FakeSpotifyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game_service = GameService()  # registra las candidatas a canción del día
+        self.api_patch = mock.patch.object(spotify_helper, 'api_url', self.api_url)
+        self.api_patch.start()
+
+    def tearDown(self):
+        self.api_patch.stop()
+
+    def test_hydrates_levels_and_daily_pool(self):
+        pool = list(self.game_service.daily_songs)
+        reports = []
+        result = hydration_service.hydrate_all(access_token='token', report=reports.append, report_every=50)
+
+        self.assertNotIn('error', result)
+        # Progreso cada 50 canciones y al terminar, no una línea por canción
+        total = result['total']
+        self.assertEqual([progress['done'] for progress in reports], sorted({*range(50, total, 50), total}))
+        self.assertEqual(db.get_unhydrated_spotify_songs(), [])
+        # Una petición a /tracks por cada 50 canciones (niveles + candidatas a canción del día)
+        self.assertEqual(len(self.calls_to('/v1/tracks')), -(-result['total'] // MAX_IDS_PER_REQUEST))
+        self.assertTrue(db.get_spotify_song_by_level(0).is_hydrated())
+
+        # Al rotar la canción del día, la nueva ya tiene sus datos
+        for _ in range(5):
+            self.game_service.set_daily_song()
+            daily = db.get_spotify_song_by_level(0)
+            self.assertEqual(daily.id, self.game_service.daily_song_id)
+            self.assertTrue(daily.is_hydrated())
+            self.assertIn(daily.id, pool)
+        self.assertEqual(db.get_unhydrated_spotify_songs(), [])
+
+    def test_pool_songs_are_not_levels(self):
+        self.assertIsNone(self.game_service._title_cache_key(str(DAILY_POOL_LEVEL)))
+
+        # Una candidata que ya es la canción de un nivel no puede ser la del día
+        conn = db.get_connection()
+        try:
+            levels = {row['spotify_id'] for row in conn.execute('SELECT spotify_id FROM spotify_songs WHERE level_id > 0')}
+        finally:
+            conn.close()
+        self.assertTrue(self.game_service.daily_songs)
+        self.assertFalse(levels & set(self.game_service.daily_songs))
+
+
+class HydrateCommandTest(unittest.TestCase):
+    def test_reports_hydration_already_running(self):
+        # Como con HYDRATE_ON_STARTUP: la hidratación en segundo plano tiene el lock
+        with hydration_service._lock:
+            result = app.test_cli_runner().invoke(args=['hydrate-songs'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIsInstance(result.exception, SystemExit)  # no un KeyError por los contadores
+        self.assertIn("Ya hay una hidratación en curso", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
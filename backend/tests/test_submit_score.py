@@ -0,0 +1,62 @@
+"""Validación de POST /api/v1/game/submit-score"""
+import unittest
+
+from app import app
+from database.database import db
+
+
+class SubmitScoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.create_user('scorer', 'scorer@example.com', 'secret1', 'scorer-id', 'scorer-secret')
+        cls.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username('scorer'))}"}
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def submit(self, payload: dict):
+        response = self.client.post('/api/v1/game/submit-score', json=payload, headers=self.headers)
+        return response.status_code, response.get_json()
+
+    def total_score(self) -> int:
+        return db.get_user_by_username('scorer').total_score
+
+    def test_rejects_missing_or_invalid_level_id(self):
+        before = self.total_score()
+        for payload in (
+            {'score': 50},
+            {'score': 50, 'level_id': ''},
+            {'score': 50, 'level_id': None},
+            {'score': 50, 'level_id': 'abc'},
+            {'score': 50, 'level_id': '-1'},
+            {'score': 50, 'level_id': '07'},
+            {'score': 50, 'level_id': 1.5},
+            {'score': 50, 'level_id': True},
+            {'score': 50, 'level_id': ['1']},
+        ):
+            status, body = self.submit(payload)
+            self.assertEqual(status, 400, payload)
+            self.assertIn('nivel', body['error'], payload)
+        self.assertEqual(self.total_score(), before)
+
+    def test_rejects_score_out_of_range(self):
+        before = self.total_score()
+        for score in (-1, -1000, 1001, 10**12, True, 'mucho', None, [100]):
+            status, _ = self.submit({'score': score, 'level_id': '11'})
+            self.assertEqual(status, 400, score)
+        self.assertEqual(self.total_score(), before)
+
+    def test_accepts_spotify_local_and_daily_levels(self):
+        before = self.total_score()
+        for level_id, score in ((12, 1000), ('13', 0), ('3_local', 250), ('0', 400)):
+            status, body = self.submit({'score': score, 'level_id': level_id})
+            self.assertEqual(status, 200, (level_id, body))
+        self.assertEqual(self.total_score(), before + 1650)
+
+        # El mismo nivel no puntúa dos veces
+        status, body = self.submit({'score': 100, 'level_id': '12'})
+        self.assertEqual((status, body['error']), (400, "Nivel ya jugado"))
+
+
+if __name__ == '__main__':
+    unittest.main()
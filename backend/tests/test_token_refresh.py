@@ -0,0 +1,132 @@
+"""Renovación de tokens de Spotify contra un endpoint de tokens falso en local"""
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+
+from database.database import db
+from services import spoti_service
+from services.token_refresh_service import TokenRefreshService
+
+
+class FakeTokenHandler(BaseHTTPRequestHandler):
+    """
+    POST /api/token: tarda un poco y devuelve un access token y un refresh token nuevos
+    (o 400 invalid_grant si el refresh token es "revoked")
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        refresh_token = body['refresh_token'][0]
+        with self.server.lock:
+            self.server.calls.append(refresh_token)
+            number = len(self.server.calls)
+        if refresh_token == 'revoked':
+            status, payload = 400, json.dumps({'error': 'invalid_grant'}).encode()
+        else:
+            time.sleep(0.2)  # ventana para que las renovaciones se solapen
+            status, payload = 200, json.dumps({
+                'access_token': f"access-{number}",
+                'refresh_token': f"refresh-{number}",
+                'expires_in': 3600
+            }).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TokenRefreshTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTokenHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        token_url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/token"
+        cls.url_patch = mock.patch.object(spoti_service, 'SPOTIFY_TOKEN_URL', token_url)
+        cls.url_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.url_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.calls = []
+
+    def create_user(self, username: str, refresh_token: str = 'refresh-0') -> None:
+        db.create_user(username, f"{username}@example.com", 'secret1', f"{username}-id", f"{username}-secret")
+        db.save_spotify_tokens(username, 'expired', refresh_token, -10)
+
+    def test_refreshes_once_per_process(self):
+        self.create_user('refresh_threads')
+        service = TokenRefreshService()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(service.get_access_token('refresh_threads')))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.calls), 1)
+        self.assertEqual({result[2] for result in results}, {'access-1'})
+
+    def test_keeps_first_refresh_across_processes(self):
+        # Dos instancias del servicio = dos workers que no comparten locks
+        self.create_user('refresh_workers')
+        workers = [TokenRefreshService(), TokenRefreshService()]
+        results = []
+        threads = [
+            threading.Thread(target=lambda worker=worker: results.append(worker.refresh('refresh_workers')))
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.calls), 2)
+        self.assertTrue(all(success for success, _ in results))
+        self.assertIn("Access token renovado por otro proceso", [message for _, message in results])
+        # Se conserva la primera renovación guardada, no se mezclan tokens de las dos
+        user = db.get_user_by_username('refresh_workers', projection='spotify')
+        number = user.spotify_access_token.rsplit('-', 1)[1]
+        self.assertEqual(user.spotify_refresh_token, f"refresh-{number}")
+
+    def test_skips_refresh_without_refresh_token(self):
+        self.assertTrue(db.create_user('refresh_none', 'refresh_none@example.com', 'secret1', 'none-id', 'none-secret')[0])
+        self.assertFalse(TokenRefreshService().get_access_token('refresh_none')[0])
+        self.assertEqual(self.server.calls, [])
+
+    def test_revoked_refresh_token_backs_off_on_requests(self):
+        self.create_user('refresh_revoked', 'revoked')
+        service = TokenRefreshService(backoff=900)
+        with mock.patch('builtins.print'):
+            for _ in range(5):
+                self.assertFalse(service.get_access_token('refresh_revoked')[0])
+        # Un solo POST a Spotify: el resto de peticiones respetan el backoff
+        self.assertEqual(self.server.calls, ['revoked'])
+        stats = service.get_stats()
+        self.assertEqual((stats['failed'], stats['skipped'], stats['backoff_users']), (1, 4, 1))
+
+        # Pasado el backoff se vuelve a intentar
+        later = time.time() + 901
+        with mock.patch('builtins.print'), mock.patch.object(time, 'time', return_value=later):
+            service.refresh('refresh_revoked')
+        self.assertEqual(self.server.calls, ['revoked', 'revoked'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""save_user solo escribe las columnas modificadas (traza del SQL ejecutado)"""
+import re
+import sqlite3
+import unittest
+from unittest import mock
+
+from database.database import db
+from models.level_progress import LevelProgress
+
+# Columnas que save_user no debe reescribir por cargar o tocar el progreso de un usuario
+PROTECTED_COLUMNS = {
+    'hashed_password', 'created_at', 'spotify_access_token', 'spotify_refresh_token',
+    'spotify_token_expires_at', 'spotify_client_id', 'spotify_client_secret'
+}
+SET_CLAUSE = re.compile(r'^\s*UPDATE users\s+SET (.+?) WHERE', re.IGNORECASE | re.DOTALL)
+
+
+class DirtyTrackingTest(unittest.TestCase):
+    counter = 0
+
+    def setUp(self):
+        DirtyTrackingTest.counter += 1
+        self.username = f"dirty{self.counter}"
+        success, message = db.create_user(
+            self.username, f"{self.username}@example.com", 'secret1', f"{self.username}-id", f"{self.username}-secret"
+        )
+        self.assertTrue(success, message)
+
+        self.statements = []
+        self.traced = set()
+        get_connection = db.get_connection
+
+        def traced_get_connection():
+            conn = get_connection()
+            conn.raw.set_trace_callback(self.statements.append)
+            self.traced.add(conn.raw)
+            return conn
+
+        patch = mock.patch.object(db, 'get_connection', side_effect=traced_get_connection)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(self._stop_tracing)
+
+    def _stop_tracing(self):
+        for raw in self.traced:
+            raw.set_trace_callback(None)
+
+    def updated_columns(self) -> list[set]:
+        """Columnas del SET de cada UPDATE users ejecutado (desde el último statements.clear())"""
+        updates = []
+        previous = None
+        for statement in self.statements:
+            # Cada trigger que ejecuta la sentencia vuelve a notificarla con el mismo texto
+            if statement == previous:
+                continue
+            previous = statement
+            match = SET_CLAUSE.match(statement)
+            if match:
+                updates.append(set(re.findall(r'(\w+)\s*=', match.group(1))))
+        return updates
+
+    def load(self, projection: str = 'progress'):
+        user = db.get_user_by_username(self.username, projection=projection)
+        self.statements.clear()
+        return user
+
+    def test_unchanged_user_issues_no_update(self):
+        for projection in ('progress', 'full'):
+            user = self.load(projection)
+            self.assertTrue(db.save_user(user))
+            self.assertEqual(self.updated_columns(), [])
+
+    def test_score_change_updates_only_total_score(self):
+        user = self.load()
+        user.add_score(50)
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [{'total_score'}])
+        self.assertEqual(db.get_user_by_username(self.username).total_score, 50)
+
+    def test_level_change_updates_only_progress_columns(self):
+        user = self.load()
+        user.complete_level('3')
+        user.mark_level_played('3')
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [{'levels_completed_bits', 'played_levels_bits'}])
+
+        # Repetir un nivel ya guardado no cambia nada
+        user = self.load()
+        user.complete_level('3')
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [])
+
+    def test_protected_columns_never_in_set_list(self):
+        user = self.load('full')
+        user.add_score(10)
+        user.complete_level('5')
+        user.mark_level_played('5')
+        user.complete_daily()
+        self.assertTrue(db.save_user(user))
+
+        updates = self.updated_columns()
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0] & PROTECTED_COLUMNS, set())
+        self.assertEqual(updates[0], {'total_score', 'levels_completed_bits', 'played_levels_bits', 'last_daily_completed'})
+
+    def test_apply_pending_does_not_mark_dirty(self):
+        user = self.load()
+        user.apply_pending(LevelProgress.load('7'), '01-01-2030')
+        self.assertFalse(user.has_changes())
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [])
+
+    def test_lazy_loaded_fields_do_not_mark_dirty(self):
+        user = self.load('identity')
+        # Campos fuera de la proyección: se cargan con una consulta al usarlos
+        self.assertEqual(user.spotify_client_id, f"{self.username}-id")
+        self.assertEqual(user.total_score, 0)
+        self.assertTrue(user.hashed_password)
+        self.assertFalse(user.has_changes())
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [])
+
+        self.statements.clear()
+        user.add_score(5)
+        self.assertTrue(db.save_user(user))
+        self.assertEqual(self.updated_columns(), [{'total_score'}])
+
+    def test_failed_lazy_load_is_retried(self):
+        load = db._load_user_columns
+        error = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(db, '_load_user_columns', side_effect=[error, load(self.username)]):
+            user = self.load('identity')
+            # Un fallo de la BD no se confunde con un atributo inexistente
+            with self.assertRaises(RuntimeError):
+                hasattr(user, 'total_score')
+            self.assertEqual(user.spotify_client_id, f"{self.username}-id")
+        self.assertEqual(user.total_score, 0)
+
+    def test_lazy_load_of_deleted_user_raises(self):
+        with mock.patch.object(db, '_load_user_columns', return_value=None):
+            user = self.load('identity')
+            with self.assertRaises(RuntimeError):
+                getattr(user, 'total_score', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Registro de usuarios: bcrypt fuera de la transacción de escritura"""
+import sqlite3
+import unittest
+from unittest import mock
+
+from database.database import db
+from helpers.password_hasher import password_hasher
+
+
+def new_user(username: str, email: str) -> dict:
+    return {
+        'username': username,
+        'email': email,
+        'password': 'secret1',
+        'spotify_client_id': f"{email}-id",
+        'spotify_client_secret': f"{email}-secret"
+    }
+
+
+class RegistrationTest(unittest.TestCase):
+    def setUp(self):
+        self.write_lock_free = []
+        hash_password = password_hasher.hash_password
+        hash_passwords = password_hasher.hash_passwords
+
+        def probe(fn):
+            def wrapper(*args, **kwargs):
+                self.write_lock_free.append(self._can_write())
+                return fn(*args, **kwargs)
+            return wrapper
+
+        patches = [
+            mock.patch.object(password_hasher, 'hash_password', side_effect=probe(hash_password)),
+            mock.patch.object(password_hasher, 'hash_passwords', side_effect=probe(hash_passwords)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _can_write(self) -> bool:
+        """True si otra conexión puede tomar el lock de escritura sin esperar"""
+        conn = sqlite3.connect(db.pool.database_path, timeout=0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+            return True
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            conn.close()
+
+    def test_bulk_hashes_outside_the_transaction(self):
+        users = [
+            new_user(f"bulk{i}", f"bulk{i}@example.com")
+            for i in range(12)
+        ]
+        created, skipped = db.create_users_bulk(users, chunk_size=5)
+
+        self.assertEqual((created, skipped), (12, 0))
+        self.assertTrue(self.write_lock_free)
+        self.assertTrue(all(self.write_lock_free))
+        self.assertIsNotNone(db.get_user_by_username('bulk11'))
+
+    def test_bulk_skips_existing_users_without_hashing_them(self):
+        db.create_users_bulk([new_user('bulk_old', 'bulk_old@example.com')])
+        password_hasher.hash_passwords.reset_mock()
+        created, skipped = db.create_users_bulk([
+            new_user('bulk_old', 'other@example.com'),
+            new_user('bulk_new', 'bulk_old@example.com'),
+            new_user('bulk_fresh', 'bulk_fresh@example.com'),
+            new_user('bulk_fresh', 'bulk_fresh2@example.com'),
+        ])
+
+        self.assertEqual((created, skipped), (1, 3))
+        password_hasher.hash_passwords.assert_called_once_with(['secret1'])
+
+    def test_create_user_checks_duplicates_before_hashing(self):
+        self.assertTrue(db.create_user('dup_user', 'dup@example.com', 'secret1', 'dup-id', 'dup-secret')[0])
+        self.assertEqual(self.write_lock_free, [True])
+        password_hasher.hash_password.reset_mock()
+
+        self.assertEqual(
+            db.create_user('dup_user', 'other@example.com', 'secret1', 'other-id', 'other-secret'),
+            (False, "El nombre de usuario ya existe")
+        )
+        self.assertEqual(
+            db.create_user('other_user', 'dup@example.com', 'secret1', 'other-id', 'other-secret'),
+            (False, "El email ya está registrado")
+        )
+        self.assertEqual(
+            db.create_user('other_user', 'other@example.com', 'secret1', 'dup-id', 'other-secret'),
+            (False, "Este Client ID de Spotify ya está registrado por otro usuario")
+        )
+        password_hasher.hash_password.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
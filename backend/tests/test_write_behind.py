@@ -0,0 +1,164 @@
+"""Escritura diferida (write-behind) de los niveles jugados y el diario; las puntuaciones se escriben al momento"""
+import sqlite3
+import unittest
+from unittest import mock
+
+from app import app
+from database import write_behind
+from database.database import db, register_sql_functions
+from database.write_behind import WriteBehindQueue
+
+
+class WriteBehindTest(unittest.TestCase):
+    counter = 0
+
+    def setUp(self):
+        WriteBehindTest.counter += 1
+        self.username = f"behind{self.counter}"
+        success, message = db.create_user(
+            self.username, f"{self.username}@example.com", 'secret1', f"{self.username}-id", f"{self.username}-secret"
+        )
+        self.assertTrue(success, message)
+        self.headers = {'Authorization': f"Bearer {db.create_token(db.get_user_by_username(self.username))}"}
+        self.client = app.test_client()
+        # Sin hilo: los lotes se escriben solo al llamar a flush()
+        self.queue = WriteBehindQueue(db._flush_progress, interval_ms=60000)
+        patch = mock.patch.object(db, 'write_behind', self.queue)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(self.queue.flush)
+
+    def stored(self, username: str = None) -> sqlite3.Row:
+        """Fila leída con otra conexión (lo escrito, sin lo pendiente de la cola)"""
+        conn = sqlite3.connect(db.pool.database_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return conn.execute('''
+                SELECT total_score, played_levels_bits, last_daily_completed FROM users WHERE username = ?
+            ''', (username or self.username,)).fetchone()
+        finally:
+            conn.close()
+
+    def stored_played(self, username: str = None) -> set:
+        user = db.get_user_by_username(username or self.username, include_pending=False)
+        return set(user.played_levels.split(',')) - {''}
+
+    def submit(self, level_id: str, score: int):
+        response = self.client.post(
+            '/api/v1/game/submit-score', json={'score': score, 'level_id': level_id}, headers=self.headers
+        )
+        return response.status_code, response.get_json()
+
+    def test_marks_are_coalesced_per_user(self):
+        other = f"{self.username}b"
+        db.create_user(other, f"{other}@example.com", 'secret1', f"{other}-id", f"{other}-secret")
+        for level_id in ('1', '2', '3'):
+            self.assertTrue(db.record_level_played(self.username, level_id))
+        self.assertTrue(db.record_daily_completed(self.username))
+        self.assertTrue(db.record_level_played(other, '4'))
+        self.assertEqual(self.stored_played(), set())
+
+        self.assertEqual(self.queue.flush(), 5)
+        stats = self.queue.get_stats()
+        self.assertEqual((stats['flushes'], stats['rows'], stats['pending_operations']), (1, 2, 0))
+        self.assertEqual(self.stored_played(), {'1', '2', '3'})
+        self.assertEqual(self.stored_played(other), {'4'})
+        self.assertIsNotNone(self.stored()['last_daily_completed'])
+
+    def test_reads_include_pending_marks(self):
+        db.record_level_played(self.username, '8')
+        db.record_daily_completed(self.username)
+
+        user = db.get_user_by_username(self.username)
+        self.assertIn('8', user.played_levels.split(','))
+        self.assertIsNotNone(user.last_daily_completed)
+        self.assertEqual(self.stored_played(), set())
+        self.assertIsNone(self.stored()['last_daily_completed'])
+
+        profile = self.client.get('/api/v1/auth/me', headers=self.headers)
+        self.assertIn('8', profile.get_json()['played_levels'])
+        self.assertIsNone(profile.headers.get('ETag'))  # la fila aún no refleja lo respondido
+
+    def test_scores_are_written_immediately(self):
+        status, body = self.submit('21', 300)
+        self.assertEqual((status, body['total_score']), (200, 300))
+        # Sin esperar al lote: la puntuación ya está en la BD
+        self.assertEqual(self.stored()['total_score'], 300)
+        self.assertEqual(self.queue.get_stats()['pending_operations'], 0)
+
+    def test_score_rejected_when_another_process_recorded_the_level(self):
+        conn = sqlite3.connect(db.pool.database_path)
+        register_sql_functions(conn)
+        try:
+            conn.execute(
+                'UPDATE users SET played_levels_bits = progress_add(played_levels_bits, ?) WHERE username = ?',
+                ('22', self.username)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        status, body = self.submit('22', 300)
+        self.assertEqual((status, body['error']), (400, "Nivel ya jugado"))
+        self.assertEqual(self.stored()['total_score'], 0)
+
+    def test_score_rejected_for_level_played_in_queue(self):
+        db.record_level_played(self.username, '23')
+        status, body = self.submit('23', 300)
+        self.assertEqual((status, body['error']), (400, "Nivel ya jugado"))
+        self.queue.flush()
+        self.assertEqual(self.stored()['total_score'], 0)
+
+    def test_rename_keeps_marks_queued_during_the_rename(self):
+        db.record_level_played(self.username, '31')
+        new_username = f"{self.username}-renamed"
+        update = db._update_user_profile
+
+        def update_with_concurrent_mark(*args):
+            # Otra petición marca un nivel con el nombre antiguo en mitad del renombrado
+            db.record_level_played(self.username, '32')
+            self.assertEqual(self.queue.get_stats()['pending_operations'], 1)
+            return update(*args)
+
+        with mock.patch.object(db, '_update_user_profile', side_effect=update_with_concurrent_mark):
+            success, message = db.update_user_profile(self.username, new_username)
+        self.assertTrue(success, message)
+
+        self.queue.flush()
+        self.assertEqual(self.stored_played(new_username), {'31', '32'})
+        self.assertIsNone(db.get_user_by_username(self.username))
+
+
+class WriteBehindStopTest(unittest.TestCase):
+    def queue_with_failures(self, failures: int) -> tuple[WriteBehindQueue, list]:
+        written = []
+
+        def flush_fn(batch):
+            if len(written) < failures:
+                written.append(None)
+                raise sqlite3.OperationalError('database is locked')
+            written.append(batch)
+
+        queue = WriteBehindQueue(flush_fn, interval_ms=60000)
+        queue.enqueue('someone', lambda pending: pending.played.add('1'))
+        return queue, written
+
+    @mock.patch.object(write_behind.time, 'sleep')
+    def test_stop_retries_the_final_flush(self, _sleep):
+        queue, written = self.queue_with_failures(2)
+        with mock.patch('builtins.print'):
+            self.assertTrue(queue.stop())
+        self.assertEqual(list(written[-1]), ['someone'])
+        self.assertEqual(queue.get_stats()['pending_operations'], 0)
+
+    @mock.patch.object(write_behind.time, 'sleep')
+    def test_stop_reports_lost_changes(self, _sleep):
+        queue, written = self.queue_with_failures(write_behind.STOP_FLUSH_ATTEMPTS)
+        with mock.patch('builtins.print') as printed:
+            self.assertFalse(queue.stop())
+        self.assertEqual(len(written), write_behind.STOP_FLUSH_ATTEMPTS)
+        self.assertIn('someone', printed.call_args.args[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
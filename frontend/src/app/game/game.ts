@@ -202,7 +202,7 @@ export class Game implements OnInit, OnDestroy {
       }
     }
 
-    this.audio = new Audio(audioSource);
+    this.audio = new Audio(this.gameService.resolveAudioUrl(audioSource));
     this.audio.play();
 
     // Parar después de audioSeconds segundos
@@ -421,7 +421,7 @@ export class Game implements OnInit, OnDestroy {
     this.stopAudio();
 
     const audioSource = this.currentSong.audio;
-    this.audio = new Audio(audioSource);
+    this.audio = new Audio(this.gameService.resolveAudioUrl(audioSource));
     this.audio.play();
   }
 
@@ -24,6 +24,11 @@ export class GameService {
     return this.http.get<any>(`${this.apiUrl}/songs/${levelId}`, { headers });
   }
 
+  // URL reproducible del audio de una canción: las rutas relativas (audios locales) son de la API
+  resolveAudioUrl(audio: string): string {
+    return audio.startsWith('/') ? new URL(audio, this.apiUrl).href : audio;
+  }
+
   // Validar respuesta del usuario
   validateAnswer(levelId: string, answer: string): Observable<any> {
     return this.http.post<any>(`${this.apiUrl}/game/validate`, {